@@ -1,70 +1,79 @@
 # Import các thư viện cần thiết
-from langchain.tools.retriever import create_retriever_tool  # Tạo công cụ tìm kiếm
-from langchain_openai import ChatOpenAI  # Model ngôn ngữ OpenAI
-from langchain.agents import AgentExecutor, create_openai_functions_agent  # Tạo và thực thi agent
+# Chỉ import các thư viện nhẹ ở đầu file: SDK của từng nhà cung cấp (OpenAI, Gemini), pymilvus và
+# langchain.agents được import trong hàm khi thực sự dùng, để giao diện khởi động nhanh
+from context_packing import create_context_tool  # Tạo công cụ tìm kiếm (ngữ cảnh giới hạn token)
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder  # Xử lý prompt
-from seed_data import seed_milvus, connect_to_milvus  # Kết nối với Milvus
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler  # Xử lý callback cho Streamlit
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory  # Lưu trữ lịch sử chat
-from langchain.retrievers import EnsembleRetriever  # Kết hợp nhiều retriever
-from langchain_community.retrievers import BM25Retriever  # Retriever dựa trên BM25
+import registry  # Lưu retriever dùng chung trong tiến trình
+import tracing  # Đo thời gian từng bước (span)
+from hybrid_retriever import HybridRetriever  # Vector search + BM25 chạy song song
+from reranker import RERANKER_ENABLED, get_reranker  # Xếp hạng lại bằng cross-encoder
 from langchain_core.documents import Document  # Lớp Document
-import google.generativeai as genai  # Thêm import Gemini
-from langchain_core.language_models import BaseLanguageModel  # Import base class
 from langchain_core.runnables import Runnable # Import Runnable để sử dụng trong Gemini
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables")
-
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
 XAI_API_KEY = os.getenv("XAI_API_KEY")
-if not XAI_API_KEY:
-    raise ValueError("XAI_API_KEY not found in environment variables")
 
-def get_retriever(collection_name: str = "data_test") -> EnsembleRetriever:
+def require_api_key(name: str, value: str) -> str:
+    """
+    Kiểm tra API key của nhà cung cấp được chọn (không kiểm tra lúc import để các model khác vẫn dùng được)
+    """
+    if not value:
+        raise ValueError(f"{name} not found in environment variables")
+    return value
+
+def get_retriever(collection_name: str = "data_test", doc_name: str = None, rerank: bool = None) -> HybridRetriever:
     """
-    Tạo một ensemble retriever kết hợp vector search (Milvus) và BM25
+    Tạo một hybrid retriever kết hợp vector search (Milvus) và BM25
     Args:
         collection_name (str): Tên collection trong Milvus để truy vấn
+        doc_name (str): Chỉ tìm trong chunk của tài liệu này (None để tìm toàn collection)
+        rerank (bool): Lấy 50 ứng viên rồi xếp hạng lại bằng cross-encoder, chỉ giữ 4 chunk tốt nhất
+                       (mặc định theo RERANKER_ENABLED, xem reranker.py)
     """
-    try:
-        # Kết nối với Milvus và tạo vector retriever
-        vectorstore = connect_to_milvus('http://localhost:19530', collection_name)
-        milvus_retriever = vectorstore.as_retriever(
-            search_type="similarity", 
-            search_kwargs={"k": 4}
-        )
+    if rerank is None:
+        rerank = RERANKER_ENABLED
 
-        # Tạo BM25 retriever từ toàn bộ documents
-        documents = [
-            Document(page_content=doc.page_content, metadata=doc.metadata)
-            for doc in vectorstore.similarity_search("", k=100)
-        ]
+    def build():
+        # pymilvus/langchain_milvus chỉ được import khi tạo retriever lần đầu
+        from seed_data import connect_to_milvus, get_bm25_index
+
+        with tracing.span("retriever.init", collection=collection_name) as span:
+            # Kết nối với Milvus
+            vectorstore = connect_to_milvus('http://localhost:19530', collection_name)
+
+            # Tạo BM25 retriever từ chỉ mục đầy đủ đã lưu trên đĩa lúc seed
+            bm25_index = get_bm25_index(vectorstore, collection_name)
         
-        if not documents:
-            raise ValueError(f"Không tìm thấy documents trong collection '{collection_name}'")
+            span.set(chunks=len(bm25_index))
+            if not len(bm25_index):
+                raise ValueError(f"Không tìm thấy documents trong collection '{collection_name}'")
             
-        bm25_retriever = BM25Retriever.from_documents(documents)
-        bm25_retriever.k = 4
+            # Chạy song song vector search và BM25, gộp bằng weighted RRF với tỷ trọng
+            # Khi rerank: 50 ứng viên được cross-encoder chấm điểm, chỉ 4 chunk tốt nhất vào prompt
+            hybrid_retriever = HybridRetriever(
+                vectorstore=vectorstore,
+                bm25_index=bm25_index,
+                k=4 if rerank else 8,  # Tối đa 8 chunk (4 + 4) như EnsembleRetriever trước đây
+                fetch_k=4,
+                weights=[0.7, 0.3],
+                metadata_filter={"doc_name": doc_name} if doc_name else {},
+                reranker=get_reranker() if rerank else None,
+                rerank_candidates=50
+            )
+            return hybrid_retriever
+
+    try:
+        # Retriever được lưu trong registry theo collection, không tạo lại mỗi lần rerun
+        return registry.get_cached("retriever", collection_name, build, "hf", doc_name, rerank)
 
-        # Kết hợp hai retriever với tỷ trọng
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[milvus_retriever, bm25_retriever],
-            weights=[0.7, 0.3]
-        )
-        return ensemble_retriever
-        
     except Exception as e:
         print(f"Lỗi khi khởi tạo retriever: {str(e)}")
+        from langchain_community.retrievers import BM25Retriever
         # Trả về retriever với document mặc định nếu có lỗi
         default_doc = [
             Document(
@@ -76,6 +85,7 @@ def get_retriever(collection_name: str = "data_test") -> EnsembleRetriever:
 
 class GeminiLLM(Runnable):
     def __init__(self, api_key, model_name="gemini-1.5-flash", temperature=0):
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(model_name)
         self.temperature = temperature
@@ -84,36 +94,45 @@ class GeminiLLM(Runnable):
         response = self.model.generate_content(input)
         return response.text
 
-def get_llm_and_agent(_retriever, model_choice="gemini") -> AgentExecutor:
+def get_llm_and_agent(_retriever, model_choice="gemini"):
     """
     Khởi tạo Language Model và Agent với cấu hình cụ thể
     Args:
         _retriever: Retriever đã được cấu hình để tìm kiếm thông tin
         model_choice: Lựa chọn model ("gpt4", "gemini" hoặc "grok")
+    Returns:
+        AgentExecutor: Agent gọi tool find_documents
     """
-    # Khởi tạo ChatOpenAI dựa trên lựa chọn model
+    from langchain.agents import AgentExecutor, create_openai_functions_agent  # Tạo và thực thi agent
+
+    # Khởi tạo LLM dựa trên lựa chọn model (chỉ import SDK của nhà cung cấp được chọn)
     if model_choice == "gpt4":
+        from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             temperature=0,
             streaming=True,
             model='gpt-4',
-            api_key=OPENAI_API_KEY)
+            api_key=require_api_key("OPENAI_API_KEY", OPENAI_API_KEY))
     elif model_choice == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        if not GEMINI_API_KEY:
+            print("Warning: GEMINI_API_KEY not found in environment variables")
         llm = ChatGoogleGenerativeAI(
             model="gemini-2.5-flash",
             google_api_key=GEMINI_API_KEY,
             temperature=0
         )
     else:  # grok
+        from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             temperature=0, 
             streaming=True, 
             model='grok-beta', 
-            api_key=XAI_API_KEY, 
+            api_key=require_api_key("XAI_API_KEY", XAI_API_KEY), 
             base_url='https://api.x.ai/v1')
     
-    # Tạo công cụ tìm kiếm cho agent
-    tool = create_retriever_tool(
+    # Tạo công cụ tìm kiếm cho agent: chỉ gửi các đoạn liên quan, trong giới hạn CONTEXT_MAX_TOKENS
+    tool = create_context_tool(
         _retriever,
         "find_documents",
         "Search for information of Stack AI."
@@ -144,7 +163,3 @@ def get_llm_and_agent(_retriever, model_choice="gemini") -> AgentExecutor:
     # Tạo và trả về agent
     agent = create_openai_functions_agent(llm=llm, tools=tools, prompt=prompt)
     return AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-# Khởi tạo retriever và agent
-retriever = get_retriever()
-agent_executor = get_llm_and_agent(retriever)
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Cache câu trả lời của agent theo câu hỏi (semantic cache)
+Chức năng:
+- Khóa theo collection và model trả lời (câu trả lời của GPT-4 không dùng cho Ollama, v.v.)
+- Tra khớp chính xác theo câu hỏi đã chuẩn hóa, nếu không có thì tìm câu hỏi gần nghĩa nhất
+  bằng embeddings (cosine similarity vượt ngưỡng)
+- Hết hạn theo TTL, giới hạn số bản ghi (xóa bản ghi lâu không dùng nhất - LRU)
+- Xóa toàn bộ câu trả lời của một collection khi collection đó được seed lại
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from typing import Optional
+
+import registry
+import tracing
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để so khớp chính xác: Unicode NFC, chữ thường, gộp khoảng trắng,
+    bỏ dấu câu ở cuối
+    """
+    text = unicodedata.normalize("NFC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.。… ").strip()
+
+
+class AnswerCache:
+    """
+    Kho câu trả lời trong SQLite, tìm gần đúng bằng vector câu hỏi giữ trong bộ nhớ
+    Args:
+        path (str): Đường dẫn file SQLite
+        ttl (float): Thời gian sống của một câu trả lời (giây)
+        max_entries (int): Số bản ghi tối đa
+        threshold (float): Cosine similarity tối thiểu để coi hai câu hỏi là một
+        embeddings: Model embeddings cho câu hỏi, mặc định dùng model HuggingFace trong registry
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, ttl: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 embeddings=None):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+        # (collection, model) -> (chữ ký dữ liệu, mảng id, ma trận vector đã chuẩn hóa)
+        self._vectors = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " collection TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " question_key TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " vector BLOB,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " UNIQUE (collection, model, question_key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_access ON answers(last_access)")
+        self._conn.commit()
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = registry.get_embeddings("hf")
+        return self._embeddings
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _namespace_vectors(self, collection: str, model: str):
+        """
+        Ma trận vector câu hỏi của (collection, model); chỉ đọc lại từ SQLite khi dữ liệu đã đổi
+        (kể cả do tiến trình khác ghi)
+        """
+        signature = self._conn.execute(
+            "SELECT COUNT(*), MAX(id) FROM answers WHERE collection = ? AND model = ?", (collection, model)
+        ).fetchone()
+        cached = self._vectors.get((collection, model))
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        rows = self._conn.execute(
+            "SELECT id, vector FROM answers WHERE collection = ? AND model = ? AND vector IS NOT NULL",
+            (collection, model)
+        ).fetchall()
+        ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+        matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+        self._vectors[(collection, model)] = (signature, ids, matrix)
+        return ids, matrix
+
+    def get(self, collection: str, model: str, question: str) -> Optional[str]:
+        """
+        Tìm câu trả lời đã lưu cho câu hỏi
+        Args:
+            collection (str): Tên collection đang truy vấn
+            model (str): Lựa chọn model trả lời
+            question (str): Câu hỏi của người dùng
+        Returns:
+            str: Câu trả lời đã lưu, None nếu không có
+        """
+        with tracing.span("answer_cache.get", collection=collection) as span:
+            answer = self._get(collection, model, question)
+            span.set(hit=answer is not None)
+            return answer
+
+    def _get(self, collection: str, model: str, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer FROM answers WHERE collection = ? AND model = ? AND question_key = ? AND created > ?",
+                (collection, model, key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                ids, matrix = self._namespace_vectors(collection, model)
+                if matrix is None:
+                    return None
+                query = self._embed(question)
+                if query.shape[0] != matrix.shape[1]:
+                    return None
+                scores = matrix @ query
+                # Xét các câu hỏi gần nhất theo thứ tự, bỏ qua bản ghi đã hết hạn
+                for index in np.argsort(-scores)[:5]:
+                    if scores[index] < self.threshold:
+                        break
+                    row = self._conn.execute(
+                        "SELECT id, answer FROM answers WHERE id = ? AND created > ?",
+                        (int(ids[index]), now - self.ttl)
+                    ).fetchone()
+                    if row is not None:
+                        break
+            if row is None:
+                return None
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (now, row[0]))
+            self._conn.commit()
+            return row[1]
+
+    def put(self, collection: str, model: str, question: str, answer: str) -> None:
+        """
+        Lưu câu trả lời cho câu hỏi rồi xóa bớt bản ghi hết hạn/cũ nếu vượt giới hạn
+        """
+        vector = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (collection, model, question_key, answer, vector, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (collection, model, normalize_question(question), answer, vector.tobytes(), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Xóa bản ghi hết hạn, sau đó xóa các bản ghi truy cập lâu nhất khi vượt max_entries"""
+        self._conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN "
+                "(SELECT id FROM answers ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def invalidate_collection(self, collection: str) -> int:
+        """
+        Xóa mọi câu trả lời của một collection (gọi sau khi collection được seed lại), kể cả câu trả lời
+        tìm trên nhiều collection ('a,b', xem federated_retriever.py) có chứa collection này
+        Returns:
+            int: Số bản ghi đã xóa
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM answers WHERE instr(',' || collection || ',', ?) > 0",
+                (f",{collection},",)
+            ).rowcount
+            self._conn.commit()
+            self._vectors = {key: value for key, value in self._vectors.items() if collection not in key[0].split(",")}
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Trả về AnswerCache dùng chung trong tiến trình
+    """
+    return registry.get_or_create(("answer_cache",), AnswerCache)
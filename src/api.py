@@ -0,0 +1,321 @@
+"""
+HTTP API cho chatbot (không cần giao diện Streamlit)
+Chức năng:
+- POST /retrieve: chỉ tìm kiếm tài liệu (hybrid retriever)
+- POST /answer: câu trả lời đầy đủ của agent
+- POST /answer/stream: stream câu trả lời theo từng token (Server-Sent Events)
+- Handler bất đồng bộ, model/retriever/agent dùng chung qua registry và được khởi tạo trước lúc khởi động
+- Gom các câu hỏi đến đồng thời thành một lần gọi model embeddings (micro-batching)
+- GET /metrics: metrics Prometheus của các span (xem tracing.py)
+- POST /jobs, GET /jobs, GET /jobs/{id}, DELETE /jobs/{id}: gửi, theo dõi và hủy job seed dữ liệu
+  (xem jobs.py; worker chạy trong Streamlit hoặc bằng `python jobs.py`)
+
+Chạy: `uvicorn api:app --host 0.0.0.0 --port 8000` trong thư mục src
+"""
+
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+import registry
+import tracing
+import jobs
+from streaming import astream_agent
+from answer_cache import get_answer_cache
+from federated_retriever import get_federated_retriever, parse_collections
+
+# Tên model trong API -> lựa chọn tương ứng trên giao diện (dùng chung namespace của cache câu trả lời)
+MODEL_CHOICES = {
+    "gpt4": "OpenAI GPT-4",
+    "grok": "OpenAI Grok",
+    "gemini": "Gemini",
+    "ollama": "Ollama (Local)",
+}
+# Các collection được khởi tạo sẵn retriever khi server khởi động, phân tách bằng dấu phẩy
+API_WARMUP_COLLECTIONS = os.getenv("API_WARMUP_COLLECTIONS", "data_test")
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    collection: str = "data_test"
+    k: Optional[int] = None
+
+
+class AnswerRequest(BaseModel):
+    question: str
+    collection: str = "data_test"
+    model: str = "gemini"
+    chat_history: List[dict] = []
+
+
+class JobRequest(BaseModel):
+    kind: str = "file"
+    collection: str = "data_test"
+    params: dict = {}
+
+
+class QueryBatcher:
+    """
+    Gom các câu hỏi đến gần như cùng lúc thành một lần gọi embed_documents
+    Với các model embeddings đối xứng đang dùng (HuggingFace, Ollama, OpenAI),
+    embed_documents([q]) cho cùng vector với embed_query(q)
+    Args:
+        embeddings: Model embeddings
+        max_batch_size (int): Số câu hỏi tối đa trong một batch
+        max_wait_ms (float): Thời gian chờ tối đa để gom thêm câu hỏi
+    """
+
+    def __init__(self, embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.stats = {"queries": 0, "batches": 0}
+        self._pending = []
+        self._flush_handle = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch) -> None:
+        texts = [text for text, _ in batch]
+        self.stats["queries"] += len(texts)
+        self.stats["batches"] += 1
+        try:
+            # Model embeddings là code đồng bộ: chạy trong thread pool, không chặn event loop
+            vectors = await run_in_threadpool(self.embeddings.embed_documents, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+def default_retriever_factory(collection_name: str):
+    """
+    Hybrid retriever của collection (lưu trong registry, xem local_ollama.get_retriever);
+    nhiều collection phân tách bằng dấu phẩy dùng federated retriever (federated_retriever.py)
+    """
+    from local_ollama import get_retriever
+    collection_names = parse_collections(collection_name)
+    if len(collection_names) > 1:
+        return get_federated_retriever(collection_names, get_retriever)
+    return get_retriever(collection_name)
+
+
+def default_agent_factory(retriever, model: str):
+    """Agent theo tên model trong API: 'gpt4', 'grok', 'gemini' hoặc 'ollama'"""
+    if model == "ollama":
+        from local_ollama import get_llm_and_agent
+        return get_llm_and_agent(retriever)
+    from agent import get_llm_and_agent
+    return get_llm_and_agent(retriever, model)
+
+
+def _document_to_dict(doc) -> dict:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def create_app(retriever_factory: Callable = default_retriever_factory,
+               agent_factory: Callable = default_agent_factory,
+               answer_cache_factory: Optional[Callable] = get_answer_cache,
+               warmup_collections: Optional[List[str]] = None) -> FastAPI:
+    """
+    Tạo ứng dụng FastAPI
+    Args:
+        retriever_factory (Callable): collection_name -> retriever (có thể thay bằng bản giả khi test)
+        agent_factory (Callable): (retriever, model) -> agent có ainvoke/astream_events
+        answer_cache_factory (Callable): Trả về AnswerCache; None để tắt cache câu trả lời
+        warmup_collections (list): Collection khởi tạo sẵn khi khởi động, mặc định lấy từ API_WARMUP_COLLECTIONS
+    Returns:
+        FastAPI: Ứng dụng
+    """
+    if warmup_collections is None:
+        warmup_collections = [name.strip() for name in API_WARMUP_COLLECTIONS.split(",") if name.strip()]
+    batchers = {}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Load model embeddings và kết nối Milvus trước khi nhận request đầu tiên
+        for collection_name in warmup_collections:
+            try:
+                await run_in_threadpool(retriever_factory, collection_name)
+                print(f"Đã khởi tạo retriever cho collection '{collection_name}'")
+            except Exception as e:
+                print(f"Không khởi tạo được retriever cho '{collection_name}': {str(e)}")
+        refresher = asyncio.create_task(refresh_seeded_collections())
+        yield
+        refresher.cancel()
+
+    async def refresh_seeded_collections(interval: float = 5.0):
+        # Job seed chạy ở worker process: xóa retriever/agent đã lưu của collection vừa seed xong
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                recent = await run_in_threadpool(jobs.get_job_store().list_jobs, 20)
+                for collection_name in jobs.refresh_finished(recent):
+                    print(f"Collection '{collection_name}' đã được seed lại, khởi tạo lại retriever")
+            except Exception as e:
+                print(f"Không đọc được hàng đợi job: {str(e)}")
+
+    app = FastAPI(title="RAG Chatbot API", lifespan=lifespan)
+
+    async def get_retriever(collection_name: str):
+        return await run_in_threadpool(retriever_factory, collection_name)
+
+    def check_model(model: str) -> None:
+        if model not in MODEL_CHOICES:
+            raise HTTPException(status_code=400, detail=f"Model không hợp lệ: '{model}'")
+
+    async def get_agent(collection_name: str, model: str):
+        retriever = await get_retriever(collection_name)
+        # Khóa gồm cả retriever (như main.py): agent dựng trên retriever dự phòng khi Milvus lỗi
+        # không được dùng lại sau khi kết nối được và retriever thật đã được tạo
+        return await run_in_threadpool(
+            registry.get_cached, "agent", collection_name, lambda: agent_factory(retriever, model), model, id(retriever)
+        )
+
+    def get_batcher(embeddings) -> QueryBatcher:
+        batcher = batchers.get(id(embeddings))
+        if batcher is None:
+            batcher = batchers[id(embeddings)] = QueryBatcher(embeddings)
+        return batcher
+
+    def get_cached_answer(request: AnswerRequest) -> Optional[str]:
+        if answer_cache_factory is None or request.chat_history:
+            return None
+        return answer_cache_factory().get(request.collection, MODEL_CHOICES[request.model], request.question)
+
+    def put_cached_answer(request: AnswerRequest, answer: str) -> None:
+        if answer_cache_factory is not None and not request.chat_history:
+            answer_cache_factory().put(request.collection, MODEL_CHOICES[request.model], request.question, answer)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "batching": {str(key): batcher.stats for key, batcher in batchers.items()}}
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/retrieve")
+    async def retrieve(request: RetrieveRequest):
+        with tracing.span("api.retrieve", collection=request.collection) as span:
+            retriever = await get_retriever(request.collection)
+            search = getattr(retriever, "search_with_timings", None)
+            embeddings = getattr(getattr(retriever, "vectorstore", None), "embeddings", None)
+            if search is not None and embeddings is not None:
+                with tracing.span("api.embed_batch"):
+                    embedding = await get_batcher(embeddings).embed(request.query)
+                documents, timings = await run_in_threadpool(search, request.query, embedding)
+            elif search is not None:
+                # Federated retriever tự embed một lần cho mỗi model embeddings của các collection
+                documents, timings = await run_in_threadpool(search, request.query)
+            else:
+                documents, timings = await retriever.ainvoke(request.query), {}
+            if request.k is not None:
+                documents = documents[:request.k]
+            span.set(chunks=len(documents))
+        return {"documents": [_document_to_dict(doc) for doc in documents], "timings": timings}
+
+    @app.post("/answer")
+    async def answer(request: AnswerRequest):
+        check_model(request.model)
+        with tracing.span("api.answer", collection=request.collection, model=request.model) as span:
+            cached = await run_in_threadpool(get_cached_answer, request)
+            span.set(cached=cached is not None)
+            if cached is not None:
+                return {"answer": cached, "cached": True}
+            agent = await get_agent(request.collection, request.model)
+            result = await agent.ainvoke({"input": request.question, "chat_history": request.chat_history})
+            output = result["output"]
+            await run_in_threadpool(put_cached_answer, request, output)
+        return {"answer": output, "cached": False}
+
+    @app.post("/answer/stream")
+    async def answer_stream(request: AnswerRequest):
+        check_model(request.model)
+        cached = await run_in_threadpool(get_cached_answer, request)
+        agent = await get_agent(request.collection, request.model) if cached is None else None
+
+        async def events():
+            if cached is not None:
+                yield _sse("done", {"answer": cached, "cached": True})
+                return
+            try:
+                async for event in astream_agent(agent, {"input": request.question, "chat_history": request.chat_history}):
+                    if event.kind == "token":
+                        yield _sse("token", {"text": event.text})
+                    elif event.kind in ("tool_start", "tool_end"):
+                        yield _sse(event.kind, {"name": event.name, "elapsed_s": event.elapsed_s})
+                    elif event.kind == "done":
+                        await run_in_threadpool(put_cached_answer, request, event.text)
+                        yield _sse("done", {"answer": event.text, "cached": False, **event.timings})
+            except Exception as e:
+                yield _sse("error", {"detail": str(e)})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/jobs")
+    async def submit_job(request: JobRequest):
+        try:
+            job_id = await run_in_threadpool(jobs.get_job_store().submit, request.kind, request.collection, **request.params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"id": job_id}
+
+    @app.get("/jobs")
+    async def list_jobs(limit: int = 20, active_only: bool = False):
+        recent = await run_in_threadpool(jobs.get_job_store().list_jobs, limit, active_only)
+        return {"jobs": [job.to_dict() for job in recent]}
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = await run_in_threadpool(jobs.get_job_store().get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Không có job '{job_id}'")
+        return job.to_dict()
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        if not await run_in_threadpool(jobs.get_job_store().cancel, job_id):
+            raise HTTPException(status_code=404, detail=f"Không có job '{job_id}' đang chờ hoặc đang chạy")
+        return {"id": job_id, "cancel_requested": True}
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,3 @@
+"""
+Các bộ đo hiệu năng (benchmark) của project, chạy từ thư mục src: `python -m benchmarks.<tên>`
+"""
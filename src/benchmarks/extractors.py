@@ -0,0 +1,294 @@
+"""
+Benchmark thông lượng và chất lượng của các extractor nội dung HTML (extractors.py)
+Chức năng:
+- Đọc các trang HTML đã lưu: thư mục file .html (mặc định .cache/benchmarks/html) hoặc cache HTTP
+  của crawler (các file .body trong .cache/http)
+- Chưa có fixture thì sinh từ các corpus trong src/data: mỗi bản ghi được bọc trong khung trang thật
+  (head, script, style, header + menu, thanh bên, footer) và lưu kèm đáp án (<tên>.json)
+- Với mỗi extractor: số trang/giây và MB/giây khi chạy trong một tiến trình, độ trễ p50/p95 mỗi trang,
+  số trang/giây trên process pool với từng số worker (không tính thời gian khởi động worker)
+- Với trang có đáp án: tỉ lệ đoạn nội dung giữ lại được (content_recall) và tỉ lệ dòng của kết quả
+  là menu/header/footer (noise)
+- Ghi kết quả ra file JSON, so sánh với kết quả cũ (--baseline) để phát hiện chậm đi
+
+Chạy trong thư mục src:
+    python -m benchmarks.extractors --output benchmarks/results/extractors.json
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_io import iter_corpus
+from crawler import HTTP_CACHE_DIR, _decode
+from extractors import EXTRACTORS, ExtractorPool, resolve_extractor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "data")
+# Fixture sinh ra nằm trong .cache (không lẫn vào mã nguồn), như cache HTTP của crawler
+FIXTURES_DIR = os.path.join(".cache", "benchmarks", "html")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "extractors.json")
+
+# Khung trang của fixture sinh từ corpus: các dòng này là boilerplate, không thuộc nội dung chính
+_NAV_ITEMS = ["Trang chủ", "Tài liệu", "Hướng dẫn", "API", "Bảng giá", "Blog", "Cộng đồng", "Liên hệ",
+              "Đăng nhập", "Đăng ký", "Tiếng Việt", "English"]
+_SIDEBAR_ITEMS = [f"Bài viết liên quan số {i}" for i in range(1, 16)]
+_FOOTER_LINES = ["© 2024 Công ty ví dụ. Bảo lưu mọi quyền.", "Điều khoản sử dụng", "Chính sách bảo mật",
+                 "Địa chỉ: 123 Đường ví dụ, Hà Nội"]
+_SCRIPT = "window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);} " * 20
+_STYLE = "body{margin:0;font-family:sans-serif} .nav a{padding:4px 8px} .sidebar{width:240px} " * 20
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def build_fixture(title: str, paragraphs: List[str], language: str = "vi") -> str:
+    """Một trang HTML gồm khung trang (boilerplate) bọc quanh các đoạn nội dung"""
+    nav = "".join(f'<li><a href="/{i}">{_escape(item)}</a></li>' for i, item in enumerate(_NAV_ITEMS))
+    sidebar = "".join(f'<li><a href="/related/{i}">{_escape(item)}</a></li>' for i, item in enumerate(_SIDEBAR_ITEMS))
+    footer = "".join(f"<p>{_escape(line)}</p>" for line in _FOOTER_LINES)
+    body = "".join(f"<p>{_escape(paragraph)}</p>" for paragraph in paragraphs)
+    return (
+        f'<!DOCTYPE html><html lang="{language}"><head><meta charset="utf-8"><title>{_escape(title)}</title>'
+        f'<meta name="description" content="{_escape(title)}"><style>{_STYLE}</style><script>{_SCRIPT}</script></head>'
+        f'<body><header><div class="logo">Công ty ví dụ</div><nav class="nav"><ul>{nav}</ul></nav></header>'
+        f'<div class="container"><aside class="sidebar"><h3>Xem thêm</h3><ul>{sidebar}</ul></aside>'
+        f'<main><article><h1>{_escape(title)}</h1>{body}</article></main></div>'
+        f'<footer>{footer}</footer><script>{_SCRIPT}</script><noscript>Bật JavaScript để xem trang</noscript>'
+        f'</body></html>'
+    )
+
+
+def generate_fixtures(directory: str, limit: int) -> int:
+    """
+    Sinh fixture từ các corpus trong src/data và lưu vào directory
+    Returns:
+        int: Số trang đã sinh
+    """
+    os.makedirs(directory, exist_ok=True)
+    boilerplate = _NAV_ITEMS + _SIDEBAR_ITEMS + _FOOTER_LINES + ["Công ty ví dụ", "Xem thêm", "Bật JavaScript để xem trang"]
+    count = 0
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "*.json"))):
+        for record in iter_corpus(path):
+            if count >= limit:
+                return count
+            content = (record.get("page_content") or "").strip()
+            paragraphs = [line.strip() for line in content.splitlines() if len(line.strip()) >= 40]
+            if not paragraphs:
+                continue
+            title = (record.get("metadata") or {}).get("title") or paragraphs[0][:80]
+            name = f"page_{count:05d}"
+            with open(os.path.join(directory, name + ".html"), "w", encoding="utf-8") as file:
+                file.write(build_fixture(title, paragraphs))
+            with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as file:
+                json.dump({"content": paragraphs, "boilerplate": boilerplate}, file, ensure_ascii=False)
+            count += 1
+    return count
+
+
+def load_pages(directory: str) -> List[dict]:
+    """
+    Đọc các trang đã lưu: file .html (kèm đáp án .json nếu có) hoặc cache HTTP của crawler (.body + .json)
+    Returns:
+        list: [{'name', 'html', 'truth'}]
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        truth_path = path[:-len(".html")] + ".json"
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            html = file.read()
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, "r", encoding="utf-8") as file:
+                truth = json.load(file)
+        pages.append({"name": os.path.basename(path), "html": html, "truth": truth})
+    for path in sorted(glob.glob(os.path.join(directory, "*.body"))):
+        meta_path = path[:-len(".body")] + ".json"
+        content_type = ""
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as file:
+                content_type = json.load(file).get("content_type", "")
+        if content_type and "html" not in content_type:
+            continue
+        with open(path, "rb") as file:
+            pages.append({"name": os.path.basename(path), "html": _decode(file.read(), content_type), "truth": None})
+    return pages
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def quality(text: str, truth: dict) -> Dict[str, float]:
+    """content_recall: tỉ lệ đoạn nội dung có trong kết quả; noise: tỉ lệ dòng kết quả là boilerplate"""
+    normalized = _normalize(text)
+    recall = float(np.mean([_normalize(paragraph) in normalized for paragraph in truth["content"]]))
+    boilerplate = {_normalize(line) for line in truth["boilerplate"]}
+    lines = [_normalize(line) for line in text.splitlines() if line.strip()]
+    noise = sum(line in boilerplate for line in lines) / len(lines) if lines else 0.0
+    return {"content_recall": recall, "noise": noise}
+
+
+def measure_inline(name: str, pages: List[dict], repeat: int) -> dict:
+    """Trích xuất tuần tự trong tiến trình hiện tại"""
+    pool = ExtractorPool(name, workers=0)
+    pool.extract(pages[0]["html"])
+    timings = []
+    outputs = []
+    start = time.perf_counter()
+    for round_index in range(repeat):
+        for page in pages:
+            page_start = time.perf_counter()
+            text, _ = pool.extract(page["html"])
+            timings.append((time.perf_counter() - page_start) * 1000)
+            if round_index == 0:
+                outputs.append(text)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(len(page["html"].encode("utf-8")) for page in pages) * repeat
+    result = {
+        "pages_per_s": len(pages) * repeat / elapsed,
+        "mb_per_s": total_bytes / elapsed / 2 ** 20,
+        "latency_ms": {"p50": float(np.percentile(timings, 50)), "p95": float(np.percentile(timings, 95))},
+        "output_chars": float(np.mean([len(text) for text in outputs])),
+    }
+    scored = [quality(text, page["truth"]) for text, page in zip(outputs, pages) if page["truth"]]
+    if scored:
+        result["content_recall"] = float(np.mean([item["content_recall"] for item in scored]))
+        result["noise"] = float(np.mean([item["noise"] for item in scored]))
+    return result
+
+
+def measure_pool(name: str, pages: List[dict], workers: int, repeat: int) -> dict:
+    """Trích xuất trên process pool (worker đã khởi động trước khi đo)"""
+    pool = ExtractorPool(name, workers=workers)
+    try:
+        start = time.perf_counter()
+        list(pool.map(pages[:workers], html_of=lambda page: page["html"]))
+        startup_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _ in pool.map(pages, html_of=lambda page: page["html"]):
+                pass
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    return {"workers": workers, "pages_per_s": len(pages) * repeat / elapsed, "startup_s": startup_s}
+
+
+def run(pages: List[dict], extractor_names: List[str], workers_list: List[int], repeat: int) -> dict:
+    results = {}
+    for name in extractor_names:
+        resolved = resolve_extractor(name)
+        if resolved != name:
+            print(f"Bỏ qua '{name}' (chưa cài thư viện cần thiết)")
+            continue
+        result = measure_inline(name, pages, repeat)
+        result["pool"] = [measure_pool(name, pages, workers, repeat) for workers in workers_list if workers > 0]
+        results[name] = result
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pages": len(pages),
+        "html_mb": sum(len(page["html"].encode("utf-8")) for page in pages) / 2 ** 20,
+        "repeat": repeat,
+    }
+    return {"meta": meta, "results": results}
+
+
+def print_report(report: dict) -> None:
+    header = ["extractor", "pages/s", "MB/s", "p50 ms", "p95 ms", "recall", "noise", "pool pages/s"]
+    rows = []
+    for name, result in report["results"].items():
+        pool = ", ".join(f"{item['workers']}w {item['pages_per_s']:.0f}" for item in result["pool"]) or "-"
+        rows.append([
+            name, f"{result['pages_per_s']:.1f}", f"{result['mb_per_s']:.2f}",
+            f"{result['latency_ms']['p50']:.2f}", f"{result['latency_ms']['p95']:.2f}",
+            f"{result['content_recall']:.3f}" if "content_recall" in result else "-",
+            f"{result['noise']:.3f}" if "noise" in result else "-", pool,
+        ])
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def compare(report: dict, baseline: dict, tolerance: float, quality_tolerance: float) -> List[str]:
+    """
+    So sánh với kết quả cũ
+    Returns:
+        list: Mô tả các extractor bị chậm đi quá tolerance (tỉ lệ) hoặc giảm chất lượng
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        if result["pages_per_s"] < old["pages_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: {old['pages_per_s']:.1f} -> {result['pages_per_s']:.1f} trang/giây")
+        if "content_recall" in result and "content_recall" in old and result["content_recall"] < old["content_recall"] - quality_tolerance:
+            regressions.append(f"{name}: content_recall {old['content_recall']:.3f} -> {result['content_recall']:.3f}")
+        if "noise" in result and "noise" in old and result["noise"] > old["noise"] + quality_tolerance:
+            regressions.append(f"{name}: noise {old['noise']:.3f} -> {result['noise']:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark số trang/giây và chất lượng của các extractor HTML")
+    parser.add_argument("--html-dir", default=FIXTURES_DIR,
+                        help=f"Thư mục trang HTML (.html) hoặc cache HTTP của crawler (.body, ví dụ {HTTP_CACHE_DIR})")
+    parser.add_argument("--generate", type=int, default=300, help="Số fixture sinh từ src/data khi thư mục chưa có trang nào")
+    parser.add_argument("--extractors", default=",".join(EXTRACTORS), help="Các extractor cần đo, phân tách bằng dấu phẩy")
+    parser.add_argument("--workers", default="2,4", help="Các số worker process cần đo")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần trích xuất toàn bộ trang")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON kết quả")
+    parser.add_argument("--baseline", help="File JSON kết quả cũ để so sánh; thoát với mã 1 nếu chậm đi/giảm chất lượng")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Mức giảm số trang/giây cho phép khi so sánh (tỉ lệ)")
+    parser.add_argument("--quality-tolerance", type=float, default=0.02, help="Mức thay đổi recall/noise cho phép")
+    args = parser.parse_args()
+
+    names = [name for name in args.extractors.split(",") if name]
+    for name in names:
+        if name not in EXTRACTORS:
+            parser.error(f"Extractor không hợp lệ: '{name}'")
+    pages = load_pages(args.html_dir) if os.path.isdir(args.html_dir) else []
+    if not pages and args.html_dir == FIXTURES_DIR:
+        print(f"Đã sinh {generate_fixtures(FIXTURES_DIR, args.generate)} fixture vào {FIXTURES_DIR}")
+        pages = load_pages(FIXTURES_DIR)
+    if not pages:
+        parser.error(f"Không có trang HTML nào trong {args.html_dir}")
+
+    report = run(pages, names, [int(value) for value in args.workers.split(",") if value], args.repeat)
+    print_report(report)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance, args.quality_tolerance)
+        for line in regressions:
+            print(f"Chậm đi: {line}")
+        if regressions:
+            sys.exit(1)
+        print("Không có extractor nào chậm đi so với baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark lượng tử hóa vector của LocalVectorStore: recall so với bộ nhớ và độ trễ
+Chức năng:
+- Embed các corpus có sẵn trong src/data một lần, dựng vector store với từng cấu hình lượng tử hóa
+  (none, float16, int8, binary, có thể cắt chiều kiểu Matryoshka và đổi hệ số chấm lại)
+- Đo recall@k trên bộ câu hỏi có nhãn (benchmarks/queries.json), overlap@k với kết quả tìm
+  chính xác float32 (trên câu hỏi có nhãn và các câu hỏi lấy từ đầu chunk), bộ nhớ RAM của
+  chỉ mục, dung lượng trên đĩa, thời gian mở collection và độ trễ tìm kiếm p50/p95
+- --replicate nhân bản vector (cộng nhiễu nhỏ) để đo trên collection lớn hơn corpus có sẵn
+- Ghi kết quả ra file JSON, so sánh với kết quả cũ (--baseline) để phát hiện giảm chất lượng
+
+Chạy trong thư mục src:
+    python -m benchmarks.quantization --embeddings hf --output benchmarks/results/quantization.json
+Cấu hình: <kiểu>[@<số chiều>][x<hệ số chấm lại>], ví dụ int8, binary@256x20
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_vectorstore import QUANTIZATIONS, LocalVectorStore
+from benchmarks.retrieval import (
+    QUERIES_PATH, BENCHMARK_DIR, get_benchmark_embeddings, is_relevant, load_documents, parse_chunking, percentiles
+)
+
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "quantization.json")
+DEFAULT_CONFIGS = ["none", "float16", "int8", "binary", "int8@128", "binary@128x20"]
+_CONFIG_RE = re.compile(r"^(\w+)(?:@(\d+))?(?:x(\d+))?$")
+
+
+def parse_config(spec: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    'binary@256x20' -> ('binary', 256, 20)
+    """
+    match = _CONFIG_RE.match(spec)
+    if not match or match.group(1) not in QUANTIZATIONS:
+        raise ValueError(f"Cấu hình không hợp lệ: '{spec}'")
+    quantization, dimensions, rescore_factor = match.groups()
+    return quantization, int(dimensions) if dimensions else None, int(rescore_factor) if rescore_factor else None
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def build_store(directory: str, embeddings, texts: List[str], vectors: np.ndarray, metadatas: List[dict], ids: List[str],
+                spec: str) -> Tuple[LocalVectorStore, float]:
+    """
+    Ghi collection với cấu hình spec rồi mở lại (như khi khởi động ứng dụng)
+    Returns:
+        tuple: (vector store đã mở lại, thời gian mở (giây))
+    """
+    quantization, dimensions, rescore_factor = parse_config(spec)
+    name = re.sub(r"\W", "_", spec)
+    store = LocalVectorStore(embedding_function=embeddings, collection_name=name, directory=directory, drop_old=True,
+                             metric="COSINE", quantization=quantization, dimensions=dimensions)
+    for start in range(0, len(texts), 10000):
+        store.add_embeddings(texts[start:start + 10000], vectors[start:start + 10000].tolist(),
+                             metadatas=metadatas[start:start + 10000], ids=ids[start:start + 10000])
+    del store
+    start = time.perf_counter()
+    store = LocalVectorStore(embedding_function=embeddings, collection_name=name, directory=directory,
+                             rescore_factor=rescore_factor)
+    return store, time.perf_counter() - start
+
+
+def evaluate(store: LocalVectorStore, query_vectors: np.ndarray, labelled: List[dict], exact: List[List[str]],
+             ks: List[int], repeat: int) -> dict:
+    """
+    recall@k trên câu hỏi có nhãn (labelled ứng với các hàng đầu của query_vectors), overlap@k với
+    kết quả chính xác và phân vị độ trễ tìm kiếm (không gồm thời gian embed câu hỏi)
+    """
+    max_k = max(ks)
+    store.similarity_search_with_score_by_vector(query_vectors[0], k=max_k)
+    timings = []
+    results = []
+    for vector in query_vectors:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            docs = [doc for doc, _ in store.similarity_search_with_score_by_vector(vector, k=max_k)]
+            timings.append((time.perf_counter() - start) * 1000)
+        results.append(docs)
+    recall = {}
+    overlap = {}
+    for k in ks:
+        recall[f"@{k}"] = float(np.mean([any(is_relevant(doc, query) for doc in docs[:k]) for query, docs in zip(labelled, results)]))
+        overlap[f"@{k}"] = float(np.mean([
+            len({doc.metadata["pk"] for doc in docs[:k]} & set(truth[:k])) / max(len(truth[:k]), 1)
+            for docs, truth in zip(results, exact)
+        ]))
+    return {"recall": recall, "overlap": overlap, "latency_ms": percentiles(timings)}
+
+
+def run(embedding_name: str, chunking: str, configs: List[str], ks: List[int], repeat: int, sample_queries: int,
+        replicate: int, queries_path: str = QUERIES_PATH) -> dict:
+    """
+    Chạy toàn bộ benchmark
+    Returns:
+        dict: {'meta': {...}, 'results': [{'config', 'metrics', 'memory', ...}, ...]}
+    """
+    with open(queries_path, "r", encoding="utf-8") as file:
+        labelled = json.load(file)
+    files = sorted({query["corpus"] for query in labelled})
+    documents = load_documents(files, parse_chunking(chunking))
+    embeddings = get_benchmark_embeddings(embedding_name)
+
+    texts = [doc.page_content for doc in documents]
+    metadatas = [{key: value for key, value in doc.metadata.items() if key != "pk"} for doc in documents]
+    ids = [doc.metadata["pk"] for doc in documents]
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    print(f"[{embedding_name} | {chunking}] {len(documents)} chunk, embed {time.perf_counter() - start:.2f}s")
+
+    # Nhân bản có nhiễu: các bản sao có ID riêng, cùng nội dung và metadata (vẫn được tính là liên quan)
+    if replicate > 1:
+        noise = np.random.default_rng(0).normal(scale=0.05 * float(vectors.std()), size=(replicate - 1,) + vectors.shape)
+        vectors = np.concatenate([vectors] + [vectors + copy.astype(np.float32) for copy in noise])
+        metadatas = metadatas * replicate
+        ids = ids + [f"{doc_id}#{i}" for i in range(1, replicate) for doc_id in ids]
+        texts = texts * replicate
+
+    # Câu hỏi: các câu hỏi có nhãn rồi tới phần mở đầu của các chunk ngẫu nhiên (chỉ dùng cho overlap@k)
+    rng = np.random.default_rng(1)
+    sampled = rng.choice(len(documents), min(sample_queries, len(documents)), replace=False)
+    query_texts = [query["query"] for query in labelled] + [documents[i].page_content[:300] for i in sampled]
+    query_vectors = np.asarray([embeddings.embed_query(text) for text in query_texts], dtype=np.float32)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        exact_store, _ = build_store(directory, embeddings, texts, vectors, metadatas, ids, "none")
+        exact = [[doc.metadata["pk"] for doc, _ in exact_store.similarity_search_with_score_by_vector(vector, k=max(ks))]
+                 for vector in query_vectors]
+        del exact_store
+        for spec in configs:
+            store, load_s = build_store(directory, embeddings, texts, vectors, metadatas, ids, spec)
+            metrics = evaluate(store, query_vectors, labelled, exact, ks, repeat)
+            memory = store.memory_bytes()
+            results.append({
+                "id": f"{embedding_name}|{chunking}|{spec}" + (f"|x{replicate}" if replicate > 1 else ""),
+                "config": {"embeddings": embedding_name, "chunking": chunking, "quantization": store.quantization,
+                           "dimensions": store.scan_dim, "rescore_factor": store.rescore_factor if store.two_phase else None},
+                "vectors": len(store),
+                "dim": store.dim,
+                "metrics": {"recall": metrics["recall"], "overlap": metrics["overlap"]},
+                "latency_ms": metrics["latency_ms"],
+                "memory": {"index_bytes": memory, "bytes_per_vector": memory / len(store),
+                           "disk_bytes": directory_bytes(store.path), "load_s": load_s},
+            })
+            del store
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "queries": len(labelled),
+        "overlap_queries": len(query_texts),
+        "corpora": files,
+        "k": ks,
+        "repeat": repeat,
+        "replicate": replicate,
+    }
+    return {"meta": meta, "results": results}
+
+
+def print_table(report: dict) -> None:
+    ks = report["meta"]["k"]
+    header = ["config"] + [f"R@{k}" for k in ks] + [f"O@{k}" for k in ks] + ["p50 ms", "p95 ms", "B/vector", "index MB", "load s"]
+    rows = []
+    for result in report["results"]:
+        metrics, memory = result["metrics"], result["memory"]
+        rows.append(
+            [result["id"]]
+            + [f"{metrics['recall'][f'@{k}']:.3f}" for k in ks]
+            + [f"{metrics['overlap'][f'@{k}']:.3f}" for k in ks]
+            + [f"{result['latency_ms']['p50']:.3f}", f"{result['latency_ms']['p95']:.3f}",
+               f"{memory['bytes_per_vector']:.0f}", f"{memory['index_bytes'] / 2 ** 20:.2f}", f"{memory['load_s']:.2f}"]
+        )
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    So sánh recall/overlap với kết quả cũ theo id cấu hình
+    Returns:
+        list: Mô tả các chỉ số bị giảm quá tolerance
+    """
+    old_results = {result["id"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        old = old_results.get(result["id"])
+        if old is None:
+            continue
+        for metric in ("recall", "overlap"):
+            for k, value in result["metrics"][metric].items():
+                old_value = old["metrics"].get(metric, {}).get(k)
+                if old_value is not None and value < old_value - tolerance:
+                    regressions.append(f"{result['id']}: {metric}{k} {old_value:.3f} -> {value:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall/bộ nhớ/độ trễ của các kiểu lượng tử hóa vector")
+    parser.add_argument("--embeddings", default="hf", help="Model embeddings: hf, ollama, openai, hf:<model>, hashing")
+    parser.add_argument("--chunking", default="1000:100", help="Cách chia chunk: raw hoặc <chunk_size>:<chunk_overlap>")
+    parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS), help="Các cấu hình <kiểu>[@<số chiều>][x<hệ số chấm lại>]")
+    parser.add_argument("--k", default="1,5,10", help="Các giá trị k cho recall@k và overlap@k")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi câu hỏi khi đo độ trễ")
+    parser.add_argument("--sample-queries", type=int, default=200, help="Số câu hỏi lấy từ đầu chunk để đo overlap@k")
+    parser.add_argument("--replicate", type=int, default=1, help="Nhân bản vector (có nhiễu) để đo trên collection lớn hơn")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="File câu hỏi có nhãn")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON kết quả")
+    parser.add_argument("--baseline", help="File JSON kết quả cũ để so sánh; thoát với mã 1 nếu có chỉ số giảm")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Mức giảm recall/overlap cho phép khi so sánh")
+    args = parser.parse_args()
+
+    configs = [spec for spec in args.configs.split(",") if spec]
+    for spec in configs:
+        try:
+            parse_config(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    report = run(args.embeddings, args.chunking, configs, sorted(int(k) for k in args.k.split(",")), args.repeat,
+                 args.sample_queries, args.replicate, args.queries)
+    print_table(report)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"Giảm chất lượng: {line}")
+        if regressions:
+            sys.exit(1)
+        print("Không có chỉ số nào giảm so với baseline")
+
+
+if __name__ == "__main__":
+    main()
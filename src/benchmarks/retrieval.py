@@ -0,0 +1,385 @@
+"""
+Benchmark chất lượng và độ trễ tìm kiếm trên các corpus có sẵn trong src/data
+Chức năng:
+- Đọc bộ câu hỏi có nhãn (benchmarks/queries.json): mỗi câu hỏi gắn với một corpus và các đoạn
+  văn bản trả lời; chunk được coi là liên quan nếu thuộc corpus đó và chứa một trong các đoạn
+  (nhãn không phụ thuộc cách chia chunk)
+- Với mỗi cấu hình (model embeddings x cách chia chunk x loại retriever), đo recall@k, MRR,
+  độ trễ p50/p95/p99 của từng giai đoạn (embed, dense, bm25, fusion, rerank, total),
+  thời gian build index và bộ nhớ của index
+- Ghi kết quả ra file JSON, so sánh với kết quả cũ (--baseline) để phát hiện giảm chất lượng
+
+Chạy trong thư mục src:
+    python -m benchmarks.retrieval --embeddings hf --chunking raw,1000:100 --output benchmarks/results/retrieval.json
+Không có mạng/model HuggingFace: `--embeddings hashing` (vector băm từ khóa, chỉ làm mốc so sánh)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registry
+from bm25_index import BM25Index, tokenize
+from corpus_io import iter_corpus
+from hybrid_retriever import HybridRetriever
+from local_vectorstore import LocalVectorStore
+from reranker import get_reranker
+from seed_data import document_id, normalize_metadata
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "data")
+QUERIES_PATH = os.path.join(BENCHMARK_DIR, "queries.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "retrieval.json")
+
+# Loại retriever -> trọng số [vector, bm25] của HybridRetriever (None: chỉ chạy một nhánh)
+# Hậu tố '-rerank': lấy 50 ứng viên rồi xếp hạng lại bằng cross-encoder (reranker.py)
+RETRIEVERS = {
+    "dense": None,
+    "bm25": None,
+    "hybrid-0.7": [0.7, 0.3],
+    "hybrid-0.5": [0.5, 0.5],
+    "hybrid-0.7-rerank": [0.7, 0.3],
+}
+# Mặc định không chạy rerank vì cần tải model cross-encoder
+DEFAULT_RETRIEVERS = ["dense", "bm25", "hybrid-0.7", "hybrid-0.5"]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings băm từ khóa (feature hashing) không cần model, dùng làm mốc khi không tải được
+    model HuggingFace; không phản ánh chất lượng của model embeddings thật
+    Args:
+        dim (int): Số chiều vector
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def normalize_text(text: str) -> str:
+    """Gộp khoảng trắng để so khớp đoạn trả lời không phụ thuộc xuống dòng"""
+    return re.sub(r"\s+", " ", text)
+
+
+def doc_name_of(filename: str) -> str:
+    """Tên tài liệu như seed_data.load_data_from_local"""
+    return filename.rsplit(".", 1)[0].replace("_", " ")
+
+
+def parse_chunking(spec: str) -> Optional[Tuple[int, int]]:
+    """
+    'raw' -> None (giữ nguyên bản ghi như khi seed), '1000:100' -> (chunk_size, chunk_overlap)
+    """
+    if spec == "raw":
+        return None
+    size, _, overlap = spec.partition(":")
+    return int(size), int(overlap or 0)
+
+
+def load_documents(files: List[str], chunking: Optional[Tuple[int, int]]) -> List[Document]:
+    """
+    Đọc các corpus trong src/data thành chunk với metadata chuẩn hóa và ID xác định như khi seed
+    """
+    splitter = None
+    if chunking is not None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunking[0], chunk_overlap=chunking[1], add_start_index=True)
+    documents = {}
+    for filename in files:
+        doc_name = doc_name_of(filename)
+        records = (
+            Document(page_content=record.get("page_content") or "", metadata=normalize_metadata(record.get("metadata") or {}, doc_name))
+            for record in iter_corpus(os.path.join(DATA_DIR, filename))
+        )
+        for doc in records:
+            chunks = [doc] if splitter is None else splitter.split_documents([doc])
+            for chunk in chunks:
+                if splitter is not None:
+                    chunk.metadata = normalize_metadata(chunk.metadata, doc_name)
+                documents.setdefault(document_id(chunk), chunk)
+    return [Document(page_content=doc.page_content, metadata={**doc.metadata, "pk": doc_id}) for doc_id, doc in documents.items()]
+
+
+def get_benchmark_embeddings(name: str):
+    """
+    'hashing' hoặc '<backend>' / '<backend>:<model>' của registry (không dùng cache trên đĩa để đo đúng độ trễ embed)
+    """
+    if name == "hashing":
+        return HashingEmbeddings()
+    backend, _, model = name.partition(":")
+    return registry.get_embeddings(backend, model or None, cache=False)
+
+
+def build_indexes(documents: List[Document], embeddings, directory: str) -> Tuple[LocalVectorStore, BM25Index, dict, dict]:
+    """
+    Embed và build vector store local + chỉ mục BM25
+    Returns:
+        tuple: (vectorstore, bm25_index, thời gian build (giây), bộ nhớ (byte))
+    """
+    texts = [doc.page_content for doc in documents]
+    metadatas = [{k: v for k, v in doc.metadata.items() if k != "pk"} for doc in documents]
+    ids = [doc.metadata["pk"] for doc in documents]
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    embed_s = time.perf_counter() - start
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    vectorstore = LocalVectorStore(embedding_function=embeddings, collection_name="benchmark", directory=directory, drop_old=True)
+    vectorstore.add_embeddings(texts=texts, embeddings=vectors, metadatas=metadatas, ids=ids)
+    vector_s = time.perf_counter() - start
+    vector_bytes = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    bm25_index = BM25Index()
+    bm25_index.update(zip(ids, documents))
+    bm25_s = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    build = {"embed_s": embed_s, "vector_index_s": vector_s, "bm25_index_s": bm25_s, "total_s": embed_s + vector_s + bm25_s}
+    memory = {"vector_index_bytes": vector_bytes, "bm25_index_bytes": current - vector_bytes, "bm25_build_peak_bytes": peak - vector_bytes}
+    return vectorstore, bm25_index, build, memory
+
+
+def search(mode: str, query: str, vectorstore: LocalVectorStore, bm25_index: BM25Index, k: int) -> Tuple[List[Document], Dict[str, float]]:
+    """
+    Chạy một câu hỏi với một loại retriever
+    Returns:
+        tuple: (danh sách Document, thời gian từng giai đoạn (mili giây))
+    """
+    if mode == "dense":
+        start = time.perf_counter()
+        embedding = vectorstore.embeddings.embed_query(query)
+        dense_start = time.perf_counter()
+        docs = [doc for doc, _ in vectorstore.similarity_search_with_score_by_vector(embedding, k=k)]
+        end = time.perf_counter()
+        return docs, {"embed_ms": (dense_start - start) * 1000, "dense_ms": (end - dense_start) * 1000, "total_ms": (end - start) * 1000}
+    if mode == "bm25":
+        start = time.perf_counter()
+        docs = [bm25_index.get_document(position) for position, _ in bm25_index.search(query, k)]
+        elapsed = (time.perf_counter() - start) * 1000
+        return docs, {"bm25_ms": elapsed, "total_ms": elapsed}
+    reranker = get_reranker() if mode.endswith("-rerank") else None
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25_index=bm25_index, k=k, fetch_k=k, weights=RETRIEVERS[mode],
+                                reranker=reranker, rerank_candidates=50)
+    return retriever.search_with_timings(query)
+
+
+def is_relevant(doc: Document, query: dict) -> bool:
+    if doc.metadata.get("doc_name") != doc_name_of(query["corpus"]):
+        return False
+    text = normalize_text(doc.page_content)
+    return any(snippet in text for snippet in query["relevant"])
+
+
+def percentiles(values: List[float]) -> dict:
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": float(np.percentile(array, 50)),
+        "p95": float(np.percentile(array, 95)),
+        "p99": float(np.percentile(array, 99)),
+        "mean": float(array.mean()),
+    }
+
+
+def evaluate(mode: str, queries: List[dict], vectorstore: LocalVectorStore, bm25_index: BM25Index,
+             ks: List[int], repeat: int) -> dict:
+    """
+    Đo recall@k (tỉ lệ câu hỏi có ít nhất một chunk liên quan trong top k), MRR@max(k)
+    và phân vị độ trễ của từng giai đoạn
+    """
+    max_k = max(ks)
+    # Chạy thử một lần: load model, cache của NumPy... không tính vào độ trễ
+    search(mode, queries[0]["query"], vectorstore, bm25_index, max_k)
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    stage_timings = {}
+    per_query = []
+    for query in queries:
+        for _ in range(repeat):
+            docs, timings = search(mode, query["query"], vectorstore, bm25_index, max_k)
+            for stage, value in timings.items():
+                stage_timings.setdefault(stage, []).append(value)
+        rank = next((position for position, doc in enumerate(docs, start=1) if is_relevant(doc, query)), None)
+        for k in ks:
+            hits[k] += rank is not None and rank <= k
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        per_query.append({"id": query["id"], "rank": rank})
+    return {
+        "recall": {f"@{k}": hits[k] / len(queries) for k in ks},
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "latency_ms": {stage.replace("_ms", ""): percentiles(values) for stage, values in stage_timings.items()},
+        "queries": per_query,
+    }
+
+
+def run(embedding_names: List[str], chunkings: List[str], modes: List[str], ks: List[int], repeat: int,
+        queries_path: str = QUERIES_PATH) -> dict:
+    """
+    Chạy toàn bộ benchmark
+    Returns:
+        dict: {'meta': {...}, 'results': [{'config', 'metrics', 'build', 'memory', ...}, ...]}
+    """
+    with open(queries_path, "r", encoding="utf-8") as file:
+        queries = json.load(file)
+    files = sorted({query["corpus"] for query in queries})
+    results = []
+    for embedding_name in embedding_names:
+        embeddings = get_benchmark_embeddings(embedding_name)
+        for chunking in chunkings:
+            documents = load_documents(files, parse_chunking(chunking))
+            with tempfile.TemporaryDirectory() as directory:
+                vectorstore, bm25_index, build, memory = build_indexes(documents, embeddings, directory)
+                print(f"[{embedding_name} | {chunking}] {len(documents)} chunk, build {build['total_s']:.2f}s")
+                for mode in modes:
+                    metrics = evaluate(mode, queries, vectorstore, bm25_index, ks, repeat)
+                    config = {"embeddings": embedding_name, "chunking": chunking, "retriever": mode}
+                    results.append({
+                        "id": "|".join(config.values()),
+                        "config": config,
+                        "chunks": len(documents),
+                        "metrics": {"recall": metrics["recall"], "mrr": metrics["mrr"]},
+                        "latency_ms": metrics["latency_ms"],
+                        "build": build,
+                        "memory": memory,
+                        "queries": metrics["queries"],
+                    })
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "queries": len(queries),
+        "corpora": files,
+        "k": ks,
+        "repeat": repeat,
+        # ru_maxrss: KB trên Linux, byte trên macOS
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    }
+    return {"meta": meta, "results": results}
+
+
+def print_table(report: dict) -> None:
+    ks = report["meta"]["k"]
+    header = ["config"] + [f"R@{k}" for k in ks] + ["MRR", "p50 ms", "p95 ms", "p99 ms", "build s", "index MB"]
+    rows = []
+    for result in report["results"]:
+        total = result["latency_ms"]["total"]
+        memory_mb = (result["memory"]["vector_index_bytes"] + result["memory"]["bm25_index_bytes"]) / 2 ** 20
+        rows.append(
+            [result["id"]]
+            + [f"{result['metrics']['recall'][f'@{k}']:.2f}" for k in ks]
+            + [f"{result['metrics']['mrr']:.3f}", f"{total['p50']:.2f}", f"{total['p95']:.2f}", f"{total['p99']:.2f}",
+               f"{result['build']['total_s']:.2f}", f"{memory_mb:.1f}"]
+        )
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+
+def compare(report: dict, baseline: dict, tolerance: float, latency_tolerance: float) -> List[str]:
+    """
+    So sánh với kết quả cũ theo từng cấu hình
+    Args:
+        tolerance (float): Mức giảm recall/MRR tối đa cho phép (tuyệt đối)
+        latency_tolerance (float): Mức tăng p95 tổng tối đa cho phép (tỉ lệ, 0.5 = +50%)
+    Returns:
+        list: Mô tả các chỉ số bị giảm chất lượng
+    """
+    regressions = []
+    old_results = {result["id"]: result for result in baseline.get("results", [])}
+    for result in report["results"]:
+        old = old_results.get(result["id"])
+        if old is None:
+            continue
+        for name, value in list(result["metrics"]["recall"].items()) + [("mrr", result["metrics"]["mrr"])]:
+            old_value = old["metrics"]["mrr"] if name == "mrr" else old["metrics"]["recall"].get(name)
+            if old_value is not None and value < old_value - tolerance:
+                regressions.append(f"{result['id']}: {name} {old_value:.3f} -> {value:.3f}")
+        old_p95 = old["latency_ms"]["total"]["p95"]
+        new_p95 = result["latency_ms"]["total"]["p95"]
+        if old_p95 > 0 and new_p95 > old_p95 * (1 + latency_tolerance):
+            regressions.append(f"{result['id']}: p95 {old_p95:.2f}ms -> {new_p95:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall/MRR/độ trễ của các cấu hình retriever")
+    parser.add_argument("--embeddings", default="hf", help="Danh sách model, phân tách bằng dấu phẩy: hf, ollama, openai, hf:<model>, hashing")
+    parser.add_argument("--chunking", default="raw,1000:100", help="Danh sách cách chia chunk: raw hoặc <chunk_size>:<chunk_overlap>")
+    parser.add_argument("--retrievers", default=",".join(DEFAULT_RETRIEVERS), help=f"Danh sách retriever: {', '.join(RETRIEVERS)}")
+    parser.add_argument("--k", default="1,3,5,10", help="Các giá trị k cho recall@k")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi câu hỏi khi đo độ trễ")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="File câu hỏi có nhãn")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON kết quả")
+    parser.add_argument("--baseline", help="File JSON kết quả cũ để so sánh; thoát với mã 1 nếu có chỉ số giảm")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Mức giảm recall/MRR cho phép khi so sánh")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5, help="Mức tăng p95 cho phép khi so sánh (tỉ lệ)")
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.retrievers.split(",") if mode]
+    for mode in modes:
+        if mode not in RETRIEVERS:
+            parser.error(f"Retriever không hợp lệ: '{mode}'")
+    report = run(
+        [name for name in args.embeddings.split(",") if name],
+        [spec for spec in args.chunking.split(",") if spec],
+        modes,
+        sorted(int(k) for k in args.k.split(",")),
+        args.repeat,
+        args.queries,
+    )
+    print_table(report)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance, args.latency_tolerance)
+        for line in regressions:
+            print(f"Giảm chất lượng: {line}")
+        if regressions:
+            sys.exit(1)
+        print("Không có chỉ số nào giảm so với baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Benchmark thời gian khởi động (cold start) của giao diện, API và worker seed dữ liệu
+Chức năng:
+- Import từng module cần đo (main, api, jobs, seed_data) trong tiến trình Python mới với
+  `-X importtime`: tổng thời gian, các module/package import chậm nhất
+- Báo các thư viện nặng bị import ngay lúc khởi động (SDK nhà cung cấp model, pymilvus,
+  sentence-transformers, crawler) thay vì khi được chọn/dùng
+- Đo thời gian spawn một worker process (như jobs.WorkerPool) tới khi sẵn sàng nhận job
+- Ghi kết quả ra file JSON, so sánh với kết quả cũ (--baseline) để phát hiện khởi động chậm đi
+
+Chạy trong thư mục src:
+    python -m benchmarks.startup --output benchmarks/results/startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import statistics
+import multiprocessing
+from typing import Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "startup.json")
+
+# Module cần đo: giao diện, API, worker lúc chờ job và worker khi chạy job đầu tiên
+DEFAULT_MODULES = ["main", "api", "jobs", "seed_data"]
+# Thư viện nặng chỉ nên được import khi được chọn/dùng, không phải lúc khởi động giao diện/API
+LAZY_PACKAGES = [
+    "langchain_openai", "langchain_google_genai", "google.generativeai", "langchain_ollama",
+    "langchain_milvus", "pymilvus", "sentence_transformers", "torch", "aiohttp", "bs4",
+    "langchain_community.document_loaders", "langchain.agents",
+]
+# Module được phép import các thư viện trên ngay (vì chính nó cần chúng)
+EAGER_ALLOWED = {"seed_data"}
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """
+    Đọc output của `-X importtime`
+    Returns:
+        list: [{'module', 'depth', 'self_us', 'cumulative_us'}] theo thứ tự import xong
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # Dòng tiêu đề
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        entries.append({
+            "module": stripped,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+        })
+    return entries
+
+
+def measure_import(module: str, top: int = 15) -> dict:
+    """
+    Import module trong tiến trình mới (thư mục src) và đo thời gian
+    Returns:
+        dict: wall_s (cả khởi động trình thông dịch), import_s, slowest (module tốn nhiều thời gian
+              tự thân nhất), packages (tổng thời gian tự thân theo package cấp cao nhất), eager (thư viện
+              nặng bị import), error nếu import lỗi
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    wall_s = time.perf_counter() - start
+    entries = parse_importtime(process.stderr)
+    imported = {entry["module"] for entry in entries}
+    root = next((entry for entry in reversed(entries) if entry["module"] == module and entry["depth"] == 0), None)
+
+    # Cộng thời gian tự thân theo package cấp cao nhất (không bị tính trùng như thời gian tích lũy)
+    packages: Dict[str, int] = {}
+    for entry in entries:
+        name = entry["module"].split(".")[0]
+        packages[name] = packages.get(name, 0) + entry["self_us"]
+    result = {
+        "wall_s": wall_s,
+        "import_s": root["cumulative_us"] / 1e6 if root else None,
+        "modules": len(entries),
+        "slowest": [
+            {"module": entry["module"], "self_ms": entry["self_us"] / 1000}
+            for entry in sorted(entries, key=lambda entry: entry["self_us"], reverse=True)[:top]
+        ],
+        "packages": [
+            {"package": name, "self_ms": value / 1000}
+            for name, value in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+        "eager": [package for package in LAZY_PACKAGES if package in imported],
+    }
+    if process.returncode != 0:
+        lines = [line for line in process.stderr.splitlines() if not line.startswith("import time:")]
+        result["error"] = lines[-1] if lines else f"exit code {process.returncode}"
+    return result
+
+
+def _spawn_probe(connection, modules: List[str]) -> None:
+    """Chạy trong worker được spawn: báo thời điểm bắt đầu và sau khi import xong các module"""
+    connection.send(("started", time.time()))
+    error = None
+    for module in modules:
+        try:
+            __import__(module)
+        except Exception as e:
+            error = f"{module}: {str(e)}"
+            break
+    connection.send(("ready", time.time(), error))
+    connection.close()
+
+
+def measure_spawn(modules: List[str]) -> dict:
+    """
+    Spawn một tiến trình như jobs.WorkerPool và đo thời gian tới khi tiến trình chạy và import xong modules
+    Returns:
+        dict: started_s (khởi động trình thông dịch + import benchmark), ready_s, error
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    start = time.time()
+    process = context.Process(target=_spawn_probe, args=(sender, modules))
+    process.start()
+    sender.close()
+    started = receiver.recv()[1]
+    _, ready, error = receiver.recv()
+    process.join()
+    return {"started_s": started - start, "ready_s": ready - start, "error": error}
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def run(modules: List[str], repeat: int, worker_modules: List[str]) -> dict:
+    """
+    Chạy toàn bộ benchmark (mỗi phép đo lặp lại repeat lần, lấy trung vị)
+    Returns:
+        dict: {'meta': {...}, 'imports': {module: {...}}, 'worker_spawn': {...}}
+    """
+    imports = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        result = dict(runs[-1])
+        result["wall_s"] = median([item["wall_s"] for item in runs])
+        result["import_s"] = median([item["import_s"] for item in runs])
+        imports[module] = result
+    spawns = [measure_spawn(worker_modules) for _ in range(repeat)]
+    worker_spawn = {
+        "modules": worker_modules,
+        "started_s": median([item["started_s"] for item in spawns]),
+        "ready_s": median([item["ready_s"] for item in spawns]),
+        "error": spawns[-1]["error"],
+    }
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+    }
+    return {"meta": meta, "imports": imports, "worker_spawn": worker_spawn}
+
+
+def print_report(report: dict, top: int = 5) -> None:
+    header = ["module", "wall s", "import s", "modules", "eager"]
+    rows = [
+        [module, f"{result['wall_s']:.2f}",
+         f"{result['import_s']:.2f}" if result["import_s"] is not None else "-",
+         str(result["modules"]), ", ".join(result["eager"]) or "-"]
+        for module, result in report["imports"].items()
+    ]
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    for module, result in report["imports"].items():
+        if result.get("error"):
+            print(f"{module}: lỗi khi import: {result['error']}")
+        packages = ", ".join(f"{item['package']} {item['self_ms']:.0f}ms" for item in result["packages"][:top])
+        print(f"{module}: chậm nhất {packages}")
+    spawn = report["worker_spawn"]
+    print(f"Worker spawn: chạy sau {spawn['started_s']:.2f}s, sẵn sàng ({', '.join(spawn['modules'])}) sau {spawn['ready_s']:.2f}s"
+          + (f" (lỗi: {spawn['error']})" if spawn["error"] else ""))
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    So sánh với kết quả cũ
+    Args:
+        tolerance (float): Mức tăng thời gian tối đa cho phép (tỉ lệ, 0.3 = +30%)
+    Returns:
+        list: Mô tả các chỉ số bị chậm đi và thư viện nặng mới bị import lúc khởi động
+    """
+    regressions = []
+    for module, result in report["imports"].items():
+        old = baseline.get("imports", {}).get(module)
+        if old is None:
+            continue
+        for name in ("wall_s", "import_s"):
+            if old.get(name) and result.get(name) and result[name] > old[name] * (1 + tolerance):
+                regressions.append(f"{module}: {name} {old[name]:.2f}s -> {result[name]:.2f}s")
+        if module not in EAGER_ALLOWED:
+            for package in sorted(set(result["eager"]) - set(old.get("eager", []))):
+                regressions.append(f"{module}: import {package} lúc khởi động")
+    old_spawn = baseline.get("worker_spawn", {}).get("ready_s")
+    new_spawn = report["worker_spawn"]["ready_s"]
+    if old_spawn and new_spawn and new_spawn > old_spawn * (1 + tolerance):
+        regressions.append(f"worker spawn: {old_spawn:.2f}s -> {new_spawn:.2f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động và spawn worker")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES), help="Các module cần đo, phân tách bằng dấu phẩy")
+    parser.add_argument("--worker-modules", default="jobs", help="Module worker import trước khi sẵn sàng nhận job")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi module")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON kết quả")
+    parser.add_argument("--baseline", help="File JSON kết quả cũ để so sánh; thoát với mã 1 nếu khởi động chậm đi")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Mức tăng thời gian cho phép khi so sánh (tỉ lệ)")
+    args = parser.parse_args()
+
+    report = run(
+        [module for module in args.modules.split(",") if module],
+        args.repeat,
+        [module for module in args.worker_modules.split(",") if module],
+    )
+    print_report(report)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"Chậm đi: {line}")
+        if regressions:
+            sys.exit(1)
+        print("Không có chỉ số nào chậm đi so với baseline")
+
+
+if __name__ == "__main__":
+    main()
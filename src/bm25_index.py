@@ -0,0 +1,348 @@
+"""
+Chỉ mục BM25 đầy đủ cho một collection, lưu trên đĩa dưới dạng mảng NumPy
+Chức năng:
+- Inverted index dạng CSR: mỗi term trỏ tới một đoạn liên tiếp trong mảng postings/tf
+- Lưu/đọc từ thư mục BM25_INDEX_DIR/<collection>, mảng được memory-map khi đọc
+- Văn bản và metadata của chunk lưu dạng blob + offsets (như snapshot.py), chỉ đọc từ đĩa khi cần:
+  bộ nhớ mỗi tiến trình không tăng theo kích thước corpus (chỉ giữ danh sách ID)
+- Cập nhật tăng dần khi seed thêm hoặc xóa chunk, không cần tokenize lại toàn bộ corpus
+
+Cấu trúc thư mục chỉ mục:
+- vocab.json, ids.json: tham số k1/b, từ điển term -> term_id, ID các chunk theo vị trí
+- indptr.npy, postings.npy, tfs.npy, doc_len.npy: inverted index
+- texts.bin + text_offsets.npy, metadata.bin + metadata_offsets.npy: chunk i nằm trong
+  [offsets[i], offsets[i+1]) (văn bản UTF-8, metadata JSON)
+"""
+
+import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", os.path.join(".cache", "bm25"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách văn bản thành các token chữ thường (hỗ trợ tiếng Việt có dấu)
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+class _BlobStore:
+    """
+    Dãy bản ghi bytes: phần đã lưu (memory-map, chỉ đọc) và phần thêm sau đó (ghi vào file tạm)
+    Args:
+        blob (np.ndarray): Nội dung file blob đã lưu (memory-map)
+        offsets (np.ndarray): Bản ghi i nằm trong [offsets[i], offsets[i+1]) của blob
+    """
+
+    def __init__(self, blob: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None):
+        self._base = blob if blob is not None else np.zeros(0, dtype=np.uint8)
+        self._base_offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._spill = None
+        self._spill_offsets = array("q", [0])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, blob_path: str, offsets_path: str) -> "_BlobStore":
+        offsets = np.load(offsets_path, mmap_mode="r")
+        # np.memmap không mở được file rỗng
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if offsets[-1] else None
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self._base_offsets) - 1 + len(self._spill_offsets) - 1
+
+    def append(self, data: bytes) -> None:
+        with self._lock:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix="bm25-")
+            self._spill.seek(0, os.SEEK_END)
+            self._spill.write(data)
+            self._spill_offsets.append(self._spill_offsets[-1] + len(data))
+
+    def get(self, i: int) -> bytes:
+        base_count = len(self._base_offsets) - 1
+        if i < base_count:
+            return bytes(self._base[self._base_offsets[i]:self._base_offsets[i + 1]])
+        i -= base_count
+        start, end = self._spill_offsets[i], self._spill_offsets[i + 1]
+        with self._lock:
+            self._spill.seek(start)
+            return self._spill.read(end - start)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def select(self, keep: np.ndarray) -> "_BlobStore":
+        """Bản sao chỉ gồm các bản ghi có keep True (chép dần sang file tạm mới)"""
+        store = _BlobStore()
+        for i in np.flatnonzero(keep):
+            store.append(self.get(int(i)))
+        return store
+
+    def save(self, blob_path: str, offsets_path: str) -> None:
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        with open(blob_path, "wb") as file:
+            for i, data in enumerate(self):
+                file.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(offsets_path, offsets)
+
+
+class BM25Index:
+    """
+    Inverted index BM25 (Okapi) lưu bằng mảng NumPy
+    Args:
+        k1 (float): Tham số bão hòa tần suất term
+        b (float): Tham số chuẩn hóa theo độ dài văn bản
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}                                # term -> term_id
+        self.indptr = np.zeros(1, dtype=np.int64)      # postings của term t nằm trong [indptr[t], indptr[t+1])
+        self.postings = np.zeros(0, dtype=np.int32)    # vị trí văn bản
+        self.tfs = np.zeros(0, dtype=np.float32)       # tần suất term trong văn bản
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.doc_ids = []
+        self._texts = _BlobStore()
+        self._metadatas = _BlobStore()
+        self._field_masks = {}
+        self._pending = []      # (term_ids, tfs) của các văn bản đã thêm nhưng chưa gộp vào CSR
+        self._positions = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def update(self, added: Iterable[Tuple[str, Document]] = (), removed_ids: Iterable[str] = ()) -> None:
+        """
+        Thêm/xóa văn bản khỏi chỉ mục
+        Args:
+            added: Các cặp (id, Document) cần thêm; id đã có sẽ được thay thế
+            removed_ids: Các id cần xóa
+        Chú ý:
+            - Gọi được theo từng batch khi seed: văn bản mới được ghi ra file tạm và postings được
+              gộp vào CSR ở lần tìm kiếm/lưu tiếp theo (không dựng lại CSR sau mỗi batch)
+        """
+        added = list(added)
+        self._field_masks = {}
+        positions = self._id_positions()
+        drop = {doc_id for doc_id in removed_ids if doc_id in positions}
+        drop.update(doc_id for doc_id, _ in added if doc_id in positions)
+        if drop:
+            self._drop(drop)
+            positions = self._id_positions()
+
+        # Chỉ tokenize các văn bản mới
+        for doc_id, doc in added:
+            counts = Counter(tokenize(doc.page_content))
+            term_ids = [self.vocab.setdefault(term, len(self.vocab)) for term in counts]
+            self._pending.append((
+                np.array(term_ids, dtype=np.int64),
+                np.array(list(counts.values()), dtype=np.float32),
+            ))
+            positions[doc_id] = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self._texts.append(doc.page_content.encode("utf-8"))
+            self._metadatas.append(json.dumps(doc.metadata, ensure_ascii=False).encode("utf-8"))
+
+    def _id_positions(self) -> dict:
+        # id -> vị trí, dựng lại sau mỗi lần xóa
+        if self._positions is None:
+            self._positions = {doc_id: position for position, doc_id in enumerate(self.doc_ids)}
+        return self._positions
+
+    def _coo(self) -> Tuple[List[np.ndarray], List[np.ndarray], List[np.ndarray], List[np.ndarray]]:
+        """Các mảng (term, doc, tf, doc_len) của CSR hiện có cùng các văn bản chưa gộp"""
+        terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        coo_terms, coo_docs, coo_tfs = [terms], [np.asarray(self.postings, dtype=np.int64)], [np.asarray(self.tfs)]
+        doc_len = [np.asarray(self.doc_len)]
+        position = len(self.doc_len)
+        for term_ids, tfs in self._pending:
+            coo_terms.append(term_ids)
+            coo_docs.append(np.full(len(term_ids), position, dtype=np.int64))
+            coo_tfs.append(tfs)
+            doc_len.append(np.array([tfs.sum()], dtype=np.float32))
+            position += 1
+        return coo_terms, coo_docs, coo_tfs, doc_len
+
+    def _build(self, coo_terms, coo_docs, coo_tfs, doc_len) -> None:
+        terms = np.concatenate(coo_terms)
+        docs = np.concatenate(coo_docs)
+        tfs = np.concatenate(coo_tfs)
+        order = np.lexsort((docs, terms))
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocab)), out=self.indptr[1:])
+        self.postings = docs[order].astype(np.int32)
+        self.tfs = tfs[order]
+        self.doc_len = np.concatenate(doc_len).astype(np.float32)
+        self._pending = []
+
+    def _merge(self) -> None:
+        """Gộp postings của các văn bản mới vào CSR"""
+        with self._lock:
+            if self._pending:
+                self._build(*self._coo())
+
+    def _drop(self, drop: set) -> None:
+        # Giữ lại các văn bản không bị xóa/thay thế, đánh số lại vị trí
+        keep = np.array([doc_id not in drop for doc_id in self.doc_ids], dtype=bool)
+        new_position = np.cumsum(keep, dtype=np.int64) - 1
+        coo_terms, coo_docs, coo_tfs, doc_len = self._coo()
+        terms, docs, tfs = np.concatenate(coo_terms), np.concatenate(coo_docs), np.concatenate(coo_tfs)
+        posting_mask = keep[docs] if len(docs) else np.zeros(0, dtype=bool)
+        self._build([terms[posting_mask]], [new_position[docs[posting_mask]]], [tfs[posting_mask]],
+                    [np.concatenate(doc_len)[keep]])
+        self.doc_ids = [doc_id for doc_id, k in zip(self.doc_ids, keep) if k]
+        self._texts = self._texts.select(keep)
+        self._metadatas = self._metadatas.select(keep)
+        self._positions = None
+
+    def field_mask(self, metadata_filter: dict) -> np.ndarray:
+        """
+        Mặt nạ các văn bản có metadata thỏa điều kiện (lưu lại cho tới lần update sau)
+        Args:
+            metadata_filter (dict): {trường: giá trị} hoặc {trường: [các giá trị]}
+        Chú ý:
+            - Lần đầu dùng một điều kiện, metadata được đọc tuần tự từ đĩa
+        """
+        mask = np.ones(len(self.doc_ids), dtype=bool)
+        for field, value in metadata_filter.items():
+            values = tuple(value) if isinstance(value, (list, tuple, set)) else (value,)
+            key = (field, values)
+            if key not in self._field_masks:
+                self._field_masks[key] = np.fromiter(
+                    (json.loads(data).get(field) in values for data in self._metadatas), dtype=bool, count=len(self.doc_ids)
+                )
+            mask &= self._field_masks[key]
+        return mask
+
+    def search(self, query: str, k: int = 4, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Tìm k văn bản có điểm BM25 cao nhất
+        Args:
+            query (str): Câu truy vấn
+            k (int): Số kết quả
+            mask (np.ndarray): Chỉ xét các văn bản có mask True (xem field_mask)
+        Returns:
+            list: Các cặp (vị trí văn bản, điểm) theo thứ tự giảm dần
+        """
+        self._merge()
+        n_docs = len(self.doc_ids)
+        if n_docs == 0:
+            return []
+        avg_len = float(np.mean(self.doc_len)) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len) / avg_len)
+        scores = np.zeros(n_docs, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            if start == end:
+                continue
+            docs = self.postings[start:end]
+            tf = self.tfs[start:end]
+            df = end - start
+            idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        if mask is not None:
+            scores[~mask] = 0.0
+        k = min(k, n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def get_document(self, position: int) -> Document:
+        """Tạo Document (kèm 'pk' trong metadata) cho văn bản ở vị trí position"""
+        metadata = json.loads(self._metadatas.get(position))
+        metadata["pk"] = self.doc_ids[position]
+        return Document(page_content=self._texts.get(position).decode("utf-8"), metadata=metadata)
+
+    def save(self, directory: str) -> None:
+        """
+        Ghi chỉ mục vào thư mục (ghi ra thư mục tạm rồi đổi tên để không để lại chỉ mục dở dang)
+        """
+        self._merge()
+        tmp_dir = directory.rstrip(os.sep) + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        np.save(os.path.join(tmp_dir, "indptr.npy"), self.indptr)
+        np.save(os.path.join(tmp_dir, "postings.npy"), self.postings)
+        np.save(os.path.join(tmp_dir, "tfs.npy"), self.tfs)
+        np.save(os.path.join(tmp_dir, "doc_len.npy"), self.doc_len)
+        with open(os.path.join(tmp_dir, "vocab.json"), "w", encoding="utf-8") as file:
+            json.dump({"k1": self.k1, "b": self.b, "vocab": self.vocab}, file, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, "ids.json"), "w", encoding="utf-8") as file:
+            json.dump(self.doc_ids, file)
+        self._texts.save(os.path.join(tmp_dir, "texts.bin"), os.path.join(tmp_dir, "text_offsets.npy"))
+        self._metadatas.save(os.path.join(tmp_dir, "metadata.bin"), os.path.join(tmp_dir, "metadata_offsets.npy"))
+
+        old_dir = directory.rstrip(os.sep) + ".old"
+        if os.path.exists(directory):
+            os.replace(directory, old_dir)
+        os.replace(tmp_dir, directory)
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """
+        Đọc chỉ mục từ thư mục, các mảng postings và văn bản/metadata được memory-map (không copy vào RAM)
+        Returns:
+            BM25Index hoặc None nếu chưa có chỉ mục
+        """
+        if not os.path.exists(os.path.join(directory, "ids.json")):
+            return None
+        with open(os.path.join(directory, "vocab.json"), "r", encoding="utf-8") as file:
+            header = json.load(file)
+        index = cls(k1=header["k1"], b=header["b"])
+        index.vocab = header["vocab"]
+        index.indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+        index.postings = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+        index.tfs = np.load(os.path.join(directory, "tfs.npy"), mmap_mode="r")
+        index.doc_len = np.load(os.path.join(directory, "doc_len.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "ids.json"), "r", encoding="utf-8") as file:
+            index.doc_ids = json.load(file)
+        index._texts = _BlobStore.load(os.path.join(directory, "texts.bin"), os.path.join(directory, "text_offsets.npy"))
+        index._metadatas = _BlobStore.load(os.path.join(directory, "metadata.bin"), os.path.join(directory, "metadata_offsets.npy"))
+        return index
+
+
+def index_path(collection_name: str) -> str:
+    """Đường dẫn thư mục chỉ mục BM25 của một collection"""
+    return os.path.join(BM25_INDEX_DIR, collection_name)
+
+
+def load_bm25_index(collection_name: str) -> Optional[BM25Index]:
+    """Đọc chỉ mục BM25 của collection (None nếu chưa được tạo lúc seed)"""
+    return BM25Index.load(index_path(collection_name))
+
+
+def save_bm25_index(index: BM25Index, collection_name: str) -> None:
+    """Ghi chỉ mục BM25 của collection"""
+    index.save(index_path(collection_name))
+
+
+def delete_bm25_index(collection_name: str) -> None:
+    """Xóa chỉ mục BM25 của collection (lần đọc sau trả về None)"""
+    shutil.rmtree(index_path(collection_name), ignore_errors=True)
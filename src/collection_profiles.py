@@ -0,0 +1,210 @@
+"""
+Profile cấu hình collection: loại index, tham số index/tìm kiếm, index metadata và phân vùng theo tài liệu
+Chức năng:
+- Chọn profile khi seed (đánh đổi recall/độ trễ cho từng collection), lưu lại để dùng khi truy vấn
+- Sinh tham số cho langchain_milvus.Milvus (index_params, search_params, partition_key_field)
+  và cho LocalVectorStore (metric, nprobe, lượng tử hóa)
+- Tạo scalar index trên các trường metadata (doc_name, language) để lọc nhanh
+- Sinh biểu thức lọc Milvus từ điều kiện metadata (ví dụ chỉ tìm trong một tài liệu)
+"""
+
+import os
+import json
+import copy
+from typing import Optional
+
+COLLECTION_PROFILE_DIR = os.getenv("COLLECTION_PROFILE_DIR", os.path.join(".cache", "collections"))
+DEFAULT_PROFILE = os.getenv("COLLECTION_PROFILE", "default")
+
+PROFILES = {
+    # Giữ nguyên cấu hình mặc định của langchain_milvus (như trước đây)
+    "default": {
+        "description": "Mặc định của langchain_milvus",
+        "metric": "L2",
+        "index": None,
+        "search": None,
+        "scalar_indexes": [],
+        "partition_key_field": None,
+    },
+    "fast": {
+        "description": "HNSW nhỏ, độ trễ thấp nhất, recall thấp hơn",
+        "metric": "L2",
+        "index": {"index_type": "HNSW", "params": {"M": 8, "efConstruction": 64}},
+        "search": {"ef": 16},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+    "balanced": {
+        "description": "HNSW cân bằng giữa recall và độ trễ",
+        "metric": "L2",
+        "index": {"index_type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "search": {"ef": 64},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+    "accurate": {
+        "description": "HNSW lớn, recall cao nhất, chậm hơn",
+        "metric": "L2",
+        "index": {"index_type": "HNSW", "params": {"M": 32, "efConstruction": 400}},
+        "search": {"ef": 256},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+    "large": {
+        "description": "IVF cho collection rất lớn, tốn ít bộ nhớ hơn HNSW",
+        "metric": "L2",
+        "index": {"index_type": "IVF_FLAT", "params": {"nlist": 1024}},
+        "search": {"nprobe": 32},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+    # Lượng tử hóa: vector store local giữ mã int8/nhị phân trong RAM và chấm lại bằng vector
+    # đầy đủ trên đĩa; Milvus dùng IVF_SQ8 (mã int8 của chính Milvus)
+    "compact": {
+        "description": "Mã int8 (1/4 bộ nhớ), chấm lại top ứng viên bằng vector đầy đủ",
+        "metric": "L2",
+        "index": {"index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+        "search": {"nprobe": 32},
+        "quantization": {"type": "int8", "dimensions": None, "rescore_factor": 4},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+    "tiny": {
+        "description": "Mã nhị phân 1 bit/chiều (1/32 bộ nhớ), chấm lại nhiều ứng viên hơn",
+        "metric": "L2",
+        "index": {"index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+        "search": {"nprobe": 32},
+        "quantization": {"type": "binary", "dimensions": None, "rescore_factor": 10},
+        "scalar_indexes": ["doc_name", "language"],
+        "partition_key_field": "doc_name",
+    },
+}
+
+
+def get_profile(name: Optional[str] = None) -> dict:
+    """
+    Lấy bản sao của profile theo tên
+    Args:
+        name (str): Tên profile, mặc định DEFAULT_PROFILE
+    Returns:
+        dict: Cấu hình profile (có thêm khóa 'name')
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Profile không hợp lệ: '{name}'. Các profile có sẵn: {', '.join(PROFILES)}")
+    return {"name": name, **copy.deepcopy(PROFILES[name])}
+
+
+def _profile_path(collection_name: str) -> str:
+    return os.path.join(COLLECTION_PROFILE_DIR, f"{collection_name}.json")
+
+
+def save_collection_profile(collection_name: str, profile: dict) -> None:
+    """Lưu profile đã dùng khi seed collection"""
+    if not os.path.exists(COLLECTION_PROFILE_DIR):
+        os.makedirs(COLLECTION_PROFILE_DIR)
+    tmp_path = _profile_path(collection_name) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(profile, file, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, _profile_path(collection_name))
+
+
+def load_collection_profile(collection_name: str) -> Optional[dict]:
+    """
+    Đọc profile đã lưu của collection
+    Returns:
+        dict: Profile, None nếu collection được seed trước khi có profile
+    """
+    path = _profile_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def resolve_profile(collection_name: str, profile_name: Optional[str] = None, keep_existing: bool = False) -> dict:
+    """
+    Chọn profile cho một lần seed
+    Args:
+        collection_name (str): Tên collection
+        profile_name (str): Profile được yêu cầu
+        keep_existing (bool): True khi giữ collection cũ (incremental/chạy tiếp): index đã tạo
+                              không đổi được nên dùng lại profile đã lưu
+    """
+    if keep_existing:
+        saved = load_collection_profile(collection_name)
+        if saved is not None:
+            if profile_name and profile_name != saved.get("name"):
+                print(f"Collection '{collection_name}' đã tạo với profile '{saved.get('name')}', bỏ qua profile '{profile_name}'")
+            return saved
+    return get_profile(profile_name)
+
+
+def milvus_kwargs(profile: dict) -> dict:
+    """
+    Tham số khởi tạo langchain_milvus.Milvus theo profile
+    """
+    kwargs = {}
+    metric = profile.get("metric", "L2")
+    if profile.get("index"):
+        kwargs["index_params"] = {"metric_type": metric, **profile["index"]}
+    if profile.get("search"):
+        kwargs["search_params"] = {"metric_type": metric, "params": dict(profile["search"])}
+    if profile.get("partition_key_field"):
+        kwargs["partition_key_field"] = profile["partition_key_field"]
+    return kwargs
+
+
+def local_kwargs(profile: dict) -> dict:
+    """
+    Tham số khởi tạo LocalVectorStore theo profile (metric, nprobe của IVF và lượng tử hóa)
+    """
+    kwargs = {"metric": profile.get("metric", "L2")}
+    nprobe = (profile.get("search") or {}).get("nprobe")
+    if nprobe:
+        kwargs["nprobe"] = nprobe
+    quantization = profile.get("quantization")
+    if quantization:
+        kwargs["quantization"] = quantization["type"]
+        kwargs["dimensions"] = quantization.get("dimensions")
+        kwargs["rescore_factor"] = quantization.get("rescore_factor")
+    return kwargs
+
+
+def create_scalar_indexes(vectorstore, profile: dict) -> None:
+    """
+    Tạo scalar index (INVERTED) trên các trường metadata của profile nếu chưa có
+    Vector store local không cần: điều kiện lọc được cache theo từng biểu thức
+    """
+    col = getattr(vectorstore, "col", None)
+    if col is None or not profile.get("scalar_indexes"):
+        return
+    field_names = {field.name for field in col.schema.fields}
+    indexed = {index.field_name for index in col.indexes}
+    for field in profile["scalar_indexes"]:
+        if field not in field_names or field in indexed:
+            continue
+        try:
+            col.create_index(field_name=field, index_params={"index_type": "INVERTED"}, index_name=f"idx_{field}")
+            print(f"Đã tạo scalar index cho trường '{field}'")
+        except Exception as e:
+            print(f"Không tạo được scalar index cho '{field}': {str(e)}")
+
+
+def filter_expr(metadata_filter: Optional[dict]) -> Optional[str]:
+    """
+    Chuyển điều kiện lọc metadata thành biểu thức Milvus
+    Args:
+        metadata_filter (dict): {trường: giá trị} hoặc {trường: [các giá trị]}
+    Returns:
+        str: Ví dụ 'doc_name == "stack" and language in ["en", "vi"]', None nếu không lọc
+    """
+    if not metadata_filter:
+        return None
+    terms = []
+    for field, value in metadata_filter.items():
+        if isinstance(value, (list, tuple, set)):
+            terms.append(f"{field} in {json.dumps(list(value), ensure_ascii=False)}")
+        else:
+            terms.append(f"{field} == {json.dumps(value, ensure_ascii=False)}")
+    return " and ".join(terms)
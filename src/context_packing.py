@@ -0,0 +1,217 @@
+"""
+Ghép ngữ cảnh cho agent trong giới hạn token (thay cho create_retriever_tool)
+Chức năng:
+- Đếm token bằng tiktoken, giới hạn tổng số token của kết quả tool find_documents
+- Chỉ giữ các câu liên quan tới câu hỏi (kèm vài câu lân cận) thay vì cả chunk 10000 ký tự
+- Loại câu trùng lặp giữa các chunk: phần chồng lấp (chunk_overlap) và menu điều hướng
+  lặp lại trên mọi trang
+- Báo số token tiết kiệm được (print và span 'context.pack' của tracing.py)
+
+Biến môi trường:
+- CONTEXT_MAX_TOKENS: số token tối đa của ngữ cảnh gửi cho LLM
+- CONTEXT_WINDOW: số câu lân cận giữ lại mỗi bên của một câu liên quan
+"""
+
+import os
+import re
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+import tracing
+from bm25_index import tokenize
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))
+CONTEXT_WINDOW = int(os.getenv("CONTEXT_WINDOW", "1"))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "cl100k_base")
+
+# Tách câu theo dấu kết thúc câu hoặc xuống dòng (menu/danh sách mỗi mục một dòng)
+_SENTENCE_RE = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(CONTEXT_ENCODING)
+    except Exception as e:
+        # tiktoken tải bảng mã ở lần dùng đầu tiên; không có mạng thì ước lượng theo số ký tự
+        print(f"Không tải được bảng mã tiktoken '{CONTEXT_ENCODING}', ước lượng 4 ký tự/token: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Số token của văn bản theo bảng mã CONTEXT_ENCODING"""
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_sentences(text: str, max_chars: int = 600) -> List[str]:
+    """
+    Tách văn bản thành các câu/dòng khác rỗng; câu dài hơn max_chars (văn bản không có dấu câu)
+    được cắt theo khoảng trắng
+    """
+    sentences = []
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = (sentence or "").strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+@dataclass
+class PackedContext:
+    """
+    Kết quả ghép ngữ cảnh
+    Args:
+        text (str): Ngữ cảnh gửi cho LLM
+        tokens_before (int): Số token nếu gửi nguyên các chunk (như create_retriever_tool)
+        tokens_after (int): Số token của text
+        chunks (int): Số chunk còn đóng góp nội dung
+    """
+    text: str
+    tokens_before: int
+    tokens_after: int
+    chunks: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_before - self.tokens_after, 0)
+
+
+def pack_context(query: str, documents: List[Document], max_tokens: int = CONTEXT_MAX_TOKENS,
+                 window: int = CONTEXT_WINDOW) -> PackedContext:
+    """
+    Chọn các đoạn liên quan nhất của các chunk sao cho tổng số token không vượt max_tokens
+    Args:
+        query (str): Câu hỏi (của tool call)
+        documents (list): Các chunk theo thứ tự độ liên quan của retriever
+        max_tokens (int): Giới hạn token của ngữ cảnh
+        window (int): Số câu lân cận giữ lại mỗi bên của câu khớp với câu hỏi
+    Returns:
+        PackedContext: Ngữ cảnh đã ghép và thống kê token
+    """
+    with tracing.span("context.pack", chunks_in=len(documents), max_tokens=max_tokens) as span:
+        tokens_before = count_tokens("\n\n".join(doc.page_content for doc in documents))
+
+        # Câu của từng chunk, bỏ các câu đã xuất hiện ở chunk xếp hạng cao hơn
+        seen = set()
+        chunk_sentences = []
+        for doc in documents:
+            sentences = []
+            for sentence in split_sentences(doc.page_content):
+                key = _sentence_key(sentence)
+                if key in seen:
+                    continue
+                seen.add(key)
+                sentences.append(sentence)
+            chunk_sentences.append(sentences)
+
+        # Điểm của câu: tổng IDF (tính trên các câu ứng viên) của các từ trong câu hỏi có mặt trong câu
+        query_terms = set(tokenize(query))
+        sentence_terms = [[set(tokenize(sentence)) & query_terms for sentence in sentences] for sentences in chunk_sentences]
+        n_sentences = sum(len(sentences) for sentences in chunk_sentences) or 1
+        df = {}
+        for terms_list in sentence_terms:
+            for terms in terms_list:
+                for term in terms:
+                    df[term] = df.get(term, 0) + 1
+        idf = {term: math.log(1 + n_sentences / count) for term, count in df.items()}
+
+        # Cửa sổ ứng viên: (điểm, thứ tự chunk, câu đầu, câu cuối); chunk xếp trên được ưu tiên nhẹ
+        windows = []
+        for rank, (sentences, terms_list) in enumerate(zip(chunk_sentences, sentence_terms)):
+            matched = False
+            for i, terms in enumerate(terms_list):
+                score = sum(idf[term] for term in terms)
+                if score > 0:
+                    matched = True
+                    windows.append((score / (1 + 0.1 * rank), rank, max(i - window, 0), min(i + window, len(sentences) - 1)))
+            if not matched and sentences:
+                # Chunk được tìm thấy nhờ vector search (không trùng từ khóa): giữ phần mở đầu
+                windows.append((0.0, rank, 0, min(2 * window, len(sentences) - 1)))
+
+        headers = []
+        for doc in documents:
+            source = doc.metadata.get("title") or doc.metadata.get("source")
+            headers.append(f"[{source}]\n" if source else "")
+
+        # Chọn câu theo điểm giảm dần cho tới khi hết ngân sách token
+        # (mỗi câu tính thêm 1 token xuống dòng, mỗi cửa sổ thêm 1 token cho dấu '…', mỗi chunk thêm dòng nguồn)
+        selected = [set() for _ in chunk_sentences]
+        used = 0
+        for _, rank, first, last in sorted(windows, key=lambda item: (-item[0], item[1])):
+            new = [i for i in range(first, last + 1) if i not in selected[rank]]
+            if not new:
+                continue
+            cost = sum(count_tokens(chunk_sentences[rank][i]) + 1 for i in new) + 1
+            if not selected[rank]:
+                cost += count_tokens(headers[rank]) + 1
+            if used + cost > max_tokens:
+                continue
+            selected[rank].update(new)
+            used += cost
+
+        # Ghép lại theo thứ tự chunk và thứ tự câu gốc; các đoạn không liền nhau nối bằng '…'
+        parts = []
+        for header, sentences, indexes in zip(headers, chunk_sentences, selected):
+            if not indexes:
+                continue
+            lines, previous = [], None
+            for i in sorted(indexes):
+                if previous is not None and i != previous + 1:
+                    lines.append("…")
+                lines.append(sentences[i])
+                previous = i
+            parts.append(header + "\n".join(lines))
+
+        text = "\n\n".join(parts)
+        packed = PackedContext(text=text, tokens_before=tokens_before, tokens_after=count_tokens(text), chunks=len(parts))
+        span.set(chunks=packed.chunks, tokens_before=packed.tokens_before, tokens_after=packed.tokens_after)
+    print(f"Context: {packed.tokens_before} → {packed.tokens_after} token (tiết kiệm {packed.tokens_saved}), {packed.chunks}/{len(documents)} chunk")
+    return packed
+
+
+class ContextToolInput(BaseModel):
+    query: str = Field(description="query to look up in retriever")
+
+
+def create_context_tool(retriever, name: str, description: str, max_tokens: int = CONTEXT_MAX_TOKENS) -> StructuredTool:
+    """
+    Tạo tool tìm kiếm cho agent (cùng giao diện với create_retriever_tool) nhưng trả về ngữ cảnh
+    đã rút gọn trong giới hạn max_tokens
+    Args:
+        retriever: Retriever (HybridRetriever...)
+        name (str): Tên tool
+        description (str): Mô tả tool cho LLM
+        max_tokens (int): Giới hạn token của kết quả tool
+    """
+    def find(query: str) -> str:
+        return pack_context(query, retriever.invoke(query), max_tokens).text
+
+    async def afind(query: str) -> str:
+        return pack_context(query, await retriever.ainvoke(query), max_tokens).text
+
+    return StructuredTool.from_function(
+        func=find,
+        coroutine=afind,
+        name=name,
+        description=description,
+        args_schema=ContextToolInput
+    )
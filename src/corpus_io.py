@@ -0,0 +1,116 @@
+"""
+Đọc/ghi corpus dạng streaming
+Chức năng:
+- Định dạng JSONL: mỗi dòng một bản ghi {'page_content': ..., 'metadata': {...}}
+- Đọc tuần tự (không load cả file) cả file JSONL lẫn file JSON array cũ trong src/data
+- Ghi từng bản ghi một từ iterator/generator, ghi ra file tạm rồi đổi tên
+- Thư mục .snap: snapshot nhị phân memory-map (xem snapshot.py)
+"""
+
+import os
+import json
+from typing import Iterable, Iterator
+
+from snapshot import CorpusSnapshot, is_snapshot, write_snapshot
+
+_READ_CHUNK = 1 << 16
+
+
+def _iter_json_array(file) -> Iterator[dict]:
+    """
+    Đọc từng phần tử của một JSON array mà không parse cả file
+    Args:
+        file: File text đã mở, vị trí đọc ở ngay sau dấu '['
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    while True:
+        # Bỏ khoảng trắng và dấu phẩy giữa các phần tử
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if not buffer and not eof:
+            chunk = file.read(_READ_CHUNK)
+            if not chunk:
+                eof = True
+            buffer += chunk
+            continue
+        if buffer.startswith("]") or (eof and not buffer):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Phần tử chưa đọc đủ: đọc thêm rồi thử lại
+            chunk = file.read(_READ_CHUNK)
+            if not chunk:
+                eof = True
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+def iter_corpus(file_path: str) -> Iterator[dict]:
+    """
+    Đọc tuần tự các bản ghi của corpus
+    Args:
+        file_path (str): File .jsonl, file JSON array (định dạng cũ) hoặc thư mục snapshot .snap
+    Yields:
+        dict: Bản ghi {'page_content': ..., 'metadata': {...}}
+    """
+    if is_snapshot(file_path):
+        yield from CorpusSnapshot(file_path)
+        return
+    with open(file_path, "r", encoding="utf-8") as file:
+        # Nhận dạng định dạng theo ký tự đầu tiên khác khoảng trắng
+        first = file.read(1)
+        while first and first.isspace():
+            first = file.read(1)
+        if first == "[":
+            yield from _iter_json_array(file)
+            return
+        file.seek(0)
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_corpus(records: Iterable[dict], file_path: str, embeddings=None, model_name: str = None) -> int:
+    """
+    Ghi corpus từ một iterator bản ghi
+    Args:
+        records (Iterable[dict]): Các bản ghi {'page_content': ..., 'metadata': {...}}
+        file_path (str): File đích; đuôi .jsonl ghi JSONL, đuôi .snap ghi snapshot nhị phân,
+                         đuôi khác ghi JSON array như trước
+        embeddings: Chỉ dùng với .snap: model để tính sẵn embeddings lưu kèm snapshot
+        model_name (str): Chỉ dùng với .snap: tên model lưu trong manifest
+    Returns:
+        int: Số bản ghi đã ghi
+    """
+    if file_path.endswith(".snap"):
+        return write_snapshot(records, file_path, embeddings=embeddings, model_name=model_name)
+
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    count = 0
+    tmp_path = file_path + ".tmp"
+    jsonl = file_path.endswith(".jsonl")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        if not jsonl:
+            file.write("[")
+        for record in records:
+            if jsonl:
+                file.write(json.dumps(record, ensure_ascii=False))
+                file.write("\n")
+            else:
+                # Giữ định dạng indent=4 của các file JSON array hiện có
+                item = json.dumps(record, indent=4).replace("\n", "\n    ")
+                file.write(("," if count else "") + "\n    " + item)
+            count += 1
+        if not jsonl:
+            file.write("\n]" if count else "]")
+    os.replace(tmp_path, file_path)
+    return count
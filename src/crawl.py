@@ -1,43 +1,91 @@
 import os
-import re
-import json
-from langchain_community.document_loaders import RecursiveUrlLoader, WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from bs4 import BeautifulSoup
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from crawler import iter_crawl, FetchedPage
+from corpus_io import write_corpus
+from embedding_cache import embedding_model_name
+import tracing
+from dedup import DEDUP_ENABLED, strip_boilerplate, drop_near_duplicates
+from extractors import bs4_full, extract_html, get_extractor_pool, resolve_extractor
 
 load_dotenv()
+
 def bs4_extractor(html: str) -> str:
     """
-    Hàm trích xuất và làm sạch nội dung từ HTML
+    Hàm trích xuất và làm sạch nội dung từ HTML (toàn bộ văn bản trang, extractor 'bs4')
     Args:
         html: Chuỗi HTML cần xử lý
     Returns:
-        str: Văn bản đã được làm sạch, loại bỏ các thẻ HTML và khoảng trắng thừa
+        str: Văn bản đã được làm sạch, loại bỏ các thẻ HTML và khoảng trắng thừa,
+             mỗi thẻ khối (đoạn văn, mục menu...) trên một dòng
+    """
+    return bs4_full(html)[0]
+
+def _to_document(page: FetchedPage, text: str, extracted: dict) -> Document:
+    # Metadata như RecursiveUrlLoader: source, content_type rồi title, description, language của trang
+    return Document(page_content=text, metadata={"source": page.url, "content_type": page.content_type, **extracted})
+
+def page_to_document(page: FetchedPage, extractor: str = None) -> Document:
+    """
+    Chuyển một trang đã tải thành Document (trích xuất ngay trong thread hiện tại)
+    Args:
+        page (FetchedPage): Trang do crawler trả về
+        extractor (str): Tên extractor (extractors.EXTRACTORS), mặc định HTML_EXTRACTOR
+    Returns:
+        Document: Nội dung đã làm sạch cùng metadata source, content_type, title, description, language
+    """
+    return _to_document(page, *extract_html(page.html, resolve_extractor(extractor)))
+
+def iter_documents(pages, extractor: str = None, workers: int = None):
+    """
+    Chuyển dần các trang do crawler trả về thành Document, trích xuất song song trên process pool
+    Args:
+        pages: Các FetchedPage (ví dụ từ iter_crawl)
+        extractor (str): Tên extractor, mặc định HTML_EXTRACTOR
+        workers (int): Số worker process, mặc định EXTRACT_WORKERS
+    Returns:
+        Iterator: Document theo đúng thứ tự trang
     """
-    soup = BeautifulSoup(html, "html.parser")  # Phân tích cú pháp HTML
-    return re.sub(r"\n\n+", "\n\n", soup.text).strip()  # Xóa khoảng trắng và dòng trống thừa
+    for page, text, extracted in get_extractor_pool(extractor, workers).map(pages):
+        yield _to_document(page, text, extracted)
 
-def crawl_web(url_data):
+@tracing.traced("crawl.web")
+def crawl_web(url_data, max_depth: int = 4, max_pages: int = 1000, **crawler_kwargs):
     """
     Hàm crawl dữ liệu từ URL với chế độ đệ quy
     Args:
         url_data (str): URL gốc để bắt đầu crawl
+        max_depth (int): Độ sâu tối đa
+        max_pages (int): Số trang tối đa được tải
+        **crawler_kwargs: Tham số khác cho crawler.AsyncCrawler (concurrency, max_bytes, cache_dir...)
     Returns:
         list: Danh sách các Document object, mỗi object chứa nội dung đã được chia nhỏ
               và metadata tương ứng
     """
-    # Tạo loader với độ sâu tối đa là 4 cấp
-    loader = RecursiveUrlLoader(url=url_data, extractor=bs4_extractor, max_depth=4)
-    docs = loader.load()  # Tải nội dung
+    # Crawl song song (giới hạn theo host), trang không đổi được lấy từ cache HTTP;
+    # nội dung trang được trích xuất trên process pool trong lúc crawler tải tiếp
+    docs = list(iter_documents(iter_crawl(url_data, max_depth=max_depth, max_pages=max_pages, **crawler_kwargs)))
     print('length: ', len(docs))  # In số lượng tài liệu đã tải
+
+    # Sắp theo URL: trong các chunk gần trùng, chunk của URL nhỏ nhất được giữ dù crawler trả trang theo thứ tự nào
+    docs.sort(key=lambda doc: doc.metadata.get('source') or '')
+
+    # Xóa menu/header/footer lặp lại trên nhiều trang (đã có đủ mọi trang nên thống kê một lần)
+    if DEDUP_ENABLED:
+        docs = strip_boilerplate(docs)
     
     # Chia nhỏ văn bản thành các đoạn 10000 ký tự, với 500 ký tự chồng lấp
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=500)
     all_splits = text_splitter.split_documents(docs)
+    # Bỏ các chunk gần trùng nhau (trang in, bản sao của cùng nội dung ở URL khác...)
+    if DEDUP_ENABLED:
+        all_splits = list(drop_near_duplicates(all_splits))
     print('length_all_splits: ', len(all_splits))  # In số lượng đoạn văn bản sau khi chia
+    tracing.set_attributes(pages=len(docs), chunks=len(all_splits))
     return all_splits
 
+@tracing.traced("crawl.web_base_loader")
 def web_base_loader(url_data):
     """
     Hàm tải dữ liệu từ một URL đơn (không đệ quy)
@@ -46,6 +94,8 @@ def web_base_loader(url_data):
     Returns:
         list: Danh sách các Document object đã được chia nhỏ
     """
+    # Import khi dùng: langchain_community.document_loaders tải chậm và in cảnh báo USER_AGENT lúc import
+    from langchain_community.document_loaders import WebBaseLoader
     loader = WebBaseLoader(url_data)  # Tạo loader cơ bản
     docs = loader.load()  # Tải nội dung
     print('length: ', len(docs))  # In số lượng tài liệu
@@ -55,27 +105,25 @@ def web_base_loader(url_data):
     all_splits = text_splitter.split_documents(docs)
     return all_splits
 
-def save_data_locally(documents, filename, directory):
+@tracing.traced("crawl.save")
+def save_data_locally(documents, filename, directory, embeddings=None):
     """
-    Lưu danh sách documents vào file JSON
+    Lưu danh sách documents vào file corpus (ghi dần từng document)
     Args:
-        documents (list): Danh sách các Document object cần lưu
-        filename (str): Tên file JSON (ví dụ: 'data.json')
+        documents (Iterable): Các Document object cần lưu (list hoặc generator)
+        filename (str): Tên file; đuôi .jsonl ghi mỗi dòng một document, đuôi .json ghi JSON array,
+                        đuôi .snap ghi snapshot nhị phân (xem snapshot.py)
         directory (str): Đường dẫn thư mục lưu file
+        embeddings: Chỉ dùng với .snap: model embeddings để lưu kèm embeddings tính sẵn
     Returns:
         None: Hàm không trả về giá trị, chỉ lưu file và in thông báo
     """
-    # Tạo thư mục nếu chưa tồn tại
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
     file_path = os.path.join(directory, filename)  # Tạo đường dẫn đầy đủ
 
-    # Chuyển đổi documents thành định dạng có thể serialize
-    data_to_save = [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents]
-    # Lưu vào file JSON
-    with open(file_path, 'w') as file:
-        json.dump(data_to_save, file, indent=4)
+    # Chuyển đổi documents thành định dạng có thể serialize và ghi tuần tự (thư mục được tạo nếu chưa có)
+    records = ({'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents)
+    model_name = embedding_model_name(embeddings) if embeddings is not None else None
+    write_corpus(records, file_path, embeddings=embeddings, model_name=model_name)
     print(f'Data saved to {file_path}')  # In thông báo lưu thành công
 
 def main():
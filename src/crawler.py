@@ -0,0 +1,383 @@
+"""
+Crawler bất đồng bộ (asyncio + aiohttp) dùng cho crawl.crawl_web
+Chức năng:
+- Giới hạn số request đồng thời trên mỗi host, dùng chung connection pool
+- Chuẩn hóa URL và loại trùng, chỉ đi theo link nằm dưới URL gốc (như RecursiveUrlLoader)
+- Giới hạn tổng số trang và tổng số byte tải về
+- Chỉ trả về trang HTML: bỏ PDF, ảnh, file nén... (theo Content-Type và đuôi URL như RecursiveUrlLoader)
+- Cache HTTP trên đĩa theo ETag/Last-Modified: lần crawl sau chỉ tải lại trang đã thay đổi
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from langchain_core.utils.html import SUFFIXES_TO_IGNORE
+
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(".cache", "http"))
+
+_HREF_RE = re.compile(r"""<a\s[^>]*?href\s*=\s*["']([^"'#][^"']*)["']""", re.IGNORECASE)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """
+    Chuẩn hóa URL để loại trùng
+    Args:
+        url (str): URL (tuyệt đối hoặc tương đối)
+        base (str): URL trang chứa link, dùng để giải URL tương đối
+    Returns:
+        str: URL đã bỏ fragment, hạ chữ thường scheme/host, bỏ port mặc định,
+             sắp xếp query; None nếu không phải http(s)
+    """
+    if base:
+        url = urljoin(base, url)
+    url, _ = urldefrag(url.strip())
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS:
+        return None
+    host = (parts.hostname or "").lower()
+    if not host:
+        return None
+    netloc = host if parts.port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path) or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def is_ignored_url(url: str) -> bool:
+    """URL trỏ tới file không phải trang web (ảnh, PDF, file nén, css/js...), không cần tải"""
+    return urlsplit(url).path.lower().endswith(SUFFIXES_TO_IGNORE)
+
+
+def is_html(content_type: str) -> bool:
+    """Response là trang HTML/XHTML (thiếu Content-Type thì coi là HTML như trình duyệt)"""
+    return not content_type or "html" in content_type.lower()
+
+
+def extract_links(html: str, base_url: str) -> list:
+    """
+    Lấy các link <a href> trong trang (regex, không dựng cây DOM để không chặn event loop)
+    """
+    links = []
+    for href in _HREF_RE.findall(html):
+        if href.startswith(("mailto:", "javascript:", "tel:")):
+            continue
+        normalized = normalize_url(href, base_url)
+        if normalized:
+            links.append(normalized)
+    return links
+
+
+@dataclass
+class FetchedPage:
+    """
+    Một trang đã tải
+    Args:
+        url (str): URL đã chuẩn hóa
+        html (str): Nội dung trang đã giải mã
+        content_type (str): Header Content-Type
+        status (int): HTTP status của response (304 nếu lấy từ cache)
+        depth (int): Độ sâu tính từ URL gốc
+        from_cache (bool): True nếu server trả 304 và nội dung lấy từ cache trên đĩa
+    """
+    url: str
+    html: str
+    content_type: str
+    status: int
+    depth: int
+    from_cache: bool = False
+
+
+class HttpCache:
+    """
+    Cache response HTTP trên đĩa: <sha256(url)>.json chứa header, <sha256(url)>.body chứa nội dung
+    Args:
+        directory (str): Thư mục lưu cache
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json"), os.path.join(self.directory, key + ".body")
+
+    def get(self, url: str) -> Optional[Tuple[dict, bytes]]:
+        """Trả về (header đã lưu, body) hoặc None nếu chưa có"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(body_path, "rb") as file:
+                return meta, file.read()
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, meta: dict, body: bytes) -> None:
+        """Ghi (ghi file tạm rồi đổi tên để không để lại bản ghi dở dang)"""
+        meta_path, body_path = self._paths(url)
+        for path, data, mode in ((body_path, body, "wb"), (meta_path, json.dumps(meta).encode("utf-8"), "wb")):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, mode) as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Header If-None-Match/If-Modified-Since cho request có điều kiện"""
+        cached = self.get(url)
+        if cached is None:
+            return {}
+        meta, _ = cached
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+
+def _decode(body: bytes, content_type: str) -> str:
+    match = re.search(r"charset=([\w-]+)", content_type or "", re.IGNORECASE)
+    encoding = match.group(1) if match else "utf-8"
+    try:
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+class AsyncCrawler:
+    """
+    Crawler đệ quy bất đồng bộ
+    Args:
+        start_url (str): URL gốc; chỉ crawl các URL bắt đầu bằng URL này
+        max_depth (int): Độ sâu tối đa (giống RecursiveUrlLoader, URL gốc có depth 0)
+        max_pages (int): Số trang tối đa được tải
+        max_bytes (int): Tổng số byte tối đa được tải
+        per_host_concurrency (int): Số request đồng thời tối đa trên mỗi host
+        total_concurrency (int): Số request đồng thời tối đa (kích thước connection pool)
+        timeout (float): Timeout mỗi request (giây)
+        cache_dir (str): Thư mục cache HTTP; None để tắt cache
+        respect_robots (bool): Tuân theo robots.txt của host
+    """
+
+    def __init__(self, start_url: str, max_depth: int = 4, max_pages: int = 1000, max_bytes: int = 200 * 1024 * 1024,
+                 per_host_concurrency: int = 4, total_concurrency: int = 16, timeout: float = 30.0,
+                 cache_dir: Optional[str] = HTTP_CACHE_DIR, respect_robots: bool = True):
+        self.start_url = normalize_url(start_url)
+        if self.start_url is None:
+            raise ValueError(f"URL không hợp lệ: '{start_url}'")
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.per_host_concurrency = per_host_concurrency
+        self.total_concurrency = total_concurrency
+        self.timeout = timeout
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.respect_robots = respect_robots
+        self.user_agent = os.getenv("USER_AGENT", "rag-starter-crawler/1.0")
+        self.stats = {"pages": 0, "bytes": 0, "cache_hits": 0, "skipped": 0, "errors": 0, "elapsed_s": 0.0}
+
+        self._seen = set()
+        self._host_semaphores = {}
+        self._robots = {}
+
+    def _in_scope(self, url: str) -> bool:
+        return url.startswith(self.start_url.rstrip("/"))
+
+    def _budget_left(self) -> bool:
+        return self.stats["pages"] < self.max_pages and self.stats["bytes"] < self.max_bytes
+
+    async def _allowed(self, session: aiohttp.ClientSession, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._robots:
+            parser = RobotFileParser()
+            try:
+                async with session.get(origin + "/robots.txt") as response:
+                    parser.parse((await response.text()).splitlines() if response.status == 200 else [])
+            except Exception:
+                # Lỗi kết nối, timeout, robots.txt sai charset...: coi như không có robots.txt
+                parser.parse([])
+            self._robots[origin] = parser
+        return self._robots[origin].can_fetch(self.user_agent, url)
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, depth: int) -> Optional[FetchedPage]:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+
+        async with semaphore:
+            for conditional in (True, False):
+                headers = self.cache.conditional_headers(url) if self.cache and conditional else {}
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    if response.status == 304:
+                        cached = self.cache.get(url) if self.cache else None
+                        if cached is None:
+                            # Bản cache bị xóa sau khi gửi request có điều kiện: tải lại không kèm header
+                            continue
+                        meta, body = cached
+                        self.stats["cache_hits"] += 1
+                        return FetchedPage(url, _decode(body, meta.get("content_type", "")), meta.get("content_type", ""), 304, depth, True)
+                    if response.status >= 400:
+                        return None
+                    content_type = response.headers.get("Content-Type", "")
+                    if not is_html(content_type):
+                        # PDF, ảnh, file nén...: không đọc body, không giải mã thành văn bản để embed
+                        self.stats["skipped"] += 1
+                        return None
+                    body = await response.read()
+                    break
+            else:
+                return None  # Server trả 304 cả khi không có header điều kiện
+
+        self.stats["bytes"] += len(body)
+        if self.cache:
+            self.cache.put(url, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": content_type,
+                "fetched_at": time.time(),
+            }, body)
+        return FetchedPage(url, _decode(body, content_type), content_type, response.status, depth)
+
+    async def iter_pages(self) -> AsyncIterator[FetchedPage]:
+        """
+        Crawl và trả về từng trang ngay khi tải xong (thứ tự không cố định)
+        """
+        start = time.perf_counter()
+        frontier = asyncio.Queue()
+        results = asyncio.Queue(maxsize=self.total_concurrency * 2)
+        done = object()
+
+        self._seen.add(self.start_url)
+        frontier.put_nowait((self.start_url, 0))
+
+        connector = aiohttp.TCPConnector(limit=self.total_concurrency, limit_per_host=self.per_host_concurrency, ttl_dns_cache=300)
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout, headers={"User-Agent": self.user_agent}) as session:
+
+            async def worker():
+                while True:
+                    url, depth = await frontier.get()
+                    try:
+                        if not self._budget_left() or not await self._allowed(session, url):
+                            continue
+                        self.stats["pages"] += 1
+                        page = await self._fetch(session, url, depth)
+                        if page is None:
+                            continue
+                        if depth < self.max_depth and "html" in page.content_type:
+                            for link in extract_links(page.html, page.url):
+                                if link not in self._seen and self._in_scope(link) and not is_ignored_url(link):
+                                    self._seen.add(link)
+                                    frontier.put_nowait((link, depth + 1))
+                        await results.put(page)
+                    except Exception as e:
+                        # Mọi lỗi của một URL chỉ bỏ qua URL đó: worker chết thì frontier.join() không bao giờ xong
+                        self.stats["errors"] += 1
+                        print(f"Lỗi khi tải {url}: {e!r}")
+                    finally:
+                        frontier.task_done()
+
+            async def supervisor():
+                await frontier.join()
+                await results.put(done)
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.total_concurrency)]
+            watcher = asyncio.create_task(supervisor())
+            try:
+                while True:
+                    page = await results.get()
+                    if page is done:
+                        break
+                    yield page
+            finally:
+                for task in [*workers, watcher]:
+                    task.cancel()
+                await asyncio.gather(*workers, watcher, return_exceptions=True)
+                self.stats["elapsed_s"] = time.perf_counter() - start
+
+    async def crawl(self) -> list:
+        """Crawl toàn bộ và trả về danh sách FetchedPage"""
+        return [page async for page in self.iter_pages()]
+
+
+def iter_crawl(start_url: str, buffer_size: int = 32, **kwargs) -> Iterator[FetchedPage]:
+    """
+    Bản đồng bộ của AsyncCrawler.iter_pages cho code không dùng asyncio
+    Event loop chạy trong thread riêng; khi hàng đợi đầy (bên tiêu thụ xử lý chậm) crawler tạm dừng nhận trang mới
+    Args:
+        start_url (str): URL gốc
+        buffer_size (int): Số trang tối đa chờ trong hàng đợi
+        **kwargs: Tham số cho AsyncCrawler
+    Yields:
+        FetchedPage: Từng trang đã tải
+    """
+    crawler = AsyncCrawler(start_url, **kwargs)
+    pages = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(page) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def produce():
+        loop = asyncio.get_running_loop()
+        crawled = crawler.iter_pages()
+        try:
+            async for page in crawled:
+                # Chờ chỗ trống trên thread khác, event loop vẫn chạy: request đang tải đọc xong bình thường
+                # (không hết timeout), worker chỉ dừng ở hàng đợi kết quả có giới hạn của iter_pages (backpressure)
+                if not await loop.run_in_executor(None, put, page):
+                    break
+        finally:
+            # Đóng generator (hủy các worker, đóng session) ngay trong event loop này
+            await crawled.aclose()
+
+    def run():
+        try:
+            asyncio.run(produce())
+            pages.put(done)
+        except BaseException as e:
+            pages.put(e)
+
+    thread = threading.Thread(target=run, name="crawler", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Giải phóng chỗ trong hàng đợi để thread crawler thoát được
+        while thread.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        print(f"Crawl stats: {crawler.stats}")
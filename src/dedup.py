@@ -0,0 +1,317 @@
+"""
+Loại nội dung lặp lại khi nạp dữ liệu (trước bước embed)
+Chức năng:
+- Phát hiện khối văn bản (dòng) lặp lại trên nhiều trang như menu điều hướng, header, footer
+  và xóa khỏi nội dung trang
+- Bỏ các chunk gần trùng nhau (near-duplicate) bằng MinHash + LSH trên shingle từ
+- Dùng cho crawl_web (biết trước mọi trang) và pipeline crawl live (học boilerplate trên các trang có
+  URL nhỏ nhất rồi cố định, lưu lại cho các lần crawl sau); seed từ file chỉ bỏ chunk gần trùng (chunk
+  đã lưu không phải trang web, dòng lặp lại giữa các chunk thường là nội dung thật: công thức, tiêu đề mục...)
+- Kết quả không phụ thuộc thứ tự crawler trả trang: trong các chunk gần trùng, chunk của URL nhỏ nhất
+  được giữ (crawl lại site không đổi cho ra đúng các chunk cũ)
+
+Biến môi trường:
+- DEDUP_ENABLED=0 để tắt
+- DEDUP_THRESHOLD: độ tương đồng Jaccard ước lượng để coi hai chunk là trùng
+- BOILERPLATE_MIN_PAGES: số trang tối thiểu một dòng phải xuất hiện để bị coi là boilerplate
+- BOILERPLATE_SAMPLE_PAGES: số trang (URL nhỏ nhất) dùng để học boilerplate trong pipeline crawl live
+"""
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import tracing
+from bm25_index import tokenize
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") != "0"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_SAMPLE_PAGES = int(os.getenv("BOILERPLATE_SAMPLE_PAGES", "50"))
+
+# Số nguyên tố lớn hơn 2^32 cho họ hàm băm (a * x + b) mod p của MinHash
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def _block_key(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+class BoilerplateDetector:
+    """
+    Đếm số trang chứa từng dòng; dòng xuất hiện trên ít nhất min_pages trang và ít nhất
+    min_fraction số trang đã thấy là boilerplate
+    Args:
+        min_pages (int): Số trang tối thiểu
+        min_fraction (float): Tỉ lệ trang tối thiểu (tránh xóa nhầm khi đã thấy rất nhiều trang)
+    Chú ý:
+        - Sau freeze(), tập dòng boilerplate cố định: kết quả strip của một trang không còn phụ thuộc
+          vào thứ tự các trang đến sau (crawl song song trả trang theo thứ tự khác nhau mỗi lần)
+    """
+
+    def __init__(self, min_pages: int = BOILERPLATE_MIN_PAGES, min_fraction: float = 0.3):
+        self.min_pages = min_pages
+        self.min_fraction = min_fraction
+        self.pages = 0
+        self.counts = Counter()
+        self.lines: Optional[set] = None  # Tập dòng boilerplate sau freeze()
+
+    @property
+    def frozen(self) -> bool:
+        return self.lines is not None
+
+    def observe(self, text: str) -> None:
+        """Ghi nhận các dòng của một trang (mỗi dòng đếm một lần cho mỗi trang)"""
+        self.pages += 1
+        self.counts.update({_block_key(line) for line in text.splitlines() if line.strip()})
+
+    def fit(self, texts: Iterable[str]) -> "BoilerplateDetector":
+        for text in texts:
+            self.observe(text)
+        return self
+
+    def freeze(self) -> "BoilerplateDetector":
+        """Cố định tập dòng boilerplate theo các trang đã thấy, bỏ bảng đếm"""
+        self.lines = {key for key in self.counts if self.is_boilerplate(key)}
+        self.counts = Counter()
+        return self
+
+    def is_boilerplate(self, line: str) -> bool:
+        if self.lines is not None:
+            return _block_key(line) in self.lines
+        count = self.counts.get(_block_key(line), 0)
+        return count >= self.min_pages and count >= self.min_fraction * self.pages
+
+    def strip(self, text: str) -> str:
+        """Xóa các dòng boilerplate, gộp các dòng trống liên tiếp"""
+        lines = [line for line in text.splitlines() if not (line.strip() and self.is_boilerplate(line))]
+        return re.sub(r"\n\n+", "\n\n", "\n".join(lines)).strip()
+
+    def save(self, path: str) -> None:
+        """Lưu tập dòng boilerplate đã cố định (JSON)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"pages": self.pages, "lines": sorted(self.lines or ())}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BoilerplateDetector"]:
+        """
+        Returns:
+            BoilerplateDetector: Detector đã cố định, None nếu chưa có file
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        detector = cls()
+        detector.pages = data["pages"]
+        detector.lines = set(data["lines"])
+        return detector
+
+
+class NearDuplicateFilter:
+    """
+    Lọc văn bản gần trùng bằng MinHash, tìm ứng viên bằng LSH (chia chữ ký thành các band)
+    Args:
+        threshold (float): Jaccard ước lượng tối thiểu để coi là trùng
+        num_perm (int): Số hàm băm của chữ ký MinHash
+        bands (int): Số band của LSH (num_perm phải chia hết cho bands)
+        shingle_size (int): Số từ của mỗi shingle
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._signatures = []
+        self._keys = []
+        self._alive = []
+        self._buckets: Dict[tuple, List[int]] = {}
+
+    def __len__(self) -> int:
+        return sum(self._alive)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Chữ ký MinHash của văn bản, None nếu văn bản không có từ nào"""
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        size = min(self.shingle_size, len(tokens))
+        shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        # (a * x + b) mod p với x < 2^32, a < 2^32: không tràn uint64 (trừ phần cộng b, chấp nhận được với hàm băm)
+        permuted = (hashes[:, None] * self._a[None, :] + self._b[None, :]) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, text: str) -> bool:
+        """
+        Thêm văn bản nếu chưa có văn bản gần trùng (giữ bản thêm trước)
+        Returns:
+            bool: True nếu giữ lại, False nếu là bản gần trùng của văn bản đã thêm
+        """
+        return self.offer(text)[0]
+
+    def offer(self, text: str, key=None) -> Tuple[bool, list]:
+        """
+        Thêm văn bản; trong các văn bản gần trùng, văn bản có key nhỏ nhất được giữ
+        Args:
+            text (str): Văn bản
+            key: Khóa so sánh được (ví dụ (URL, vị trí)); None để giữ bản thêm trước như add()
+        Returns:
+            tuple: (giữ lại hay không, key của các văn bản đã giữ trước đó nay bị văn bản này thay thế)
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return True, []
+        band_keys = self._band_keys(signature)
+        candidates = sorted({index for band_key in band_keys for index in self._buckets.get(band_key, ())})
+        matches = [
+            index for index in candidates
+            if self._alive[index] and np.mean(self._signatures[index] == signature) >= self.threshold
+        ]
+        if matches and (key is None or any(self._keys[index] is None or self._keys[index] <= key for index in matches)):
+            return False, []
+        for index in matches:
+            self._alive[index] = False
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(key)
+        self._alive.append(True)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(index)
+        return True, [self._keys[index] for index in matches]
+
+
+class IngestDeduplicator:
+    """
+    Gộp hai bước cho các trang đi qua từng trang một (pipeline crawl live)
+    Args:
+        boilerplate (BoilerplateDetector): Bộ phát hiện boilerplate (đã cố định nếu lấy từ lần crawl trước)
+        near_duplicates (NearDuplicateFilter): Bộ lọc chunk gần trùng
+        sample_pages (int): Số trang (URL nhỏ nhất) dùng để học boilerplate khi detector chưa cố định
+    """
+
+    def __init__(self, boilerplate: Optional[BoilerplateDetector] = None,
+                 near_duplicates: Optional[NearDuplicateFilter] = None,
+                 sample_pages: int = BOILERPLATE_SAMPLE_PAGES):
+        self.boilerplate = boilerplate if boilerplate is not None else BoilerplateDetector()
+        self.near_duplicates = near_duplicates if near_duplicates is not None else NearDuplicateFilter()
+        self.sample_pages = sample_pages
+        self.stats = {"boilerplate_chars": 0, "near_duplicates": 0, "chunks_kept": 0}
+        # ID các chunk đã giữ nhưng sau đó bị chunk gần trùng của URL nhỏ hơn thay thế (cần xóa khi ghi xong)
+        self.superseded_ids = set()
+
+    def clean_page(self, document: Document) -> Document:
+        """Xóa các dòng boilerplate của trang (detector phải đã cố định)"""
+        content = self.boilerplate.strip(document.page_content)
+        self.stats["boilerplate_chars"] += len(document.page_content) - len(content)
+        return Document(page_content=content, metadata=document.metadata)
+
+    def clean_pages(self, documents: Iterable[Document], save_path: Optional[str] = None,
+                    stop_event=None) -> Iterator[Document]:
+        """
+        Làm sạch dần các trang
+        Args:
+            documents: Các trang (Document có metadata 'source')
+            save_path (str): Nơi lưu tập boilerplate sau khi học
+            stop_event (threading.Event): Đã đặt khi documents kết thúc thì không lưu tập boilerplate
+        Chú ý:
+            - Detector đã cố định (lần crawl trước): trả về từng trang ngay
+            - Chưa cố định: các trang được ghi tạm ra đĩa tới khi hết, học boilerplate trên sample_pages
+              trang có URL nhỏ nhất (không phụ thuộc thứ tự crawler trả trang), cố định rồi mới trả về
+        """
+        if self.boilerplate.frozen:
+            for document in documents:
+                yield self.clean_page(document)
+            return
+        with tempfile.TemporaryFile() as spill:
+            offsets = []
+            for document in documents:
+                offsets.append((document.metadata.get("source") or "", len(offsets), spill.tell()))
+                spill.write(json.dumps({"page_content": document.page_content, "metadata": document.metadata},
+                                       ensure_ascii=False).encode("utf-8") + b"\n")
+
+            def read(offset: int) -> Document:
+                spill.seek(offset)
+                return Document(**json.loads(spill.readline()))
+
+            sample = sorted(offsets)[:self.sample_pages]
+            self.boilerplate.fit(read(offset).page_content for _, _, offset in sample).freeze()
+            print(f"Boilerplate: {len(self.boilerplate.lines)} dòng lặp lại trên {len(sample)} trang")
+            if save_path and sample and not (stop_event is not None and stop_event.is_set()):
+                self.boilerplate.save(save_path)
+            for _, _, offset in offsets:
+                yield self.clean_page(read(offset))
+
+    def keep_chunk(self, document: Document, chunk_id: Optional[str] = None) -> bool:
+        """
+        False nếu chunk gần trùng với một chunk đã giữ
+        Args:
+            document (Document): Chunk
+            chunk_id (str): ID của chunk; khi có, chunk có (source, start_index) nhỏ nhất được giữ và
+                            ID của chunk đã giữ bị thay thế được thêm vào superseded_ids
+        """
+        key = None
+        if chunk_id is not None:
+            key = (document.metadata.get("source") or "", document.metadata.get("start_index") or 0, chunk_id)
+        kept, replaced = self.near_duplicates.offer(document.page_content, key)
+        if not kept:
+            self.stats["near_duplicates"] += 1
+            return False
+        self.superseded_ids.update(replaced_key[-1] for replaced_key in replaced)
+        self.stats["chunks_kept"] += 1 - len(replaced)
+        self.stats["near_duplicates"] += len(replaced)
+        return True
+
+    def report(self) -> None:
+        tracing.set_attributes(**{f"dedup_{key}": value for key, value in self.stats.items()})
+        print(f"Dedup stats: {self.stats}")
+
+
+def strip_boilerplate(documents: List[Document], min_pages: int = BOILERPLATE_MIN_PAGES) -> List[Document]:
+    """
+    Xóa boilerplate khi đã có đủ mọi trang (crawl_web): thống kê trên toàn bộ trang rồi mới xóa
+    """
+    detector = BoilerplateDetector(min_pages=min_pages).fit(doc.page_content for doc in documents)
+    cleaned = [Document(page_content=detector.strip(doc.page_content), metadata=doc.metadata) for doc in documents]
+    removed = sum(len(doc.page_content) for doc in documents) - sum(len(doc.page_content) for doc in cleaned)
+    tracing.set_attributes(dedup_boilerplate_chars=removed)
+    print(f"Boilerplate: đã xóa {removed} ký tự trên {len(documents)} trang")
+    return [doc for doc in cleaned if doc.page_content]
+
+
+def drop_near_duplicates(documents: Iterable[Document], threshold: float = DEDUP_THRESHOLD) -> Iterator[Document]:
+    """
+    Bỏ các chunk gần trùng với chunk đứng trước (đọc dần, giữ bản xuất hiện đầu tiên)
+    """
+    near_duplicates = NearDuplicateFilter(threshold=threshold)
+    dropped = 0
+    for doc in documents:
+        if near_duplicates.add(doc.page_content):
+            yield doc
+        else:
+            dropped += 1
+    tracing.set_attributes(dedup_near_duplicates=dropped)
+    print(f"Near-duplicate: đã bỏ {dropped} chunk")
@@ -0,0 +1,202 @@
+"""
+Cache embeddings trên đĩa dùng chung cho mọi backend (HuggingFace, Ollama, OpenAI)
+Chức năng:
+- Lưu vector theo khóa (tên model, hash văn bản) vào file SQLite local
+- Giới hạn số bản ghi, tự xóa các bản ghi lâu không dùng nhất (LRU)
+- Gom các văn bản chưa có trong cache thành một lần gọi model duy nhất
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite giới hạn số tham số trong một câu lệnh, chia nhỏ các truy vấn IN (...)
+_SQL_BATCH = 500
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """
+    Tạo tên định danh cho model embeddings (dùng làm namespace trong cache)
+    Args:
+        embeddings (Embeddings): Đối tượng embeddings của LangChain
+    Returns:
+        str: Ví dụ 'HuggingFaceEmbeddings:sentence-transformers/all-MiniLM-L6-v2'
+    """
+    underlying = getattr(embeddings, "underlying", None)
+    if underlying is not None:
+        # CachedEmbeddings: dùng tên của model thật bên trong
+        return embedding_model_name(underlying)
+    model = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or ""
+    return f"{type(embeddings).__name__}:{model}"
+
+
+class EmbeddingCache:
+    """
+    Kho lưu vector embeddings trong SQLite với giới hạn kích thước
+    Args:
+        path (str): Đường dẫn file SQLite
+        max_entries (int): Số bản ghi tối đa, vượt quá sẽ xóa bản ghi ít được truy cập gần đây nhất
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str, kind: str = "document") -> str:
+        """
+        Tạo khóa cache từ tên model, loại embedding (document/query) và hash văn bản
+        """
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model_name}|{kind}|{text_hash}"
+
+    def get_many(self, keys: List[str]) -> dict:
+        """
+        Tra cứu nhiều khóa cùng lúc
+        Returns:
+            dict: {key: list[float]} cho các khóa có trong cache
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(unique_keys), _SQL_BATCH):
+                batch = unique_keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    # Cập nhật thời điểm truy cập để phục vụ eviction LRU
+                    hit_keys = [row[0] for row in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [now, *hit_keys]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: dict) -> None:
+        """
+        Ghi nhiều vector vào cache rồi xóa bớt bản ghi cũ nếu vượt giới hạn
+        Args:
+            items (dict): {key: list[float]}
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Xóa các bản ghi truy cập lâu nhất khi số bản ghi vượt max_entries"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một đối tượng Embeddings bất kỳ, chỉ gọi model cho các văn bản chưa có trong cache
+    Args:
+        underlying (Embeddings): Model embeddings thật (HuggingFace, Ollama, OpenAI...)
+        cache (EmbeddingCache): Kho cache dùng chung, mặc định dùng file EMBEDDING_CACHE_PATH
+        model_name (str): Namespace trong cache, mặc định lấy từ embedding_model_name()
+    """
+
+    def __init__(self, underlying: Embeddings, cache: Optional[EmbeddingCache] = None, model_name: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache if cache is not None else get_default_cache()
+        self.model_name = model_name or embedding_model_name(underlying)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Gom các văn bản chưa có (loại trùng) thành một batch duy nhất
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        tracing.add_count("embedding_cache_hits", len(texts) - len(missing))
+        tracing.add_count("embedding_cache_misses", len(missing))
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, text, kind="query")
+        found = self.cache.get_many([key])
+        if key in found:
+            self.hits += 1
+            tracing.add_count("embedding_cache_hits")
+            return found[key]
+        self.misses += 1
+        tracing.add_count("embedding_cache_misses")
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> EmbeddingCache:
+    """
+    Trả về EmbeddingCache dùng chung trong tiến trình (khởi tạo lần đầu khi cần)
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
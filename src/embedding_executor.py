@@ -0,0 +1,228 @@
+"""
+Bộ thực thi embedding theo batch, song song, dùng chung cho seed_milvus và seed_milvus_live
+Chức năng:
+- Tra cache embeddings trước, chỉ embed các văn bản chưa có
+- Sắp xếp văn bản theo độ dài để giảm padding, gom batch theo ngân sách token
+- Model local (HuggingFace) chạy trên process pool nhiều nhân
+- Backend qua mạng (OpenAI, Ollama) chạy với số request đồng thời giới hạn, retry + backoff khi bị rate limit,
+  lỗi 5xx hoặc lỗi kết nối tạm thời (các lỗi khác như sai API key, request không hợp lệ raise ngay)
+- Tự giảm kích thước batch khi gặp lỗi hết bộ nhớ/quá lớn
+- Báo thông lượng (chunk/giây)
+"""
+
+import os
+import time
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from embedding_cache import CachedEmbeddings
+
+# Ngân sách token mặc định cho một batch theo backend
+DEFAULT_TOKEN_BUDGET = {"hf": 16384, "ollama": 8192, "openai": 250000}
+# Dưới ngưỡng này embed ngay trong tiến trình hiện tại, không khởi động process pool
+INLINE_THRESHOLD = 256
+# Lỗi kết nối/timeout của các client HTTP (requests, httpx, openai) nhận theo tên lớp,
+# không import thư viện của backend không dùng tới
+_TRANSIENT_ERROR_NAMES = {
+    "RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "TransportError", "ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout",
+}
+
+_worker_embeddings = None
+
+
+def _init_worker(model_name: str, torch_threads: int) -> None:
+    """Khởi tạo model HuggingFace một lần trong mỗi worker process"""
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    _worker_embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_in_worker(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _is_resource_error(error: Exception) -> bool:
+    """Lỗi do batch quá lớn (hết bộ nhớ, vượt giới hạn token của request)"""
+    message = str(error).lower()
+    return isinstance(error, MemoryError) or "out of memory" in message or "maximum context" in message or "too large" in message
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """
+    Lỗi nên thử lại: rate limit (429), lỗi server (5xx), timeout hoặc mất kết nối
+    Chú ý: kiểm tra cả các lỗi gốc (__cause__/__context__) vì client thường bọc lỗi của thư viện HTTP
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, "status_code", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status in (408, 429) or status >= 500
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        if any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class EmbeddingExecutor:
+    """
+    Args:
+        embeddings: Model embeddings (có thể là CachedEmbeddings)
+        backend (str): 'hf', 'ollama' hoặc 'openai'
+        model (str): Tên model (dùng để load model trong worker process với backend 'hf')
+        token_budget (int): Số token tối đa trong một batch
+        max_batch_size (int): Số văn bản tối đa trong một batch
+        processes (int): Số worker process cho backend 'hf'
+        concurrency (int): Số request đồng thời cho backend qua mạng
+        max_retries (int): Số lần thử lại mỗi batch
+    Chú ý: preferred_batch_size là số chunk nên gửi trong một lần gọi embed_documents (pipeline crawl
+    gom chunk theo số này): vượt INLINE_THRESHOLD để dùng process pool và đủ chia nhiều batch chạy song song
+    """
+
+    def __init__(self, embeddings, backend: str, model: str, token_budget: Optional[int] = None,
+                 max_batch_size: int = 256, processes: Optional[int] = None, concurrency: int = 4,
+                 max_retries: int = 5):
+        if isinstance(embeddings, CachedEmbeddings):
+            self.cache, self.cache_name, self.embeddings = embeddings.cache, embeddings.model_name, embeddings.underlying
+        else:
+            self.cache, self.cache_name, self.embeddings = None, None, embeddings
+        self.backend = backend
+        self.model = model
+        self.token_budget = token_budget or DEFAULT_TOKEN_BUDGET.get(backend, 8192)
+        self.max_batch_size = max_batch_size
+        self.processes = processes or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.preferred_batch_size = 2 * max(max_batch_size, INLINE_THRESHOLD)
+        self.stats = {"chunks": 0, "cache_hits": 0, "batches": 0, "retries": 0, "seconds": 0.0, "chunks_per_sec": 0.0}
+        self._process_pool = None
+        self._thread_pool = None
+        self._encoding = None
+
+    def _count_tokens(self, text: str) -> int:
+        if self.backend == "openai":
+            if self._encoding is None:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # Ước lượng ~4 ký tự/token cho model local, tránh tải tokenizer chỉ để đếm
+        return len(text) // 4 + 1
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Chia chỉ số văn bản thành các batch; văn bản đã sắp theo độ dài nên mỗi batch có độ dài gần nhau
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches, current, current_tokens = [], [], 0
+        for i in order:
+            tokens = self._count_tokens(texts[i])
+            # Ngân sách tính theo token dài nhất × số văn bản (mỗi văn bản bị pad tới độ dài đó)
+            if current and (len(current) >= self.max_batch_size or max(current_tokens, tokens) * (len(current) + 1) > self.token_budget):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens = max(current_tokens, tokens)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_remote(self, texts: List[str]) -> List[List[float]]:
+        """Gọi backend qua mạng với retry + exponential backoff (có jitter)"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if _is_resource_error(e) and len(texts) > 1:
+                    middle = len(texts) // 2
+                    return self._embed_remote(texts[:middle]) + self._embed_remote(texts[middle:])
+                if attempt == self.max_retries or not _is_transient_error(e):
+                    raise
+                self.stats["retries"] += 1
+                delay = min(60.0, (2 ** attempt) + random.random())
+                print(f"Lỗi khi embed ({e!r}), thử lại sau {delay:.1f}s")
+                time.sleep(delay)
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.processes)
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model, torch_threads)
+            )
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embedding")
+        return self._thread_pool
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        batches = self._make_batches(texts)
+        self.stats["batches"] += len(batches)
+        results = [None] * len(texts)
+
+        if self.backend == "hf" and len(texts) > INLINE_THRESHOLD and self.processes > 1:
+            futures = [(batch, self._get_process_pool().submit(_embed_in_worker, [texts[i] for i in batch])) for batch in batches]
+        elif self.backend == "hf":
+            futures = [(batch, None) for batch in batches]
+        else:
+            futures = [(batch, self._get_thread_pool().submit(self._embed_remote, [texts[i] for i in batch])) for batch in batches]
+
+        for batch, future in futures:
+            vectors = future.result() if future is not None else self.embeddings.embed_documents([texts[i] for i in batch])
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed danh sách văn bản (giữ nguyên thứ tự), dùng được thay cho Embeddings.embed_documents
+        """
+        start = time.perf_counter()
+        use_cache = self.cache is not None
+        keys = [self.cache.make_key(self.cache_name, text) for text in texts] if use_cache else []
+        found = self.cache.get_many(keys) if use_cache else {}
+
+        # Loại trùng các văn bản chưa có trong cache trước khi embed
+        missing = {}
+        for i, text in enumerate(texts):
+            key = keys[i] if use_cache else i
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = dict(zip(missing.keys(), self._compute(list(missing.values()))))
+            if use_cache:
+                self.cache.put_many(computed)
+            found.update(computed)
+
+        elapsed = time.perf_counter() - start
+        self.stats["chunks"] += len(texts)
+        self.stats["cache_hits"] += len(texts) - len(missing)
+        self.stats["seconds"] += elapsed
+        self.stats["chunks_per_sec"] = self.stats["chunks"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+        if texts:
+            print(f"Embedded {len(texts)} chunks ({len(missing)} mới) trong {elapsed:.2f}s - {len(texts) / max(elapsed, 1e-9):.1f} chunks/s")
+        return [found[keys[i] if use_cache else i] for i in range(len(texts))]
+
+    def shutdown(self) -> None:
+        """Dừng các worker process/thread"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
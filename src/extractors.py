@@ -0,0 +1,310 @@
+"""
+Trích xuất nội dung trang HTML cho crawler (thay cho bs4 html.parser chạy trên thread crawl)
+Chức năng:
+- Các extractor thay thế được cho nhau:
+  - 'bs4': toàn bộ văn bản của trang bằng BeautifulSoup html.parser (như crawl.bs4_extractor trước đây)
+  - 'bs4-main': chỉ nội dung chính, bỏ các cây con nav/header/footer/aside/script... (html.parser)
+  - 'lxml': như 'bs4-main' nhưng dùng parser C của lxml, nhanh hơn nhiều lần
+- Nội dung chính: thẻ <main>/<article>/role="main" dài nhất nếu có, nếu không thì cả <body>
+- Trích xuất song song trên process pool (đọc dần trang từ crawler, giữ đúng thứ tự, giới hạn
+  số trang đang xử lý), báo số trang/giây
+
+Biến môi trường:
+- HTML_EXTRACTOR: extractor mặc định ('lxml'; chưa cài lxml thì dùng 'bs4-main')
+- EXTRACT_WORKERS: số worker process, 0 để trích xuất ngay trong thread crawl
+"""
+
+import os
+import re
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import registry
+
+# Tên cấu hình, được kiểm tra (và thay bằng 'bs4-main' nếu chưa cài lxml) khi tạo ExtractorPool
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "lxml")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(max(0, min(4, (os.cpu_count() or 1) - 1)))))
+
+# Thẻ khối: xuống dòng sau mỗi thẻ để menu, header, footer thành các dòng riêng (dedup.py nhận ra
+# dòng lặp lại giữa các trang); thẻ inline (a, span, code...) vẫn nằm cùng dòng với đoạn văn
+BLOCK_TAGS = [
+    "p", "div", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6", "nav", "header", "footer",
+    "section", "article", "aside", "main", "table", "tr", "pre", "blockquote", "dt", "dd", "form"
+]
+# Thẻ không bao giờ chứa văn bản hiển thị
+SKIP_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "canvas"]
+# Thẻ bố cục (menu, thanh bên, chân trang) bị bỏ khi chỉ lấy nội dung chính; <header> trong
+# <article> thường chứa tiêu đề bài nên chỉ bị bỏ khi không tìm thấy vùng nội dung chính
+LAYOUT_TAGS = ["nav", "footer", "aside"]
+LAYOUT_ROLES = ["navigation", "banner", "contentinfo", "complementary", "search"]
+# Vùng nội dung chính ngắn hơn ngưỡng này (ký tự) thì dùng cả <body>
+MIN_MAIN_CHARS = 200
+
+_WHITESPACE_RE = re.compile(r"[ \t\r]*\n\s*")
+# Khai báo XML đầu trang XHTML: lxml không nhận chuỗi str có khai báo encoding (ValueError)
+_XML_DECLARATION_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+Metadata = Dict[str, str]
+
+
+def _clean(text: str) -> str:
+    """Xóa khoảng trắng và dòng trống thừa"""
+    return _WHITESPACE_RE.sub("\n", text).strip()
+
+
+def bs4_full(html: str) -> Tuple[str, Metadata]:
+    """
+    Toàn bộ văn bản của trang (BeautifulSoup html.parser), mỗi thẻ khối trên một dòng
+    Returns:
+        tuple: (văn bản, metadata title/description/language)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = _bs4_metadata(soup)
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    _bs4_mark_blocks(soup)
+    return _clean(soup.text), metadata
+
+
+def bs4_main(html: str) -> Tuple[str, Metadata]:
+    """
+    Nội dung chính của trang bằng BeautifulSoup html.parser (dùng khi chưa cài lxml)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = _bs4_metadata(soup)
+    for tag in soup(SKIP_TAGS):
+        tag.decompose()
+    node = _bs4_main_node(soup)
+    layout = LAYOUT_TAGS if node is not None else LAYOUT_TAGS + ["header"]
+    node = node if node is not None else (soup.body or soup)
+    for tag in node.find_all(layout) + node.find_all(attrs={"role": LAYOUT_ROLES}):
+        tag.decompose()
+    _bs4_mark_blocks(node)
+    return _clean(node.get_text()), metadata
+
+
+def _bs4_metadata(soup) -> Metadata:
+    metadata = {}
+    if soup.title and soup.title.string:
+        metadata["title"] = soup.title.get_text()
+    description = soup.find("meta", attrs={"name": "description"})
+    if description and description.get("content"):
+        metadata["description"] = description.get("content")
+    html_tag = soup.find("html")
+    if html_tag and html_tag.get("lang"):
+        metadata["language"] = html_tag.get("lang")
+    return metadata
+
+
+def _bs4_mark_blocks(soup) -> None:
+    for tag in soup.find_all("br"):
+        tag.replace_with("\n")
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_after("\n")
+
+
+def _bs4_main_node(soup):
+    candidates = soup.find_all(["main", "article"]) + soup.find_all(attrs={"role": "main"})
+    best = max(candidates, key=lambda tag: len(tag.get_text()), default=None)
+    if best is None or len(best.get_text().strip()) < MIN_MAIN_CHARS:
+        return None
+    return best
+
+
+def lxml_main(html: str) -> Tuple[str, Metadata]:
+    """
+    Nội dung chính của trang bằng lxml (parser C)
+    """
+    import lxml.html
+    from lxml.etree import ParserError
+
+    try:
+        root = lxml.html.document_fromstring(_XML_DECLARATION_RE.sub("", html, count=1))
+    except ParserError:
+        return "", {}  # Trang rỗng hoặc chỉ có khoảng trắng
+    metadata = {}
+    title = root.findtext(".//title")
+    if title:
+        metadata["title"] = title
+    description = root.xpath("//meta[@name='description']/@content")
+    if description and description[0]:
+        metadata["description"] = description[0]
+    if root.get("lang"):
+        metadata["language"] = root.get("lang")
+
+    _lxml_drop(root.iter(*SKIP_TAGS))
+    candidates = root.xpath("//main | //article | //*[@role='main']")
+    node = max(candidates, key=lambda element: len(element.text_content()), default=None)
+    if node is None or len(node.text_content().strip()) < MIN_MAIN_CHARS:
+        node = root.find("body") if root.find("body") is not None else root
+        layout = LAYOUT_TAGS + ["header"]
+    else:
+        layout = LAYOUT_TAGS
+    roles = " or ".join(f"@role='{role}'" for role in LAYOUT_ROLES)
+    _lxml_drop(list(node.iter(*layout)) + node.xpath(f".//*[{roles}]"))
+
+    for element in node.iter("br", *BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    return _clean(node.text_content()), metadata
+
+
+def _lxml_drop(elements) -> None:
+    # drop_tree giữ lại phần văn bản đứng sau thẻ (tail); bỏ qua thẻ đã bị xóa cùng thẻ cha
+    for element in list(elements):
+        if element.getparent() is not None:
+            element.drop_tree()
+
+
+EXTRACTORS: Dict[str, Callable[[str], Tuple[str, Metadata]]] = {
+    "bs4": bs4_full,
+    "bs4-main": bs4_main,
+    "lxml": lxml_main,
+}
+
+
+@lru_cache(maxsize=1)
+def _lxml_available() -> bool:
+    try:
+        import lxml.html  # noqa: F401
+        return True
+    except ImportError:
+        print("Chưa cài lxml, dùng extractor 'bs4-main' (pip install lxml để trích xuất nhanh hơn)")
+        return False
+
+
+def resolve_extractor(name: Optional[str] = None) -> str:
+    """
+    Tên extractor sẽ dùng: 'lxml' khi chưa cài lxml được thay bằng 'bs4-main'
+    """
+    name = name or HTML_EXTRACTOR
+    if name not in EXTRACTORS:
+        raise ValueError(f"Extractor không hợp lệ: '{name}'. Hỗ trợ: {', '.join(EXTRACTORS)}")
+    if name == "lxml" and not _lxml_available():
+        return "bs4-main"
+    return name
+
+
+def extract_html(html: str, name: str) -> Tuple[str, Metadata]:
+    """Trích xuất một trang (chạy trong worker process hoặc ngay trong tiến trình hiện tại)"""
+    return EXTRACTORS[name](html)
+
+
+class ExtractorPool:
+    """
+    Trích xuất các trang do crawler trả về trên process pool
+    Args:
+        extractor (str): Tên extractor trong EXTRACTORS
+        workers (int): Số worker process, 0 để trích xuất ngay trong thread gọi
+        max_pending (int): Số trang tối đa đang chờ trích xuất (giới hạn bộ nhớ khi crawler nhanh hơn)
+    """
+
+    def __init__(self, extractor: str = HTML_EXTRACTOR, workers: int = EXTRACT_WORKERS, max_pending: Optional[int] = None):
+        self.extractor = resolve_extractor(extractor)
+        self.workers = workers
+        self.max_pending = max_pending or 4 * max(workers, 1)
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn như embedding_executor: không sao chép thread của event loop crawl vào worker
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def extract(self, html: str) -> Tuple[str, Metadata]:
+        """Trích xuất ngay trong tiến trình hiện tại; trang làm extractor lỗi được trích xuất lại bằng 'bs4'"""
+        try:
+            return extract_html(html, self.extractor)
+        except Exception as e:
+            return self._fallback(html, e)
+
+    def _fallback(self, html: str, error: Exception) -> Tuple[str, Metadata]:
+        # Một trang lỗi không được làm dừng cả lần crawl
+        print(f"Lỗi khi trích xuất trang bằng '{self.extractor}', dùng 'bs4': {str(error)}")
+        return bs4_full(html)
+
+    def _reset(self, pool: ProcessPoolExecutor) -> None:
+        # Worker chết (hết bộ nhớ, lỗi trong lxml...) làm hỏng cả pool: bỏ pool, lần submit sau tạo pool mới
+        if self._pool is pool:
+            print("Process pool trích xuất bị hỏng, tạo lại pool; các trang đang chờ được trích xuất ngay")
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, html: str):
+        """
+        Gửi trang cho pool
+        Returns:
+            tuple: (future, pool); future là None nếu pool hỏng (trang được trích xuất ngay khi lấy kết quả)
+        """
+        pool = self._get_pool()
+        try:
+            return pool.submit(extract_html, html, self.extractor), pool
+        except BrokenProcessPool:
+            self._reset(pool)
+            return None, pool
+
+    def map(self, pages: Iterable, html_of: Callable = lambda page: page.html) -> Iterator[Tuple[object, str, Metadata]]:
+        """
+        Trích xuất dần các trang theo đúng thứ tự
+        Args:
+            pages: Các trang (ví dụ crawler.FetchedPage) đọc dần từ crawler
+            html_of (Callable): Lấy HTML của một trang
+        Returns:
+            Iterator: (trang, văn bản, metadata); trang lỗi khi trích xuất được trích xuất lại bằng 'bs4',
+                      khi một worker chết (pool hỏng) các trang đang chờ được trích xuất ngay và pool được tạo lại
+        """
+        start = time.perf_counter()
+        count = 0
+        if self.workers <= 0:
+            for page in pages:
+                count += 1
+                yield (page, *self.extract(html_of(page)))
+        else:
+            pending = deque()
+
+            def finish():
+                page, future, pool = pending.popleft()
+                if future is None:
+                    return (page, *self.extract(html_of(page)))
+                try:
+                    return (page, *future.result())
+                except BrokenProcessPool:
+                    self._reset(pool)
+                    return (page, *self.extract(html_of(page)))
+                except Exception as e:
+                    return (page, *self._fallback(html_of(page), e))
+
+            for page in pages:
+                pending.append((page, *self._submit(html_of(page))))
+                count += 1
+                # Trả ngay các trang đầu hàng đã xong, chờ khi số trang đang xử lý đạt giới hạn
+                while pending and (pending[0][1] is None or pending[0][1].done() or len(pending) >= self.max_pending):
+                    yield finish()
+            while pending:
+                yield finish()
+        elapsed = time.perf_counter() - start
+        if count:
+            print(f"Extract: {count} trang trong {elapsed:.2f}s ({count / elapsed:.1f} trang/giây, "
+                  f"'{self.extractor}', {self.workers} worker)")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def get_extractor_pool(extractor: Optional[str] = None, workers: Optional[int] = None) -> ExtractorPool:
+    """
+    ExtractorPool dùng chung trong tiến trình (worker process chỉ khởi động một lần), lưu trong registry
+    """
+    extractor = resolve_extractor(extractor)
+    workers = EXTRACT_WORKERS if workers is None else workers
+    return registry.get_or_create(("extractor_pool", extractor, workers), lambda: ExtractorPool(extractor, workers))
@@ -0,0 +1,269 @@
+"""
+Federated retriever: tìm kiếm đồng thời trên nhiều collection và gộp kết quả
+Chức năng:
+- Nhận danh sách collection (ví dụ 'stack,de_cuong,geography'), mỗi collection dùng hybrid retriever
+  riêng (lưu trong registry, xem agent.get_retriever / local_ollama.get_retriever)
+- Embed câu hỏi đúng một lần cho mỗi model embeddings, dùng chung cho mọi collection cùng model
+- Retriever của từng collection được khởi tạo khi tạo federated retriever (warmup) và trước khi
+  tính giới hạn thời gian: collection vừa seed lại không bị bỏ qua chỉ vì đang kết nối/load BM25
+- Tìm kiếm các collection song song, mỗi collection có giới hạn thời gian: collection chậm
+  (hoặc lỗi kết nối) bị bỏ qua ở lượt này thay vì làm chậm cả lượt chat; collection có lượt tìm
+  trước đã quá hạn mà vẫn chưa xong bị bỏ qua luôn, không chiếm thêm thread của pool
+- Chuẩn hóa điểm trong từng collection (min-max) rồi gộp, tùy chọn xếp hạng lại chung bằng cross-encoder
+- Ghi lại thời gian và trạng thái từng collection, kèm span trong tracing.py
+
+Biến môi trường:
+- FEDERATED_TIMEOUT_S: thời gian tối đa chờ mỗi collection (giây)
+"""
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import registry
+import tracing
+from hybrid_retriever import HybridRetriever, chunk_key
+
+FEDERATED_TIMEOUT_S = float(os.getenv("FEDERATED_TIMEOUT_S", "5"))
+
+# Thread pool riêng (không dùng chung với nhánh BM25 của HybridRetriever để tránh chờ lẫn nhau)
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="federated-retriever")
+
+# Lượt tìm đã quá hạn nhưng thread vẫn đang chạy, theo tên collection (dùng chung mọi federated retriever)
+_stalled: Dict[str, Future] = {}
+_stalled_lock = threading.Lock()
+
+
+def parse_collections(text: str) -> List[str]:
+    """
+    'a, b,,a' -> ['a', 'b']: tách theo dấu phẩy, bỏ tên rỗng và tên lặp lại
+    """
+    names = []
+    for name in (text or "").split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def document_score(doc: Document) -> Optional[float]:
+    """Điểm của chunk trong collection của nó: điểm cross-encoder nếu đã rerank, nếu không thì điểm RRF"""
+    score = doc.metadata.get("rerank_score", doc.metadata.get("rrf_score"))
+    return float(score) if score is not None else None
+
+
+def normalize_scores(documents: List[Document]) -> List[float]:
+    """
+    Chuẩn hóa min-max điểm của các chunk trong một collection về [0, 1]
+    Chunk không có điểm (retriever khác) được chấm theo thứ hạng
+    """
+    scores = [document_score(doc) for doc in documents]
+    if not documents or any(score is None for score in scores):
+        return [1.0 - rank / len(documents) for rank in range(len(documents))]
+    low, high = min(scores), max(scores)
+    if high - low <= 1e-12:
+        return [1.0 for _ in scores]
+    return [(score - low) / (high - low) for score in scores]
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    Retriever tìm kiếm song song trên nhiều collection
+    Args:
+        collection_names (list): Các collection cần tìm
+        retriever_factory (Callable): collection_name -> retriever của collection (gọi mỗi lần tìm kiếm,
+                                      retriever đã lưu trong registry nên chỉ khởi tạo lần đầu)
+        k (int): Số kết quả trả về sau khi gộp
+        timeout_s (float): Thời gian tối đa chờ mỗi collection (tính từ lúc đã có retriever của mọi collection)
+        reranker: CrossEncoderReranker; nếu có, rerank_candidates ứng viên đầu sau khi gộp được chấm điểm
+                  lại chung (điểm cross-encoder so sánh được giữa các collection)
+        rerank_candidates (int): Số ứng viên đưa vào cross-encoder
+    """
+    collection_names: List[str]
+    retriever_factory: Callable[[str], Any]
+    k: int = 8
+    timeout_s: float = FEDERATED_TIMEOUT_S
+    reranker: Any = None
+    rerank_candidates: int = 50
+    last_timings: Dict[str, float] = {}
+    last_status: Dict[str, str] = {}
+
+    def resolve_retrievers(self) -> Dict[str, Any]:
+        """
+        Retriever của từng collection (khởi tạo song song những collection chưa có trong registry)
+        Returns:
+            dict: {collection: retriever hoặc Exception}
+        """
+        context = contextvars.copy_context()
+        futures = {name: _executor.submit(context.copy().run, self.retriever_factory, name) for name in self.collection_names}
+        retrievers = {}
+        for name, future in futures.items():
+            try:
+                retrievers[name] = future.result()
+            except Exception as e:
+                retrievers[name] = e
+        return retrievers
+
+    def _search_collection(self, collection_name: str, retriever, query: str,
+                           embed_once: Callable[[Any], List[float]]) -> Tuple[List[Document], Dict[str, float]]:
+        with tracing.span("federated.collection", collection=collection_name) as span:
+            if not isinstance(retriever, HybridRetriever):
+                # Retriever dự phòng khi lỗi kết nối chỉ chứa thông báo lỗi, không gộp vào kết quả
+                raise RuntimeError(f"Không khởi tạo được retriever cho collection '{collection_name}'")
+            embedding = embed_once(retriever.vectorstore.embeddings)
+            documents, timings = retriever.search_with_timings(query, embedding)
+            span.set(chunks=len(documents))
+            return documents, timings
+
+    def search_with_timings(self, query: str) -> Tuple[List[Document], Dict[str, float]]:
+        """
+        Tìm kiếm trên mọi collection và gộp kết quả
+        Returns:
+            tuple: (danh sách Document có metadata 'collection' và 'federated_score',
+                    {'<collection>_ms', 'resolve_ms', 'embed_ms', 'merge_ms', 'rerank_ms', 'total_ms'})
+        """
+        with tracing.span("federated.search", collections=len(self.collection_names)) as search_span:
+            start = time.perf_counter()
+            # Giới hạn thời gian chỉ tính từ khi đã có retriever của mọi collection
+            retrievers = self.resolve_retrievers()
+            resolved = time.perf_counter()
+            deadline = resolved + self.timeout_s
+            context = contextvars.copy_context()
+
+            # Mỗi model embeddings (cùng một đối tượng trong registry) chỉ embed câu hỏi một lần
+            embed_futures = {}
+            embed_seconds = {}
+            embed_lock = threading.Lock()
+
+            def embed(embeddings) -> List[float]:
+                embed_start = time.perf_counter()
+                with tracing.span("federated.embed"):
+                    vector = embeddings.embed_query(query)
+                embed_seconds[id(embeddings)] = time.perf_counter() - embed_start
+                return vector
+
+            def embed_once(embeddings) -> List[float]:
+                # Thread đầu tiên cần model này tự embed, các collection khác cùng model chờ kết quả
+                with embed_lock:
+                    future = embed_futures.get(id(embeddings))
+                    owner = future is None
+                    if owner:
+                        future = embed_futures[id(embeddings)] = Future()
+                if owner:
+                    try:
+                        future.set_result(embed(embeddings))
+                    except Exception as e:
+                        future.set_exception(e)
+                return future.result()
+
+            def run(collection_name: str):
+                collection_start = time.perf_counter()
+                result = self._search_collection(collection_name, retrievers[collection_name], query, embed_once)
+                return result, time.perf_counter() - collection_start
+
+            timings, status, results = {}, {}, {}
+            futures = {}
+            with _stalled_lock:
+                for name in self.collection_names:
+                    stalled = _stalled.get(name)
+                    if stalled is not None and not stalled.done():
+                        # Lượt tìm trước vẫn treo: không xếp thêm lượt mới (tránh chiếm dần hết thread của pool)
+                        status[name] = "busy"
+                        continue
+                    _stalled.pop(name, None)
+                    futures[name] = _executor.submit(context.copy().run, run, name)
+            for name in status:
+                print(f"Collection '{name}' vẫn đang xử lý lượt tìm trước, bỏ qua")
+
+            for name, future in futures.items():
+                try:
+                    (documents, _), elapsed = future.result(timeout=max(deadline - time.perf_counter(), 0))
+                    results[name] = documents
+                    timings[f"{name}_ms"] = elapsed * 1000
+                    status[name] = "ok"
+                except FutureTimeoutError:
+                    # Không hủy được thread đang chạy: kết quả muộn bị bỏ, retriever vẫn được lưu cho lượt sau
+                    status[name] = "timeout"
+                    with _stalled_lock:
+                        _stalled[name] = future
+                    print(f"Collection '{name}' không trả kết quả sau {self.timeout_s}s, bỏ qua")
+                except Exception as e:
+                    status[name] = "error"
+                    print(f"Lỗi khi tìm trong collection '{name}': {str(e)}")
+
+            merge_start = time.perf_counter()
+            with tracing.span("federated.merge"):
+                merged = []
+                seen = set()
+                for name, documents in results.items():
+                    for rank, (doc, score) in enumerate(zip(documents, normalize_scores(documents))):
+                        key = (name, chunk_key(doc))
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        merged.append((score, rank, Document(
+                            page_content=doc.page_content,
+                            metadata={**doc.metadata, "collection": name, "federated_score": score}
+                        )))
+                merged.sort(key=lambda item: (-item[0], item[1]))
+                limit = self.rerank_candidates if self.reranker is not None else self.k
+                documents = [doc for _, _, doc in merged[:limit]]
+            rerank_start = time.perf_counter()
+            if self.reranker is not None and documents:
+                documents = self.reranker.rerank(query, documents, top_n=self.k)
+            end = time.perf_counter()
+            search_span.set(chunks=len(documents), timeouts=sum(value in ("timeout", "busy") for value in status.values()),
+                            errors=sum(value == "error" for value in status.values()))
+
+        timings.update({
+            "resolve_ms": (resolved - start) * 1000,
+            "embed_ms": sum(embed_seconds.values()) * 1000,
+            "merge_ms": (rerank_start - merge_start) * 1000,
+            "rerank_ms": (end - rerank_start) * 1000,
+            "total_ms": (end - start) * 1000,
+        })
+        self.last_status = status
+        return documents, timings
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents, timings = self.search_with_timings(query)
+        self.last_timings = timings
+        return documents
+
+
+def get_federated_retriever(collection_names: List[str], retriever_factory: Callable[[str, Optional[str], bool], Any],
+                            doc_name: Optional[str] = None, rerank: bool = False) -> FederatedRetriever:
+    """
+    Federated retriever cho nhiều collection, lưu trong registry (invalidate một collection cũng xóa retriever này)
+    Args:
+        collection_names (list): Các collection cần tìm
+        retriever_factory (Callable): (collection_name, doc_name, rerank) -> retriever, ví dụ agent.get_retriever
+        doc_name (str): Chỉ tìm trong chunk của tài liệu này ở mọi collection
+        rerank (bool): Xếp hạng lại chung các ứng viên đã gộp bằng cross-encoder, chỉ giữ 4 chunk tốt nhất
+    Chú ý:
+        - Retriever của từng collection được khởi tạo ngay (warmup của main.py gọi hàm này trên thread nền)
+    """
+    def build():
+        reranker = None
+        if rerank:
+            from reranker import get_reranker
+            reranker = get_reranker()
+        retriever = FederatedRetriever(
+            collection_names=list(collection_names),
+            # Collection con không tự rerank: điểm cross-encoder được tính một lần trên các ứng viên đã gộp
+            retriever_factory=lambda name: retriever_factory(name, doc_name, False),
+            k=4 if rerank else 8,
+            reranker=reranker,
+        )
+        retriever.resolve_retrievers()
+        return retriever
+
+    # Mỗi tên collection là một phần tử của khóa để registry.invalidate(tên) tìm thấy
+    return registry.get_or_create(("federated_retriever", doc_name, rerank, *collection_names), build)
@@ -0,0 +1,151 @@
+"""
+Hybrid retriever: chạy song song vector search (Milvus) và BM25, gộp kết quả bằng weighted RRF
+Chức năng:
+- Embed câu hỏi đúng một lần cho nhánh vector
+- Nhánh BM25 chạy trong thread pool đồng thời với embed + vector search
+- Gộp bằng reciprocal rank fusion có trọng số, loại trùng theo ID chunk
+- Tùy chọn xếp hạng lại bằng cross-encoder: lấy dư ứng viên rồi chỉ giữ k chunk tốt nhất (xem reranker.py)
+- Ghi lại thời gian từng giai đoạn (embed, dense, bm25, fusion, rerank), kèm span trong tracing.py
+"""
+
+import time
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import tracing
+from collection_profiles import filter_expr
+
+# Thread pool dùng chung cho nhánh BM25 của mọi retriever trong tiến trình
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-retriever")
+
+
+def chunk_key(doc: Document) -> str:
+    """
+    Khóa loại trùng của một chunk: ID trong Milvus ('pk'), hoặc hash nội dung nếu không có
+    """
+    pk = doc.metadata.get("pk")
+    if pk is not None:
+        return str(pk)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[List[Document]], weights: Sequence[float], c: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Gộp nhiều danh sách kết quả bằng weighted reciprocal rank fusion
+    Args:
+        ranked_lists: Các danh sách Document đã sắp xếp theo độ liên quan
+        weights: Trọng số của từng danh sách
+        c (int): Hằng số làm mượt của RRF
+    Returns:
+        list: Các cặp (Document, điểm RRF) giảm dần, mỗi chunk xuất hiện một lần
+    """
+    scores = {}
+    documents = {}
+    for docs, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(docs, start=1):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (c + rank)
+            documents.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [(documents[key], scores[key]) for key in ordered]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever kết hợp vector search và BM25, thay cho EnsembleRetriever chạy tuần tự
+    Args:
+        vectorstore: Vector store Milvus (có thuộc tính embeddings)
+        bm25_index: BM25Index của cùng collection
+        k (int): Số kết quả trả về sau khi gộp
+        fetch_k (int): Số kết quả lấy từ mỗi nhánh trước khi gộp
+        weights: Trọng số [vector, bm25] trong RRF
+        metadata_filter (dict): Chỉ tìm trong các chunk có metadata thỏa điều kiện, ví dụ {'doc_name': 'stack'}
+        reranker: CrossEncoderReranker (reranker.py); nếu có, mỗi nhánh lấy rerank_candidates kết quả,
+                  rerank_candidates ứng viên đầu sau khi gộp được chấm điểm lại và chỉ giữ k chunk
+        rerank_candidates (int): Số ứng viên đưa vào cross-encoder
+    """
+    vectorstore: Any
+    bm25_index: Any
+    k: int = 4
+    fetch_k: int = 4
+    weights: List[float] = [0.7, 0.3]
+    rrf_c: int = 60
+    metadata_filter: Dict[str, Any] = {}
+    reranker: Any = None
+    rerank_candidates: int = 50
+    last_timings: Dict[str, float] = {}
+
+    def _bm25_search(self, query: str, fetch_k: int) -> Tuple[List[Document], float]:
+        with tracing.span("retriever.bm25") as span:
+            start = time.perf_counter()
+            mask = self.bm25_index.field_mask(self.metadata_filter) if self.metadata_filter else None
+            docs = [self.bm25_index.get_document(position) for position, _ in self.bm25_index.search(query, fetch_k, mask=mask)]
+            span.set(chunks=len(docs))
+            return docs, time.perf_counter() - start
+
+    def _dense_search(self, embedding: List[float], fetch_k: int) -> List[Document]:
+        expr = filter_expr(self.metadata_filter)
+        kwargs = {"expr": expr} if expr else {}
+        return [doc for doc, _ in self.vectorstore.similarity_search_with_score_by_vector(embedding, k=fetch_k, **kwargs)]
+
+    def search_with_timings(self, query: str, embedding: Optional[List[float]] = None) -> Tuple[List[Document], Dict[str, float]]:
+        """
+        Tìm kiếm và trả về kèm thời gian từng giai đoạn (mili giây)
+        Args:
+            query (str): Câu hỏi
+            embedding (list): Vector câu hỏi đã tính sẵn (ví dụ embed theo batch trong api.py), bỏ qua bước embed
+        Returns:
+            tuple: (danh sách Document, {'embed_ms', 'dense_ms', 'bm25_ms', 'fusion_ms', 'rerank_ms', 'total_ms'})
+        """
+        # Khi rerank, lấy dư ứng viên từ mỗi nhánh (vector search và BM25 vẫn rẻ với vài chục kết quả)
+        fetch_k = max(self.fetch_k, self.rerank_candidates) if self.reranker is not None else self.fetch_k
+        with tracing.span("retriever.search", k=self.k, fetch_k=fetch_k, filtered=bool(self.metadata_filter)) as search_span:
+            start = time.perf_counter()
+            # BM25 chạy trên thread pool trong lúc thread hiện tại embed câu hỏi và gọi Milvus
+            # (chạy trong bản sao ngữ cảnh để span của BM25 nằm trong span tìm kiếm)
+            bm25_future = _executor.submit(contextvars.copy_context().run, self._bm25_search, query, fetch_k)
+
+            embed_start = time.perf_counter()
+            if embedding is None:
+                with tracing.span("retriever.embed"):
+                    embedding = self.vectorstore.embeddings.embed_query(query)
+            dense_start = time.perf_counter()
+            with tracing.span("retriever.dense") as dense_span:
+                dense_docs = self._dense_search(embedding, fetch_k)
+                dense_span.set(chunks=len(dense_docs))
+            dense_end = time.perf_counter()
+
+            bm25_docs, bm25_seconds = bm25_future.result()
+
+            fusion_start = time.perf_counter()
+            with tracing.span("retriever.fusion"):
+                fused = reciprocal_rank_fusion([dense_docs, bm25_docs], self.weights, self.rrf_c)
+                documents = []
+                for doc, score in fused[:self.rerank_candidates if self.reranker is not None else self.k]:
+                    documents.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rrf_score": score}))
+            rerank_start = time.perf_counter()
+            if self.reranker is not None:
+                documents = self.reranker.rerank(query, documents, top_n=self.k)
+            end = time.perf_counter()
+            search_span.set(chunks=len(documents))
+
+        timings = {
+            "embed_ms": (dense_start - embed_start) * 1000,
+            "dense_ms": (dense_end - dense_start) * 1000,
+            "bm25_ms": bm25_seconds * 1000,
+            "fusion_ms": (rerank_start - fusion_start) * 1000,
+            "rerank_ms": (end - rerank_start) * 1000,
+            "total_ms": (end - start) * 1000,
+        }
+        return documents, timings
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents, timings = self.search_with_timings(query)
+        self.last_timings = timings
+        return documents
@@ -0,0 +1,466 @@
+"""
+Hàng đợi job seed dữ liệu chạy nền, tách khỏi thread xử lý request của Streamlit
+Chức năng:
+- Lưu job trong SQLite (bền qua các lần rerun/khởi động lại), nhiều tiến trình cùng đọc/ghi
+- Các worker process lấy job theo thứ tự, mỗi collection chỉ có một job chạy tại một thời điểm
+- Ghi tiến độ (PipelineProgress) và heartbeat; job của worker đã chết được đưa lại vào hàng đợi
+  (seed_milvus_live chạy tiếp từ checkpoint), tối đa JOB_MAX_ATTEMPTS lần rồi chuyển sang failed
+- Hủy job: job đang chờ bị hủy ngay, job đang chạy dừng qua stop_event
+  Chú ý: job không incremental đã xóa dữ liệu cũ (drop_old) khi bắt đầu, hủy giữa chừng để lại
+  collection chỉ có một phần dữ liệu. Job 'live' gửi lại sẽ chạy tiếp từ checkpoint; job 'file'
+  cần gửi lại để seed đầy đủ. Lời nhắc được ghi vào error của job đã hủy
+- Giao diện chỉ gửi job và đọc trạng thái nên chat vẫn phản hồi trong lúc seed
+
+Biến môi trường:
+- JOBS_DB_PATH: file SQLite của hàng đợi
+- JOBS_WORKERS: số worker process Streamlit khởi động (0 để chạy worker riêng bằng `python jobs.py`)
+- JOB_STALE_S: job đang chạy không có heartbeat quá số giây này được coi là của worker đã chết
+- JOB_MAX_ATTEMPTS: số lần tối đa một job được nhận chạy (worker chết giữa chừng mỗi lần tính một lần)
+
+Chạy worker riêng:
+    python jobs.py --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import registry
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(".cache", "jobs.sqlite"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+# Job đang chạy không có heartbeat trong khoảng này được coi là của worker đã chết
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "60"))
+# Job làm chết worker (hết bộ nhớ...) không được đưa lại vào hàng đợi mãi
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+JOB_KINDS = ("file", "live")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class Job:
+    """
+    Một job seed dữ liệu
+    Args:
+        id (str): ID của job
+        kind (str): 'file' (seed_milvus) hoặc 'live' (seed_milvus_live)
+        collection (str): Collection đích, dùng làm khóa: mỗi collection một job chạy
+        params (dict): Tham số truyền cho hàm seed
+        status (str): queued, running, succeeded, failed hoặc cancelled
+        progress (dict): Tiến độ gần nhất (PipelineProgress.to_dict() với job 'live')
+        error (str): Thông báo lỗi nếu thất bại (hoặc lời nhắc khi hủy để lại collection thiếu dữ liệu)
+        attempts (int): Số lần job đã được worker nhận chạy
+    """
+    id: str
+    kind: str
+    collection: str
+    params: dict
+    status: str
+    progress: dict = field(default_factory=dict)
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+    @property
+    def elapsed_s(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self) -> dict:
+        return {**self.__dict__, "done": self.done, "elapsed_s": self.elapsed_s}
+
+
+_COLUMNS = "id, kind, collection, params, status, progress, error, cancel_requested, created_at, started_at, finished_at, attempts"
+
+
+def _row_to_job(row) -> Job:
+    return Job(
+        id=row[0], kind=row[1], collection=row[2], params=json.loads(row[3]), status=row[4],
+        progress=json.loads(row[5]) if row[5] else {}, error=row[6], cancel_requested=bool(row[7]),
+        created_at=row[8], started_at=row[9], finished_at=row[10], attempts=row[11]
+    )
+
+
+class JobStore:
+    """
+    Hàng đợi job trong SQLite; mỗi thao tác mở kết nối riêng nên dùng được từ nhiều thread/tiến trình
+    Args:
+        path (str): Đường dẫn file SQLite
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " collection TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " progress TEXT,"
+                " error TEXT,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " worker TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " heartbeat_at REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi nhận job)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, kind: str, collection: str, **params) -> str:
+        """
+        Thêm job vào hàng đợi
+        Args:
+            kind (str): 'file' hoặc 'live'
+            collection (str): Collection đích
+            **params: Tham số của seed_milvus/seed_milvus_live (trừ collection_name)
+        Returns:
+            str: ID của job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Loại job không hợp lệ: '{kind}'")
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, collection, params, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, collection, json.dumps(params), time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 20, active_only: bool = False) -> List[Job]:
+        """Các job mới nhất trước"""
+        statuses = ACTIVE_STATUSES if active_only else ()
+        where = f"WHERE status IN ({', '.join('?' * len(statuses))})" if statuses else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*statuses, limit)
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Hủy job: job đang chờ chuyển sang cancelled ngay, job đang chạy được báo để worker dừng
+        Returns:
+            bool: False nếu job không tồn tại hoặc đã kết thúc
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ? AND status = 'queued'",
+                (now, job_id)
+            )
+            if cursor.rowcount:
+                return True
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            return bool(cursor.rowcount)
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Nhận job đang chờ lâu nhất mà collection của nó không có job nào đang chạy
+        Args:
+            worker (str): Tên worker nhận job
+        Returns:
+            Job: Job đã chuyển sang running, None nếu không có job phù hợp
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Worker chết giữa chừng: đưa job lại vào hàng đợi, trừ khi đã được yêu cầu hủy
+                # hoặc đã chạy đủ JOB_MAX_ATTEMPTS lần (job làm chết worker sẽ lại làm chết worker khác)
+                conn.execute(
+                    "UPDATE jobs SET"
+                    " status = CASE WHEN cancel_requested = 1 THEN 'cancelled'"
+                    "  WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                    " error = CASE WHEN cancel_requested = 0 AND attempts >= ?"
+                    "  THEN 'Worker dừng đột ngột ' || attempts || ' lần khi chạy job' ELSE error END,"
+                    " worker = NULL,"
+                    " finished_at = CASE WHEN cancel_requested = 1 OR attempts >= ? THEN ? ELSE NULL END"
+                    " WHERE status = 'running' AND heartbeat_at < ?",
+                    (JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, now, now - JOB_STALE_S)
+                )
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE status = 'queued' AND collection NOT IN"
+                    " (SELECT collection FROM jobs WHERE status = 'running')"
+                    " ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, started_at = COALESCE(started_at, ?), heartbeat_at = ?,"
+                    " attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, now, row[0])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = _row_to_job(row)
+        job.status = "running"
+        job.started_at = job.started_at or now
+        job.attempts += 1
+        return job
+
+    def heartbeat(self, job_id: str, progress: Optional[dict] = None) -> bool:
+        """
+        Cập nhật heartbeat (và tiến độ nếu có) của job đang chạy
+        Returns:
+            bool: True nếu job đã được yêu cầu hủy
+        """
+        with self._connect() as conn:
+            if progress is None:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            else:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress), job_id)
+                )
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None, progress: Optional[dict] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, progress = COALESCE(?, progress), finished_at = ? WHERE id = ?",
+                (status, error, json.dumps(progress) if progress is not None else None, time.time(), job_id)
+            )
+
+
+def get_job_store(path: Optional[str] = None) -> JobStore:
+    """JobStore dùng chung trong tiến trình"""
+    path = path or JOBS_DB_PATH
+    return registry.get_or_create(("job_store", path), lambda: JobStore(path))
+
+
+def _cancel_note(job: Job) -> Optional[str]:
+    """
+    Lời nhắc khi job đang chạy bị hủy mà collection chỉ còn một phần dữ liệu
+    Chú ý: job không incremental đã xóa dữ liệu cũ (drop_old) khi bắt đầu nên không khôi phục
+    được collection trước đó; job incremental chỉ thiếu phần chưa cập nhật nên không cần nhắc
+    """
+    if job.params.get("incremental"):
+        return None
+    if job.kind == "live":
+        return (f"Đã hủy giữa chừng: collection '{job.collection}' chỉ có một phần dữ liệu, "
+                "gửi lại job để chạy tiếp từ checkpoint")
+    return (f"Đã hủy giữa chừng: dữ liệu cũ của collection '{job.collection}' đã bị xóa và chỉ có "
+            "một phần dữ liệu mới, gửi lại job để seed đầy đủ")
+
+
+def run_job(store: JobStore, job: Job, heartbeat_interval: float = 1.0) -> str:
+    """
+    Chạy một job trong tiến trình hiện tại
+    Args:
+        store (JobStore): Hàng đợi chứa job
+        job (Job): Job đã nhận bằng claim()
+        heartbeat_interval (float): Chu kỳ heartbeat và kiểm tra yêu cầu hủy (giây)
+    Returns:
+        str: Trạng thái cuối của job
+    """
+    # Import trong worker: tiến trình giao diện không cần load model/kết nối Milvus để gửi job
+    from seed_data import seed_milvus, seed_milvus_live
+
+    stop_event = threading.Event()
+    finished = threading.Event()
+    latest = {}
+
+    def monitor():
+        # Thread riêng: heartbeat cả khi bước seed hiện tại không gọi progress_callback (embed batch lớn...)
+        while not finished.wait(heartbeat_interval):
+            if store.heartbeat(job.id, latest.get("progress")):
+                stop_event.set()
+
+    def on_progress(progress):
+        latest["progress"] = progress.to_dict()
+
+    thread = threading.Thread(target=monitor, daemon=True, name=f"job-{job.id}-monitor")
+    thread.start()
+    print(f"Job {job.id} ({job.kind}) bắt đầu: collection '{job.collection}'")
+    try:
+        if job.kind == "live":
+            seed_milvus_live(
+                collection_name=job.collection, progress_callback=on_progress, stop_event=stop_event, **job.params
+            )
+        else:
+            seed_milvus(collection_name=job.collection, stop_event=stop_event, **job.params)
+        status, error = ("cancelled" if stop_event.is_set() else "succeeded"), None
+    except Exception as e:
+        status, error = ("cancelled", None) if stop_event.is_set() else ("failed", str(e))
+    finally:
+        finished.set()
+        thread.join()
+    if status == "cancelled":
+        error = _cancel_note(job)
+    store.finish(job.id, status, error, latest.get("progress"))
+    print(f"Job {job.id} kết thúc: {status}" + (f" ({error})" if error else ""))
+    return status
+
+
+def worker_loop(path: str = JOBS_DB_PATH, name: Optional[str] = None, poll_interval: float = 1.0,
+                parent_pid: Optional[int] = None) -> None:
+    """
+    Vòng lặp của một worker: nhận và chạy job cho tới khi tiến trình cha kết thúc
+    Args:
+        path (str): File SQLite của hàng đợi
+        name (str): Tên worker (ghi vào job)
+        poll_interval (float): Thời gian chờ khi hàng đợi rỗng (giây)
+        parent_pid (int): Tiến trình cha; worker tự thoát khi tiến trình cha không còn
+    """
+    store = JobStore(path)
+    name = name or f"worker-{os.getpid()}"
+    while parent_pid is None or os.getppid() == parent_pid:
+        try:
+            job = store.claim(name)
+        except sqlite3.Error as e:
+            print(f"Không đọc được hàng đợi job: {str(e)}")
+            job = None
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(store, job)
+
+
+class WorkerPool:
+    """
+    Nhóm worker process (spawn: không kế thừa thread/kết nối của Streamlit)
+    Args:
+        workers (int): Số worker process
+        path (str): File SQLite của hàng đợi
+    """
+
+    def __init__(self, workers: int = JOBS_WORKERS, path: str = JOBS_DB_PATH):
+        self.workers = workers
+        self.path = path
+        self.processes = []
+        self._started = 0
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self) -> "WorkerPool":
+        """Khởi động (hoặc khởi động lại) các worker chưa chạy"""
+        self.processes = [process for process in self.processes if process.is_alive()]
+        while len(self.processes) < self.workers:
+            # Không dùng daemon: worker cần tạo process pool riêng cho embeddings (embedding_executor)
+            process = self._context.Process(
+                target=worker_loop,
+                kwargs={"path": self.path, "name": f"worker-{self._started}", "parent_pid": os.getpid()},
+                name=f"jobs-worker-{self._started}"
+            )
+            process.start()
+            self._started += 1
+            self.processes.append(process)
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
+
+
+def start_workers(workers: int = JOBS_WORKERS, path: Optional[str] = None) -> Optional[WorkerPool]:
+    """
+    Khởi động worker pool một lần trong tiến trình (gọi lại ở mỗi rerun chỉ khởi động lại worker đã chết)
+    Returns:
+        WorkerPool: None nếu workers <= 0 (worker chạy ở tiến trình riêng)
+    """
+    if workers <= 0:
+        return None
+    path = path or JOBS_DB_PATH
+
+    def create():
+        pool = WorkerPool(workers, path).start()
+        # Đăng ký sau khi start (multiprocessing.util đã được import) để chạy trước hàm dọn dẹp
+        # của multiprocessing, vốn chờ các tiến trình con không phải daemon tự kết thúc
+        atexit.register(pool.stop)
+        return pool
+
+    return registry.get_or_create(("job_workers", path), create).start()
+
+
+_acknowledged = set()
+_acknowledged_lock = threading.Lock()
+
+
+def refresh_finished(jobs: List[Job]) -> List[str]:
+    """
+    Xóa retriever/agent trong registry của tiến trình hiện tại cho các collection vừa seed xong
+    (worker chỉ xóa được registry của chính nó)
+    Chú ý: job bị hủy hoặc lỗi sau khi đã bắt đầu chạy cũng đã thay đổi collection (job không
+    incremental đã xóa dữ liệu cũ), chỉ job bị hủy khi còn chờ là không cần làm mới
+    Returns:
+        list: Các collection đã được làm mới
+    """
+    refreshed = []
+    with _acknowledged_lock:
+        for job in jobs:
+            if job.done and job.started_at is not None and job.id not in _acknowledged:
+                _acknowledged.add(job.id)
+                registry.invalidate(job.collection)
+                refreshed.append(job.collection)
+    return refreshed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy worker cho hàng đợi seed dữ liệu")
+    parser.add_argument("--workers", type=int, default=max(JOBS_WORKERS, 1))
+    parser.add_argument("--db", default=JOBS_DB_PATH)
+    args = parser.parse_args()
+    pool = WorkerPool(args.workers, args.db).start()
+    print(f"Đã khởi động {args.workers} worker, hàng đợi: {args.db}")
+    try:
+        while True:
+            time.sleep(5)
+            pool.start()  # Khởi động lại worker bị chết
+    except KeyboardInterrupt:
+        pool.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,64 @@
-from langchain.tools.retriever import create_retriever_tool
-from langchain_ollama import ChatOllama
-from langchain.agents import AgentExecutor, create_openai_functions_agent
+# langchain_ollama, pymilvus và langchain.agents được import trong hàm khi thực sự dùng (khởi động nhanh)
+from context_packing import create_context_tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from seed_data import seed_milvus, connect_to_milvus
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
+import registry
+import tracing
+from hybrid_retriever import HybridRetriever
+from reranker import RERANKER_ENABLED, get_reranker
 from langchain_core.documents import Document
 
 
-def get_retriever(collection_name: str = "data_test") -> EnsembleRetriever:
+def get_retriever(collection_name: str = "data_test", doc_name: str = None, rerank: bool = None) -> HybridRetriever:
     """
-    Tạo một ensemble retriever kết hợp vector search (Milvus) và BM25
+    Tạo một hybrid retriever kết hợp vector search (Milvus) và BM25
     Args:
         collection_name (str): Tên collection trong Milvus để truy vấn
+        doc_name (str): Chỉ tìm trong chunk của tài liệu này (None để tìm toàn collection)
+        rerank (bool): Lấy 50 ứng viên rồi xếp hạng lại bằng cross-encoder, chỉ giữ 4 chunk tốt nhất
+                       (mặc định theo RERANKER_ENABLED, xem reranker.py)
     Returns:
-        EnsembleRetriever: Retriever kết hợp với tỷ trọng:
+        HybridRetriever: Retriever kết hợp (weighted RRF) với tỷ trọng:
             - 70% Milvus vector search (k=4 kết quả)
             - 30% BM25 text search (k=4 kết quả)
     """
-    try:
-        # Kết nối với Milvus và tạo vector retriever
-        vectorstore = connect_to_milvus('http://localhost:19530', collection_name)
-        milvus_retriever = vectorstore.as_retriever(
-            search_type="similarity", 
-            search_kwargs={"k": 4}
-        )
+    if rerank is None:
+        rerank = RERANKER_ENABLED
 
-        # Tạo BM25 retriever từ toàn bộ documents
-        documents = [
-            Document(page_content=doc.page_content, metadata=doc.metadata)
-            for doc in vectorstore.similarity_search("", k=100)
-        ]
+    def build():
+        from seed_data import connect_to_milvus, get_bm25_index
+
+        with tracing.span("retriever.init", collection=collection_name) as span:
+            # Kết nối với Milvus
+            vectorstore = connect_to_milvus('http://localhost:19530', collection_name)
+
+            # Tạo BM25 retriever từ chỉ mục đầy đủ đã lưu trên đĩa lúc seed
+            bm25_index = get_bm25_index(vectorstore, collection_name)
         
-        if not documents:
-            raise ValueError(f"Không tìm thấy documents trong collection '{collection_name}'")
+            span.set(chunks=len(bm25_index))
+            if not len(bm25_index):
+                raise ValueError(f"Không tìm thấy documents trong collection '{collection_name}'")
             
-        bm25_retriever = BM25Retriever.from_documents(documents)
-        bm25_retriever.k = 4
+            # Chạy song song vector search và BM25, gộp bằng weighted RRF với tỷ trọng
+            # Khi rerank: 50 ứng viên được cross-encoder chấm điểm, chỉ 4 chunk tốt nhất vào prompt
+            hybrid_retriever = HybridRetriever(
+                vectorstore=vectorstore,
+                bm25_index=bm25_index,
+                k=4 if rerank else 8,  # Tối đa 8 chunk (4 + 4) như EnsembleRetriever trước đây
+                fetch_k=4,
+                weights=[0.7, 0.3],
+                metadata_filter={"doc_name": doc_name} if doc_name else {},
+                reranker=get_reranker() if rerank else None,
+                rerank_candidates=50
+            )
+            return hybrid_retriever
+
+    try:
+        # Retriever được lưu trong registry theo collection, không tạo lại mỗi lần rerun
+        return registry.get_cached("retriever", collection_name, build, "hf", doc_name, rerank)
 
-        # Kết hợp hai retriever với tỷ trọng
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[milvus_retriever, bm25_retriever],
-            weights=[0.7, 0.3]
-        )
-        return ensemble_retriever
-        
     except Exception as e:
         print(f"Lỗi khi khởi tạo retriever: {str(e)}")
+        from langchain_community.retrievers import BM25Retriever
         # Trả về retriever với document mặc định nếu có lỗi
         default_doc = [
             Document(
@@ -63,8 +73,11 @@ def get_llm_and_agent(retriever):
     """
     Khởi tạo LLM và agent với Ollama
     """
-    # Tạo retriever tool
-    tool = create_retriever_tool(
+    from langchain_ollama import ChatOllama
+    from langchain.agents import AgentExecutor, create_openai_functions_agent
+
+    # Tạo retriever tool (ngữ cảnh rút gọn trong giới hạn token, xem context_packing.py)
+    tool = create_context_tool(
         retriever,
         "find_documents",
         "Search for information of Stack AI."
@@ -91,8 +104,3 @@ def get_llm_and_agent(retriever):
     # Tạo agent
     agent = create_openai_functions_agent(llm=llm, tools=tools, prompt=prompt)
     return AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-
-# Khởi tạo retriever và agent với collection mặc định
-retriever = get_retriever()
-agent_executor = get_llm_and_agent(retriever)
\ No newline at end of file
@@ -0,0 +1,608 @@
+"""
+Vector store chạy trong tiến trình, lưu trên đĩa local (không cần Milvus/etcd/minio)
+Chức năng:
+- Cùng API với langchain_milvus.Milvus mà project dùng: add_embeddings, add_texts, delete,
+  similarity_search*, lọc theo biểu thức metadata kiểu Milvus (expr)
+- Collection nhỏ: brute-force bằng NumPy
+- Collection lớn: chỉ mục IVF (k-means) lưu trên đĩa, chỉ quét các cụm gần câu hỏi nhất
+- Ghi nối (append-only): vectors.f32 + log thao tác ops.jsonl, tự nén lại khi có nhiều bản ghi đã xóa
+- Lượng tử hóa (tùy chọn): giữ trong bộ nhớ mã float16, int8 hoặc nhị phân (có thể chỉ lấy
+  các chiều đầu kiểu Matryoshka), tìm hai pha: quét nhanh trên mã rồi chấm lại chính xác các
+  ứng viên tốt nhất bằng vector đầy đủ đọc từ vectors.f32 (memory-mapped, không nạp vào RAM)
+
+Chọn backend bằng URI 'local://<thư mục>' (xem seed_data.create_vectorstore)
+"""
+
+import os
+import ast
+import json
+import shutil
+import threading
+import numpy as np
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", os.path.join(".cache", "vectors"))
+# Từ số chunk này trở lên thì tìm kiếm qua chỉ mục IVF thay vì brute-force
+IVF_THRESHOLD = int(os.getenv("LOCAL_VECTOR_IVF_THRESHOLD", "100000"))
+
+QUANTIZATIONS = ("none", "float16", "int8", "binary")
+# Số ứng viên chấm lại bằng vector đầy đủ = k * hệ số (mã càng thô càng cần nhiều ứng viên)
+DEFAULT_RESCORE_FACTOR = {"none": 2, "float16": 2, "int8": 4, "binary": 10}
+# Số bit 1 của từng giá trị byte (khoảng cách Hamming của mã nhị phân)
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+# Số hàng chuyển sang float32 mỗi lần khi quét mã float16/int8 (giới hạn bộ nhớ tạm)
+_SCAN_BLOCK = 16384
+
+
+def _compile_expr(expr: str) -> Callable[[dict], bool]:
+    """
+    Biên dịch biểu thức lọc kiểu Milvus thành hàm kiểm tra metadata
+    Hỗ trợ: ==, !=, <, <=, >, >=, in, not in, and/or/not (và &&, ||)
+    Ví dụ: "doc_name == 'stack' and language in ['en', 'vi']"
+    """
+    tree = ast.parse(expr.replace("&&", " and ").replace("||", " or "), mode="eval").body
+    comparisons = {
+        ast.Eq: lambda a, b: a == b,
+        ast.NotEq: lambda a, b: a != b,
+        ast.Lt: lambda a, b: a is not None and a < b,
+        ast.LtE: lambda a, b: a is not None and a <= b,
+        ast.Gt: lambda a, b: a is not None and a > b,
+        ast.GtE: lambda a, b: a is not None and a >= b,
+        ast.In: lambda a, b: a in b,
+        ast.NotIn: lambda a, b: a not in b,
+    }
+
+    def compile_node(node):
+        if isinstance(node, ast.BoolOp):
+            parts = [compile_node(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda metadata: all(part(metadata) for part in parts)
+            return lambda metadata: any(part(metadata) for part in parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = compile_node(node.operand)
+            return lambda metadata: not inner(metadata)
+        if isinstance(node, ast.Compare) and isinstance(node.left, ast.Name) and len(node.ops) == 1:
+            field, compare = node.left.id, comparisons.get(type(node.ops[0]))
+            if compare is not None:
+                value = ast.literal_eval(node.comparators[0])
+                return lambda metadata: compare(metadata.get(field), value)
+        raise ValueError(f"Biểu thức lọc không được hỗ trợ: '{expr}'")
+
+    return compile_node(tree)
+
+
+def _kmeans(data: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means đơn giản bằng NumPy, trả về ma trận tâm cụm"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroids(data, centroids)
+        for cluster in range(n_clusters):
+            members = data[assign == cluster]
+            # Cụm rỗng: lấy ngẫu nhiên một điểm làm tâm mới
+            centroids[cluster] = members.mean(axis=0) if len(members) else data[rng.integers(len(data))]
+    return centroids
+
+
+def _nearest_centroids(data: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+    """Chỉ số tâm cụm gần nhất (L2) của từng vector, tính theo batch để giới hạn bộ nhớ"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    result = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), batch_size):
+        block = data[start:start + batch_size]
+        result[start:start + batch_size] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return result
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store local của một collection
+    Args:
+        embedding_function (Embeddings): Model embeddings dùng cho add_texts/similarity_search
+        collection_name (str): Tên collection (thư mục con trong directory)
+        directory (str): Thư mục gốc chứa các collection
+        drop_old (bool): Xóa dữ liệu cũ của collection
+        metric (str): 'L2' (mặc định, như Milvus), 'IP' hoặc 'COSINE'
+        ivf_threshold (int): Số chunk tối thiểu để dùng chỉ mục IVF
+        nprobe (int): Số cụm IVF được quét mỗi lần tìm kiếm, mặc định 1/8 số cụm (tối thiểu 16)
+        quantization (str): Dạng mã giữ trong bộ nhớ: 'none' (float32 như trước), 'float16',
+                            'int8' (lượng tử hóa vô hướng theo từng vector) hoặc 'binary' (1 bit/chiều)
+        dimensions (int): Chỉ dùng số chiều đầu này cho pha quét (Matryoshka), None để dùng tất cả
+        rescore_factor (int): Số ứng viên chấm lại = k * rescore_factor, mặc định theo DEFAULT_RESCORE_FACTOR
+    Chú ý:
+        - quantization/dimensions được lưu trong manifest khi tạo collection, collection đã có giữ cấu hình cũ
+    """
+
+    # Tên trường giống langchain_milvus để seed_data dùng chung code
+    _primary_field = "pk"
+    _text_field = "text"
+    _vector_field = "vector"
+
+    def __init__(self, embedding_function: Embeddings, collection_name: str = "LangChainCollection",
+                 directory: str = LOCAL_VECTOR_DIR, drop_old: bool = False, metric: str = "L2",
+                 ivf_threshold: int = IVF_THRESHOLD, nprobe: Optional[int] = None, quantization: str = "none",
+                 dimensions: Optional[int] = None, rescore_factor: Optional[int] = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Kiểu lượng tử hóa không hợp lệ: '{quantization}'. Hỗ trợ: {', '.join(QUANTIZATIONS)}")
+        self.embedding_func = embedding_function
+        self.collection_name = collection_name
+        self.path = os.path.join(directory, collection_name)
+        self.metric = metric.upper()
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.dimensions = dimensions
+        self._rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        if drop_old and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    # === LƯU TRỮ ===
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        """Đọc manifest, vectors và phát lại log thao tác"""
+        self.dim = None
+        manifest_path = self._file("manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            self.dim, self.metric = manifest["dim"], manifest.get("metric", self.metric)
+            # Collection tạo trước khi có lượng tử hóa không có các khóa này: float32 đầy đủ
+            self.quantization = manifest.get("quantization", "none")
+            self.dimensions = manifest.get("dimensions")
+
+        self._ids, self._texts, self._metadatas = [], [], []
+        self._id_to_row = {}
+        alive = []
+        if os.path.exists(self._file("ops.jsonl")):
+            with open(self._file("ops.jsonl"), "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dòng cuối ghi dở do tiến trình bị ngắt
+                        break
+                    if op["op"] == "add":
+                        old_row = self._id_to_row.get(op["id"])
+                        if old_row is not None:
+                            alive[old_row] = False
+                        self._id_to_row[op["id"]] = len(self._ids)
+                        self._ids.append(op["id"])
+                        self._texts.append(op["text"])
+                        self._metadatas.append(op["metadata"])
+                        alive.append(True)
+                    else:
+                        for doc_id in op["ids"]:
+                            row = self._id_to_row.pop(doc_id, None)
+                            if row is not None:
+                                alive[row] = False
+
+        rows = len(self._ids)
+        self._size = rows
+        self._full_map = None
+        self._codes, self._norms, self._scales = self._encode(np.zeros((0, self.dim or 0), dtype=np.float32))
+        if self.dim is not None and rows:
+            if self.two_phase:
+                # Chỉ giữ mã trong bộ nhớ, mã hóa dần từng khối của vectors.f32 đã memory-map
+                full = self._full_vectors()
+                parts = [self._encode(np.asarray(full[start:start + _SCAN_BLOCK])) for start in range(0, rows, _SCAN_BLOCK)]
+                self._codes = np.concatenate([part[0] for part in parts])
+                self._norms = np.concatenate([part[1] for part in parts])
+                if self.quantization == "int8":
+                    self._scales = np.concatenate([part[2] for part in parts])
+            else:
+                stored = np.fromfile(self._file("vectors.f32"), dtype=np.float32)
+                # vectors.f32 được ghi trước ops.jsonl: phần dư cuối file thuộc lần ghi bị ngắt
+                self._codes, self._norms, self._scales = self._encode(stored[:rows * self.dim].reshape(rows, self.dim).copy())
+        self._alive = np.asarray(alive, dtype=bool)
+        self._ivf = None
+        self._expr_masks = {}
+        self._load_ivf()
+
+    def _manifest(self) -> dict:
+        return {"dim": self.dim, "metric": self.metric, "quantization": self.quantization, "dimensions": self.dimensions}
+
+    def _write_manifest(self) -> None:
+        with open(self._file("manifest.json"), "w", encoding="utf-8") as file:
+            json.dump(self._manifest(), file)
+
+    # === LƯỢNG TỬ HÓA ===
+    @property
+    def scan_dim(self) -> int:
+        """Số chiều dùng ở pha quét"""
+        return min(self.dimensions or self.dim or 0, self.dim or 0)
+
+    @property
+    def two_phase(self) -> bool:
+        """Tìm hai pha khi mã trong bộ nhớ không phải là vector đầy đủ"""
+        return self.quantization != "none" or (self.dim is not None and self.scan_dim < self.dim)
+
+    @property
+    def rescore_factor(self) -> int:
+        return self._rescore_factor or DEFAULT_RESCORE_FACTOR[self.quantization]
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Mã hóa vectors cho pha quét
+        Returns:
+            tuple: (mã, bình phương chuẩn của phần vector được quét, hệ số giải mã của int8 hoặc None)
+        """
+        truncated = vectors[:, :self.scan_dim]
+        norms = (truncated ** 2).sum(axis=1).astype(np.float32)
+        if self.quantization == "float16":
+            return truncated.astype(np.float16), norms, None
+        if self.quantization == "int8":
+            # Mỗi vector một hệ số: giá trị tuyệt đối lớn nhất ứng với 127
+            scales = np.abs(truncated).max(axis=1, initial=0) / 127
+            scales[scales == 0] = 1
+            codes = np.clip(np.rint(truncated / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, norms, scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(truncated > 0, axis=1), norms, None
+        return np.ascontiguousarray(truncated, dtype=np.float32), norms, None
+
+    def _full_vectors(self) -> np.ndarray:
+        """Vector đầy đủ của mọi hàng: memory-map vectors.f32 khi tìm hai pha, mở lại khi có hàng mới"""
+        if not self.two_phase:
+            return self._codes[:self._size]
+        if self._full_map is None or len(self._full_map) != self._size:
+            self._full_map = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self._size, self.dim))
+        return self._full_map
+
+    def _scan_vectors(self) -> np.ndarray:
+        """Vector float32 trong không gian quét (dựng chỉ mục IVF), đọc dần từ memory-map khi tìm hai pha"""
+        return self._full_vectors()[:, :self.scan_dim]
+
+    def _metric_scores(self, query: np.ndarray, dots: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """Điểm theo metric, nhỏ hơn là gần hơn"""
+        if self.metric == "L2":
+            return norms - 2 * dots + float(query @ query)
+        if self.metric == "COSINE":
+            return -dots / (np.sqrt(norms) * float(np.linalg.norm(query)) + 1e-12)
+        return -dots
+
+    def _approx_scores(self, query: np.ndarray, codes: np.ndarray, norms: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Điểm pha quét trên mã (nhỏ hơn là gần hơn); với 'none' không cắt chiều đây là điểm chính xác
+        """
+        if self.quantization == "binary":
+            # Khoảng cách Hamming giữa bit dấu của câu hỏi và của từng vector
+            query_bits = np.packbits(query > 0)
+            return _POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+        if codes.dtype == np.float32:
+            dots = codes @ query
+        else:
+            dots = np.concatenate([
+                codes[start:start + _SCAN_BLOCK].astype(np.float32) @ query
+                for start in range(0, len(codes), _SCAN_BLOCK)
+            ]) if len(codes) else np.zeros(0, dtype=np.float32)
+        if scales is not None:
+            dots = dots * scales
+        return self._metric_scores(query, dots, norms)
+
+    def memory_bytes(self) -> int:
+        """Bộ nhớ của phần chỉ mục giữ trong RAM (mã, chuẩn, hệ số, mặt nạ, bản sao theo cụm IVF)"""
+        arrays = [self._codes, self._norms, self._alive, self._scales]
+        if self._ivf is not None:
+            arrays += [self._ivf[key] for key in ("centroids", "order", "bounds", "vectors", "norms", "scales")]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def _append_ops(self, ops: List[dict]) -> None:
+        with open(self._file("ops.jsonl"), "a", encoding="utf-8") as file:
+            for op in ops:
+                file.write(json.dumps(op, ensure_ascii=False))
+                file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _grow(self, extra: int) -> None:
+        """Mở rộng bộ đệm mã theo cấp số nhân để thêm batch không phải copy toàn bộ mỗi lần"""
+        needed = self._size + extra
+        if needed <= len(self._codes):
+            return
+        capacity = max(needed, 2 * len(self._codes), 1024)
+        codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+        codes[:self._size] = self._codes[:self._size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self._size] = self._norms[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        if self._scales is not None:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+        self._codes, self._norms, self._alive = codes, norms, alive
+
+    def compact(self) -> None:
+        """Ghi lại collection chỉ với các bản ghi còn sống (bỏ bản ghi đã xóa/bị thay thế)"""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._size])
+            tmp_path = self.path + ".tmp"
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+            os.makedirs(tmp_path)
+            full = self._full_vectors()
+            with open(os.path.join(tmp_path, "vectors.f32"), "wb") as file:
+                # Ghi theo khối: khi tìm hai pha, vector đầy đủ chỉ nằm trên đĩa
+                for start in range(0, len(live), _SCAN_BLOCK):
+                    file.write(np.asarray(full[live[start:start + _SCAN_BLOCK]], dtype=np.float32).tobytes())
+            with open(os.path.join(tmp_path, "ops.jsonl"), "w", encoding="utf-8") as file:
+                for row in live:
+                    file.write(json.dumps({"op": "add", "id": self._ids[row], "text": self._texts[row], "metadata": self._metadatas[row]}, ensure_ascii=False))
+                    file.write("\n")
+            with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as file:
+                json.dump(self._manifest(), file)
+            self._full_map = None
+            old_path = self.path + ".old"
+            os.replace(self.path, old_path)
+            os.replace(tmp_path, self.path)
+            shutil.rmtree(old_path)
+            self._load()
+
+    # === CHỈ MỤC IVF ===
+    def _load_ivf(self) -> None:
+        if not os.path.exists(self._file("ivf_meta.json")):
+            return
+        with open(self._file("ivf_meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta["rows"] > self._size:
+            return
+        self._set_ivf(np.load(self._file("ivf_centroids.npy")), np.load(self._file("ivf_assign.npy")), meta["rows"])
+
+    def _set_ivf(self, centroids: np.ndarray, assign: np.ndarray, rows: int) -> None:
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        # Bản sao mã xếp liền nhau theo cụm: mỗi cụm là một lát cắt liên tục, không phải gather từng hàng
+        self._ivf = {
+            "centroids": centroids,
+            "rows": rows,
+            "order": order,
+            "bounds": bounds,
+            "vectors": self._codes[order],
+            "norms": self._norms[order],
+            "scales": self._scales[order] if self._scales is not None else None,
+        }
+
+    def build_ivf(self) -> None:
+        """Dựng (lại) chỉ mục IVF trên toàn bộ vector hiện có và lưu ra đĩa"""
+        with self._lock:
+            rows = self._size
+            # Tâm cụm nằm trong không gian quét (các chiều đầu nếu cắt chiều)
+            data = self._scan_vectors()
+            n_clusters = max(1, int(np.sqrt(rows)))
+            # Huấn luyện k-means trên mẫu con để dựng chỉ mục nhanh
+            sample = np.asarray(data[np.sort(np.random.default_rng(0).choice(rows, min(rows, 64 * n_clusters), replace=False))])
+            centroids = _kmeans(sample, n_clusters)
+            assign = _nearest_centroids(data, centroids)
+            np.save(self._file("ivf_centroids.npy"), centroids)
+            np.save(self._file("ivf_assign.npy"), assign)
+            with open(self._file("ivf_meta.json"), "w", encoding="utf-8") as file:
+                json.dump({"rows": rows, "clusters": n_clusters}, file)
+            self._set_ivf(centroids, assign, rows)
+            print(f"Đã dựng chỉ mục IVF cho '{self.collection_name}': {rows} vector, {n_clusters} cụm")
+
+    def _drop_ivf(self) -> None:
+        self._ivf = None
+        for name in ("ivf_meta.json", "ivf_centroids.npy", "ivf_assign.npy"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+    def _segments(self, query: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+        """
+        Các đoạn cần quét, mỗi đoạn là (chỉ số hàng, mã, bình phương chuẩn, hệ số int8) dạng view liên tục (không copy)
+        Collection nhỏ: một đoạn gồm mọi hàng (brute-force)
+        Với IVF: nprobe cụm gần nhất cộng các hàng thêm sau lần dựng chỉ mục
+        """
+        size = self._size
+        scales = self._scales
+
+        def part(array, start, stop):
+            return array[start:stop] if array is not None else None
+
+        if len(self._id_to_row) < self.ivf_threshold:
+            return [(np.arange(size), self._codes[:size], self._norms[:size], part(scales, 0, size))]
+        # Dựng lại khi chưa có chỉ mục hoặc phần thêm sau lần dựng vượt 20%
+        if self._ivf is None or size - self._ivf["rows"] > 0.2 * self._ivf["rows"]:
+            self.build_ivf()
+        ivf = self._ivf
+        centroids, bounds = ivf["centroids"], ivf["bounds"]
+        nprobe = min(self.nprobe or max(16, len(centroids) // 8), len(centroids))
+        distances = (centroids ** 2).sum(axis=1) - 2 * centroids @ query
+        probe = np.argpartition(distances, nprobe - 1)[:nprobe]
+        segments = [
+            (ivf["order"][bounds[c]:bounds[c + 1]], ivf["vectors"][bounds[c]:bounds[c + 1]],
+             ivf["norms"][bounds[c]:bounds[c + 1]], part(ivf["scales"], bounds[c], bounds[c + 1]))
+            for c in probe
+        ]
+        segments.append((np.arange(ivf["rows"], size), self._codes[ivf["rows"]:size], self._norms[ivf["rows"]:size],
+                         part(scales, ivf["rows"], size)))
+        return segments
+
+    # === API VECTOR STORE ===
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_func
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def __repr__(self) -> str:
+        return f"LocalVectorStore(collection='{self.collection_name}', path='{self.path}', count={len(self)})"
+
+    def add_embeddings(self, texts: Iterable[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """
+        Thêm (hoặc thay thế theo ID) các chunk với embeddings đã tính sẵn
+        Returns:
+            list: ID của các chunk đã thêm
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            import uuid
+            ids = [str(uuid.uuid4()) for _ in texts]
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._codes, self._norms, self._scales = self._encode(np.zeros((0, self.dim), dtype=np.float32))
+                self._write_manifest()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Số chiều embeddings ({vectors.shape[1]}) khác collection ({self.dim})")
+            # Ghi vectors trước, log sau: nếu bị ngắt giữa chừng, các vector dư bị bỏ qua khi đọc lại
+            with open(self._file("vectors.f32"), "ab") as file:
+                file.write(vectors.tobytes())
+            self._append_ops([
+                {"op": "add", "id": doc_id, "text": text, "metadata": metadata}
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ])
+            self._grow(len(texts))
+            start = self._size
+            codes, norms, scales = self._encode(vectors)
+            self._codes[start:start + len(texts)] = codes
+            self._norms[start:start + len(texts)] = norms
+            if scales is not None:
+                self._scales[start:start + len(texts)] = scales
+            self._alive[start:start + len(texts)] = True
+            for offset, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                old_row = self._id_to_row.get(doc_id)
+                if old_row is not None:
+                    self._alive[old_row] = False
+                self._id_to_row[doc_id] = start + offset
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            self._size += len(texts)
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_func.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, expr: Optional[str] = None, **kwargs: Any) -> bool:
+        """
+        Xóa chunk theo ID hoặc theo biểu thức lọc metadata
+        """
+        with self._lock:
+            if expr is not None:
+                predicate = _compile_expr(expr)
+                ids = [doc_id for doc_id, row in self._id_to_row.items() if predicate(self._metadatas[row])]
+            ids = [doc_id for doc_id in (ids or []) if doc_id in self._id_to_row]
+            if not ids:
+                return True
+            self._append_ops([{"op": "delete", "ids": ids}])
+            for doc_id in ids:
+                self._alive[self._id_to_row.pop(doc_id)] = False
+            # Nén lại khi số hàng đã chết vượt số hàng còn sống
+            dead = self._size - len(self._id_to_row)
+            if dead > 1000 and dead > len(self._id_to_row):
+                self._drop_ivf()
+                self.compact()
+        return True
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        with self._lock:
+            return [self._document(self._id_to_row[doc_id]) for doc_id in ids if doc_id in self._id_to_row]
+
+    def _document(self, row: int) -> Document:
+        # Giống langchain_milvus: ID nằm trong metadata['pk']
+        return Document(page_content=self._texts[row], metadata={**self._metadatas[row], self._primary_field: self._ids[row]})
+
+    def _expr_mask(self, expr: str) -> np.ndarray:
+        """
+        Mặt nạ các hàng thỏa biểu thức lọc, lưu theo biểu thức
+        Metadata của một hàng không bao giờ đổi (thay thế = thêm hàng mới) nên chỉ cần tính thêm cho các hàng mới
+        """
+        predicate, mask = self._expr_masks.get(expr, (None, np.zeros(0, dtype=bool)))
+        if len(mask) < self._size:
+            predicate = predicate or _compile_expr(expr)
+            extra = np.fromiter((predicate(metadata) for metadata in self._metadatas[len(mask):self._size]), dtype=bool, count=self._size - len(mask))
+            mask = np.concatenate([mask, extra])
+            self._expr_masks[expr] = (predicate, mask)
+        return mask
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, expr: Optional[str] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Tìm k chunk gần nhất
+        Args:
+            embedding (list): Vector câu hỏi
+            k (int): Số kết quả
+            expr (str): Biểu thức lọc metadata kiểu Milvus
+        Returns:
+            list: Các cặp (Document, điểm); L2 là khoảng cách bình phương (nhỏ hơn là gần hơn),
+                  IP/COSINE là độ tương đồng (lớn hơn là gần hơn)
+        """
+        with self._lock:
+            if not self._size:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            scan_query = query[:self.scan_dim]
+            segments = self._segments(scan_query)
+            rows = np.concatenate([segment[0] for segment in segments])
+            scores = np.concatenate([self._approx_scores(scan_query, *segment[1:]) for segment in segments])
+            mask = self._alive[rows]
+            if expr:
+                mask &= self._expr_mask(expr)[rows]
+            scores = np.where(mask, scores, np.inf)
+
+            available = int(mask.sum())
+            k = min(k, available)
+            if k <= 0:
+                return []
+            if self.two_phase:
+                # Pha 2: chấm lại chính xác các ứng viên tốt nhất bằng vector đầy đủ (đọc theo thứ tự trên đĩa)
+                n_candidates = min(k * self.rescore_factor, available)
+                candidates = np.argpartition(scores, n_candidates - 1)[:n_candidates]
+                rows = np.sort(rows[candidates])
+                full = np.asarray(self._full_vectors()[rows])
+                scores = self._metric_scores(query, full @ query, (full ** 2).sum(axis=1))
+            top = np.argpartition(scores, k - 1)[:k]
+            top = top[np.argsort(scores[top])]
+            sign = 1 if self.metric == "L2" else -1
+            return [(self._document(int(rows[i])), sign * float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_func.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def iter_batches(self, output_fields: Optional[List[str]] = None, batch_size: int = 1000) -> Iterator[List[dict]]:
+        """
+        Duyệt mọi bản ghi còn sống theo trang, định dạng giống query_iterator của Milvus
+        (dict gồm pk, text và các trường metadata)
+        """
+        with self._lock:
+            rows = sorted(self._id_to_row.values())
+        for start in range(0, len(rows), batch_size):
+            batch = []
+            for row in rows[start:start + batch_size]:
+                record = {**self._metadatas[row], self._primary_field: self._ids[row], self._text_field: self._texts[row]}
+                if output_fields is not None:
+                    record = {key: value for key, value in record.items() if key in output_fields}
+                batch.append(record)
+            yield batch
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
@@ -7,14 +7,28 @@ Chức năng:
 """
 
 # === IMPORT CÁC THƯ VIỆN CẦN THIẾT ===
+# SDK của các nhà cung cấp model, pymilvus và crawler chỉ được import khi được chọn/dùng lần đầu
+import os
+import threading
 import streamlit as st  # Thư viện tạo giao diện web
 from dotenv import load_dotenv  # Đọc file .env chứa API key
-from seed_data import seed_milvus, seed_milvus_live  # Hàm xử lý dữ liệu
+import jobs  # Hàng đợi job seed dữ liệu chạy nền
+from answer_cache import get_answer_cache  # Cache câu trả lời cho câu hỏi lặp lại
+from collection_profiles import PROFILES, DEFAULT_PROFILE  # Profile index/tìm kiếm của collection
+from reranker import RERANKER_ENABLED  # Xếp hạng lại kết quả tìm kiếm bằng cross-encoder
+from federated_retriever import parse_collections, get_federated_retriever  # Tìm song song trên nhiều collection
 from agent import get_retriever as get_openai_retriever, get_llm_and_agent as get_openai_agent
 from local_ollama import get_retriever as get_ollama_retriever, get_llm_and_agent as get_ollama_agent
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
+from streaming import stream_agent  # Stream câu trả lời theo từng token
+import tracing  # Đo thời gian từng bước của một lượt chat
+import registry  # Retriever/agent dùng chung giữa các lần rerun
 from langchain_community.chat_message_histories import StreamlitChatMessageHistory
 
+# Khởi tạo sẵn retriever/agent trên thread nền trong lúc trang hiển thị (APP_WARMUP=0 để tắt)
+APP_WARMUP = os.getenv("APP_WARMUP", "1") == "1"
+# Lựa chọn model trên giao diện -> model_choice của agent.get_llm_and_agent
+OPENAI_AGENT_MODELS = {"OpenAI GPT-4": "gpt4", "OpenAI Grok": "grok", "Gemini": "gemini"}
+
 # === THIẾT LẬP GIAO DIỆN TRANG WEB ===
 def setup_page():
     """
@@ -35,6 +49,8 @@ def initialize_app():
     """
     load_dotenv()  # Đọc API key từ file .env
     setup_page()  # Thiết lập giao diện
+    tracing.start_metrics_server()  # Metrics Prometheus nếu đặt TRACING_METRICS_PORT
+    jobs.start_workers()  # Worker process seed dữ liệu (JOBS_WORKERS)
 
 # === THANH CÔNG CỤ BÊN TRÁI ===
 def setup_sidebar():
@@ -65,13 +81,27 @@ def setup_sidebar():
             handle_local_file(use_ollama_embeddings, use_hf_embeddings)
         else:
             handle_url_input(use_ollama_embeddings, use_hf_embeddings)
+        show_jobs()
             
         # Thêm phần chọn collection để query
         st.header("🔍 Collection để truy vấn")
         collection_to_query = st.text_input(
             "Nhập tên collection cần truy vấn:",
             "data_test",
-            help="Nhập tên collection bạn muốn sử dụng để tìm kiếm thông tin"
+            help="Nhập tên collection bạn muốn sử dụng để tìm kiếm thông tin; "
+                 "nhiều collection phân tách bằng dấu phẩy sẽ được tìm song song và gộp kết quả"
+        )
+        # Chuẩn hóa danh sách (bỏ khoảng trắng, tên lặp lại) để cache agent/câu trả lời dùng chung khóa
+        collection_to_query = ",".join(parse_collections(collection_to_query)) or "data_test"
+        doc_name = st.text_input(
+            "Chỉ tìm trong tài liệu (doc_name, để trống để tìm tất cả):",
+            "",
+            help="Lọc theo metadata doc_name, không quét các tài liệu khác trong collection"
+        ).strip() or None
+        use_rerank = st.checkbox(
+            "Xếp hạng lại bằng cross-encoder",
+            value=RERANKER_ENABLED,
+            help="Lấy 50 ứng viên, chấm điểm lại bằng cross-encoder và chỉ gửi 4 chunk tốt nhất cho AI"
         )
         
         # Phần 3: Chọn Model để trả lời
@@ -80,9 +110,29 @@ def setup_sidebar():
             "Chọn AI Model để trả lời:",
             ["OpenAI GPT-4", "OpenAI Grok", "Ollama (Local)", "Gemini"]
         )
+
+        # Phần 4: Thời gian từng bước của lượt chat gần nhất (xem show_turn_timings)
+        st.header("⏱️ Hiệu năng")
+        st.checkbox(
+            "Hiển thị thời gian từng bước",
+            key="show_timings",
+            help="Embed câu hỏi, tìm kiếm Milvus/BM25, gọi tool, sinh câu trả lời..."
+        )
         
-        return model_choice, collection_to_query, use_ollama_embeddings, use_hf_embeddings
+        return model_choice, collection_to_query, doc_name, use_rerank, use_ollama_embeddings, use_hf_embeddings
     
+def select_profile() -> str:
+    """
+    Chọn profile index/tìm kiếm khi seed collection
+    """
+    return st.selectbox(
+        "Profile index:",
+        list(PROFILES),
+        index=list(PROFILES).index(DEFAULT_PROFILE),
+        format_func=lambda name: f"{name} - {PROFILES[name]['description']}",
+        help="Đánh đổi recall/độ trễ; collection giữ profile đã chọn khi cập nhật phần thay đổi"
+    )
+
 def handle_local_file(use_ollama_embeddings: bool, use_hf_embeddings: bool):
     """
     Xử lý khi người dùng chọn tải file
@@ -94,25 +144,30 @@ def handle_local_file(use_ollama_embeddings: bool, use_hf_embeddings: bool):
     )
     filename = st.text_input("Tên file JSON:", "stack.json")
     directory = st.text_input("Thư mục chứa file:", "data")
+    incremental = st.checkbox(
+        "Chỉ cập nhật phần thay đổi",
+        help="Giữ collection cũ, chỉ embed chunk mới hoặc đã đổi và xóa chunk không còn"
+    )
+    profile = select_profile()
     
     if st.button("Tải dữ liệu từ file"):
         if not collection_name:
             st.error("Vui lòng nhập tên collection!")
             return
             
-        with st.spinner("Đang tải dữ liệu..."):
-            try:
-                seed_milvus(
-                    'http://localhost:19530', 
-                    collection_name, 
-                    filename, 
-                    directory, 
-                    use_ollama=use_ollama_embeddings,
-                    use_hf=use_hf_embeddings
-                )
-                st.success(f"Đã tải dữ liệu thành công vào collection '{collection_name}'!")
-            except Exception as e:
-                st.error(f"Lỗi khi tải dữ liệu: {str(e)}")
+        # Seed chạy trên worker process, giao diện chỉ gửi job và theo dõi (xem show_jobs)
+        job_id = jobs.get_job_store().submit(
+            "file",
+            collection_name,
+            URI_link='http://localhost:19530',
+            filename=filename,
+            directory=directory,
+            use_ollama=use_ollama_embeddings,
+            use_hf=use_hf_embeddings,
+            incremental=incremental,
+            profile=profile
+        )
+        st.success(f"Đã thêm job {job_id} tải dữ liệu vào collection '{collection_name}'")
 
 def handle_url_input(use_ollama_embeddings: bool, use_hf_embeddings: bool):
     """
@@ -124,25 +179,59 @@ def handle_url_input(use_ollama_embeddings: bool, use_hf_embeddings: bool):
         help="Nhập tên collection bạn muốn lưu trong Milvus"
     )
     url = st.text_input("Nhập URL:", "https://www.stack-ai.com/docs")
+    incremental = st.checkbox(
+        "Chỉ cập nhật phần thay đổi",
+        help="Giữ collection cũ, chỉ embed chunk mới hoặc đã đổi và xóa chunk không còn"
+    )
+    profile = select_profile()
     
     if st.button("Crawl dữ liệu"):
         if not collection_name:
             st.error("Vui lòng nhập tên collection!")
             return
             
-        with st.spinner("Đang crawl dữ liệu..."):
-            try:
-                seed_milvus_live(
-                    url, 
-                    'http://localhost:19530', 
-                    collection_name, 
-                    'stack-ai', 
-                    use_ollama=use_ollama_embeddings,
-                    use_hf=use_hf_embeddings
-                )
-                st.success(f"Đã crawl dữ liệu thành công vào collection '{collection_name}'!")
-            except Exception as e:
-                st.error(f"Lỗi khi crawl dữ liệu: {str(e)}")
+        job_id = jobs.get_job_store().submit(
+            "live",
+            collection_name,
+            URL=url,
+            URI_link='http://localhost:19530',
+            doc_name='stack-ai',
+            use_ollama=use_ollama_embeddings,
+            use_hf=use_hf_embeddings,
+            incremental=incremental,
+            profile=profile
+        )
+        st.success(f"Đã thêm job {job_id} crawl dữ liệu vào collection '{collection_name}'")
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌", "cancelled": "⛔"}
+
+@st.fragment(run_every=2)
+def show_jobs():
+    """
+    Trạng thái các job seed gần nhất, tự làm mới mỗi 2 giây (chỉ chạy lại phần này, không rerun cả trang)
+    """
+    recent = jobs.get_job_store().list_jobs(limit=5)
+    if not recent:
+        return
+    st.header("📥 Job nạp dữ liệu")
+    # Retriever của collection vừa seed xong trong tiến trình này không còn đúng
+    for collection in jobs.refresh_finished(recent):
+        st.toast(f"Collection '{collection}' đã được cập nhật")
+    for job in recent:
+        st.write(f"{JOB_STATUS_ICONS.get(job.status, '')} `{job.id}` · {job.collection} · {job.status} · {job.elapsed_s:.0f}s")
+        progress = job.progress
+        if progress:
+            # Tiến độ của pipeline crawl → embed → ghi Milvus
+            st.caption(
+                f"Đã tải {progress.get('pages_fetched', 0)} trang · "
+                f"{progress.get('chunks_inserted', 0)} chunk đã ghi · "
+                f"{progress.get('chunks_unchanged', 0)} chunk không đổi"
+            )
+        if job.error:
+            st.caption(job.error if job.status == "cancelled" else f"Lỗi: {job.error}")
+        if not job.done and not job.cancel_requested:
+            if st.button("Hủy", key=f"cancel_job_{job.id}"):
+                jobs.get_job_store().cancel(job.id)
 
 # === GIAO DIỆN CHAT CHÍNH ===
 def setup_chat_interface(model_choice):
@@ -170,13 +259,53 @@ def setup_chat_interface(model_choice):
 
     return msgs
 
+# === KHỞI TẠO AGENT ===
+def get_agent(model_choice, collection_name, doc_name, use_rerank):
+    """
+    Lấy retriever và agent cho lựa chọn hiện tại (tạo lần đầu, sau đó lấy từ registry)
+    Nhiều collection (phân tách bằng dấu phẩy): federated retriever tìm song song trên từng collection
+    """
+    collection_names = parse_collections(collection_name)
+    get_retriever = get_openai_retriever if model_choice in OPENAI_AGENT_MODELS else get_ollama_retriever
+    if len(collection_names) > 1:
+        retriever = get_federated_retriever(collection_names, get_retriever, doc_name, use_rerank)
+    else:
+        retriever = get_retriever(collection_name, doc_name, use_rerank)
+    if model_choice in OPENAI_AGENT_MODELS:
+        factory = lambda: get_openai_agent(retriever, OPENAI_AGENT_MODELS[model_choice])
+    else:
+        factory = lambda: get_ollama_agent(retriever)
+    # id(retriever): retriever dự phòng khi lỗi kết nối không được lưu, agent đi kèm cũng không được dùng lại
+    return registry.get_cached("agent", collection_name, factory, model_choice, doc_name, use_rerank, id(retriever))
+
+def start_warmup(model_choice, collection_name, doc_name, use_rerank):
+    """
+    Khởi tạo retriever/agent (kết nối Milvus, load model embeddings) trên thread nền, một lần cho mỗi lựa chọn;
+    lượt chat đầu tiên chờ đúng lần khởi tạo này thay vì tạo lại
+    """
+    def warmup():
+        try:
+            with tracing.span("app.warmup", collection=collection_name, model=model_choice):
+                get_agent(model_choice, collection_name, doc_name, use_rerank)
+        except Exception as e:
+            print(f"Không khởi tạo trước được agent: {str(e)}")
+
+    def start():
+        thread = threading.Thread(target=warmup, daemon=True, name="app-warmup")
+        thread.start()
+        return thread
+
+    registry.get_cached("warmup", collection_name, start, model_choice, doc_name, use_rerank)
+
 # === XỬ LÝ TIN NHẮN NGƯỜI DÙNG ===
-def handle_user_input(msgs, agent_executor):
+def handle_user_input(msgs, agent_factory, collection_name, model_choice):
     """
     Xử lý khi người dùng gửi tin nhắn:
     1. Hiển thị tin nhắn người dùng
-    2. Gọi AI xử lý và trả lời
+    2. Tra cache câu trả lời (chỉ với câu hỏi đầu tiên của hội thoại), nếu không có thì gọi AI xử lý và trả lời
     3. Lưu vào lịch sử chat
+    Args:
+        agent_factory (Callable): Trả về agent; chỉ được gọi khi cần gọi AI (không có trong cache)
     """
     if prompt := st.chat_input("Hãy hỏi tôi bất cứ điều gì về Stack AI!"):
         # Lưu và hiển thị tin nhắn người dùng
@@ -184,52 +313,108 @@ def handle_user_input(msgs, agent_executor):
         st.chat_message("human").write(prompt)
         msgs.add_user_message(prompt)
 
-        # Xử lý và hiển thị câu trả lời
-        with st.chat_message("assistant"):
-            st_callback = StreamlitCallbackHandler(st.container())
-            
+        # Xử lý và hiển thị câu trả lời, ghi lại span của từng bước trong lượt chat
+        with st.chat_message("assistant"), tracing.collect() as spans, \
+                tracing.span("chat.turn", collection=collection_name, model=model_choice) as turn:
             # Lấy lịch sử chat
             chat_history = [
                 {"role": msg["role"], "content": msg["content"]}
                 for msg in st.session_state.messages[:-1]
             ]
+            # Câu hỏi đã được hỏi trước đó (hoặc gần giống) thì trả lời ngay, không gọi LLM; cache không
+            # tính đến lịch sử chat nên chỉ dùng cho câu hỏi đầu tiên (câu hỏi tiếp theo như "giải thích
+            # thêm" phụ thuộc vào hội thoại), như api.py bỏ qua cache khi có chat_history
+            use_cache = not any(msg["role"] == "human" for msg in chat_history)
+            answer_cache = get_answer_cache()
+            output = answer_cache.get(collection_name, model_choice, prompt) if use_cache else None
+            turn.set(cached=output is not None)
+            if output is not None:
+                st.caption("⚡ Câu trả lời từ cache")
+                st.write(output)
+            else:
+                # Gọi AI xử lý, hiển thị tiến trình gọi tool và từng token ngay khi nhận được
+                tool_status = st.status("Đang xử lý...", expanded=False)
+                answer_placeholder = st.empty()
+                answer = ""
+                try:
+                    with st.spinner("Đang khởi tạo..."):
+                        agent_executor = agent_factory()
+                    for event in stream_agent(agent_executor, {"input": prompt, "chat_history": chat_history}):
+                        if event.kind == "tool_start":
+                            # Token trước khi gọi tool không thuộc câu trả lời cuối
+                            answer = ""
+                            answer_placeholder.empty()
+                            tool_status.update(label=f"🔍 Đang gọi {event.name}...")
+                            tool_status.write(f"**{event.name}**: {event.text}")
+                        elif event.kind == "tool_end":
+                            tool_status.write(f"Đã nhận {len(event.text)} ký tự từ {event.name} ({event.elapsed_s:.1f}s)")
+                        elif event.kind == "token":
+                            answer += event.text
+                            answer_placeholder.markdown(answer + "▌")
+                        elif event.kind == "done":
+                            output = event.text
+                            timings = event.timings
+                except Exception as e:
+                    # Lỗi model/kết nối: hiện thông báo và lưu vào lịch sử thay vì traceback của Streamlit,
+                    # không lưu vào cache câu trả lời
+                    print(f"Lỗi khi gọi AI: {str(e)}")
+                    turn.set(error=type(e).__name__)
+                    tool_status.update(label="Lỗi", state="error")
+                    answer_placeholder.empty()
+                    output = "Có lỗi xảy ra khi xử lý câu hỏi. Vui lòng thử lại sau."
+                    st.error(f"{output} ({str(e)})")
+                else:
+                    tool_status.update(label="Hoàn tất", state="complete")
+                    answer_placeholder.markdown(output)
+                    st.caption(f"⏱️ Token đầu tiên sau {timings['ttft_s']:.2f}s · tổng {timings['total_s']:.2f}s")
+                    if use_cache:
+                        answer_cache.put(collection_name, model_choice, prompt, output)
 
-            # Gọi AI xử lý
-            response = agent_executor.invoke(
-                {
-                    "input": prompt,
-                    "chat_history": chat_history
-                },
-                {"callbacks": [st_callback]}
-            )
-
-            # Lưu và hiển thị câu trả lời
-            output = response["output"]
+            # Lưu câu trả lời
             st.session_state.messages.append({"role": "assistant", "content": output})
             msgs.add_ai_message(output)
-            st.write(output)
+        st.session_state.last_turn_timings = tracing.summarize(spans)
+
+def show_turn_timings():
+    """
+    Hiển thị thời gian từng bước của lượt chat gần nhất trên sidebar (nếu được bật)
+    """
+    timings = st.session_state.get("last_turn_timings")
+    if not st.session_state.get("show_timings") or not timings:
+        return
+    with st.sidebar:
+        st.caption("Lượt chat gần nhất")
+        st.dataframe(
+            [
+                {
+                    "Bước": "· " * row["depth"] + row["step"],
+                    "ms": row["ms"],
+                    "Chi tiết": ", ".join(f"{key}={value}" for key, value in row["attributes"].items()),
+                }
+                for row in timings
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
 
 # === HÀM CHÍNH ===
 def main():
     initialize_app()
-    model_choice, collection_to_query, use_ollama_embeddings, use_hf_embeddings = setup_sidebar()
+    model_choice, collection_to_query, doc_name, use_rerank, use_ollama_embeddings, use_hf_embeddings = setup_sidebar()
     msgs = setup_chat_interface(model_choice)
     
-    # Khởi tạo AI dựa trên lựa chọn model để trả lời
-    if model_choice == "OpenAI GPT-4":
-        retriever = get_openai_retriever(collection_to_query)
-        agent_executor = get_openai_agent(retriever, "gpt4")
-    elif model_choice == "OpenAI Grok":
-        retriever = get_openai_retriever(collection_to_query)
-        agent_executor = get_openai_agent(retriever, "grok")
-    elif model_choice == "Gemini":
-        retriever = get_openai_retriever(collection_to_query)
-        agent_executor = get_openai_agent(retriever, "gemini")
-    else:
-        retriever = get_ollama_retriever(collection_to_query)
-        agent_executor = get_ollama_agent(retriever)
+    # Agent được tạo khi cần trả lời (trang hiển thị ngay), khởi tạo trước trên thread nền nếu bật APP_WARMUP
+    if APP_WARMUP:
+        start_warmup(model_choice, collection_to_query, doc_name, use_rerank)
+    agent_factory = lambda: get_agent(model_choice, collection_to_query, doc_name, use_rerank)
     
-    handle_user_input(msgs, agent_executor)
+    # Câu trả lời khi lọc theo tài liệu hoặc xếp hạng lại được cache riêng: cùng câu hỏi nhưng
+    # ngữ cảnh gửi cho AI khác nhau
+    cache_key = f"{model_choice}|rerank={int(bool(use_rerank))}"
+    if doc_name:
+        cache_key += f"|doc_name={doc_name}"
+    handle_user_input(msgs, agent_factory, collection_to_query, cache_key)
+    show_turn_timings()
 
 # Chạy ứng dụng
 if __name__ == "__main__":
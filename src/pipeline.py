@@ -0,0 +1,409 @@
+"""
+Pipeline streaming crawl → extract → split → embed → insert cho seed_milvus_live
+Chức năng:
+- Mỗi giai đoạn chạy trong một thread riêng, nối với nhau bằng hàng đợi có giới hạn (backpressure)
+- Chunk được embed và ghi vào Milvus theo batch ngay khi crawl, không chờ hết trang web
+- Báo tiến độ qua progress_callback (gọi trên thread của người gọi, an toàn cho Streamlit)
+- Checkpoint theo URL: chạy lại sau khi bị ngắt sẽ bỏ qua các trang đã ghi xong
+- Xóa boilerplate và bỏ chunk gần trùng trước khi embed (xem dedup.py), không phụ thuộc thứ tự crawler
+  trả trang: boilerplate được học trên các trang có URL nhỏ nhất (lần crawl đầu chờ crawl xong mới ghi)
+  rồi cố định và lưu cạnh checkpoint cho các lần crawl sau; trong các chunk gần trùng, chunk của URL
+  nhỏ nhất được giữ, chunk đã ghi bị thay thế được xóa khi crawl xong; khi collection đã có dữ liệu
+  (incremental, chạy tiếp), chunk mới chờ tới khi crawl xong mới embed để chunk sẽ bị thay thế không
+  bị embed, ghi rồi xóa
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import tempfile
+import itertools
+import threading
+import contextvars
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from crawl import iter_documents
+from crawler import iter_crawl
+from dedup import DEDUP_ENABLED, BoilerplateDetector, IngestDeduplicator
+import tracing
+
+CHECKPOINT_DIR = os.getenv("PIPELINE_CHECKPOINT_DIR", os.path.join(".cache", "checkpoints"))
+
+_DONE = object()
+
+
+@dataclass
+class PipelineProgress:
+    """
+    Tiến độ của một lần chạy pipeline
+    """
+    pages_fetched: int = 0
+    pages_skipped: int = 0      # Trang đã ghi xong ở lần chạy trước (theo checkpoint)
+    chunks_split: int = 0
+    chunks_unchanged: int = 0   # Chunk đã có trong collection, không embed lại
+    chunks_duplicate: int = 0   # Chunk gần trùng với chunk đã gặp, bị bỏ qua
+    chunks_embedded: int = 0
+    chunks_inserted: int = 0
+    chunks_deleted: int = 0
+    elapsed_s: float = 0.0
+    finished: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class PipelineCheckpoint:
+    """
+    Checkpoint dạng JSONL: mỗi dòng là một URL đã ghi xong cùng ID các chunk của nó
+    Args:
+        collection_name (str): Tên collection đang seed
+        url (str): URL gốc của lần crawl
+        directory (str): Thư mục chứa file checkpoint
+    """
+
+    def __init__(self, collection_name: str, url: str, directory: str = CHECKPOINT_DIR):
+        key = hashlib.sha256(f"{collection_name}|{url}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(directory, f"{collection_name}-{key}.jsonl")
+        # Tập dòng boilerplate đã học, giữ lại sau clear() cho các lần crawl incremental sau
+        self.boilerplate_path = os.path.join(directory, f"{collection_name}-{key}.boilerplate.json")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> dict:
+        """
+        Returns:
+            dict: {url: [chunk ids]} của các trang đã ghi xong
+        """
+        completed = {}
+        if not self.exists():
+            return completed
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Dòng cuối có thể bị ghi dở khi tiến trình bị ngắt
+                completed[record["url"]] = record["ids"]
+        return completed
+
+    def mark_done(self, url: str, ids: list) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"url": url, "ids": ids}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def clear(self) -> None:
+        if self.exists():
+            os.remove(self.path)
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Đưa item vào hàng đợi, chờ khi đầy (backpressure) nhưng thoát được khi có tín hiệu dừng"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Lấy item từ hàng đợi; trả về _DONE nếu pipeline đã dừng và hàng đợi rỗng"""
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return _DONE
+
+
+def run_live_pipeline(url: str, vectorstore, embeddings, checkpoint: PipelineCheckpoint,
+                      id_fn: Callable, metadata_fn: Callable, existing_ids: Optional[set] = None,
+                      delete_stale: bool = False, bm25_index=None,
+                      progress_callback: Optional[Callable[[PipelineProgress], None]] = None,
+                      stop_event: Optional[threading.Event] = None,
+                      chunk_size: int = 10000, chunk_overlap: int = 500,
+                      embed_batch_size: Optional[int] = None, insert_batch_size: int = 256,
+                      queue_size: int = 8, dedup: Optional[bool] = None, extractor: Optional[str] = None,
+                      **crawler_kwargs) -> PipelineProgress:
+    """
+    Crawl URL và ghi từng batch chunk vào vector store ngay khi có
+    Args:
+        url (str): URL gốc cần crawl
+        vectorstore: Vector store Milvus đích (có add_embeddings/delete)
+        embeddings: Model embeddings dùng để embed chunk
+        checkpoint (PipelineCheckpoint): Checkpoint để tiếp tục khi bị ngắt
+        id_fn (Callable): Hàm tạo ID xác định cho một chunk
+        metadata_fn (Callable): Hàm chuẩn hóa metadata của chunk
+        existing_ids (set): ID đang có trong collection, chunk trùng ID sẽ không embed lại
+        delete_stale (bool): Xóa các ID có sẵn nhưng không còn xuất hiện khi crawl xong
+        bm25_index: BM25Index được cập nhật với các chunk đã thêm/xóa
+        progress_callback (Callable): Nhận PipelineProgress sau mỗi batch và định kỳ
+        stop_event (threading.Event): Đặt để dừng pipeline giữa chừng (checkpoint được giữ lại)
+        chunk_size, chunk_overlap (int): Tham số chia chunk như crawl_web
+        embed_batch_size (int): Số chunk mỗi lần gọi model embeddings, mặc định preferred_batch_size
+            của EmbeddingExecutor (đủ lớn để embed song song trên process pool), 64 với model khác
+        insert_batch_size (int): Số chunk mỗi lần ghi vào Milvus
+        queue_size (int): Kích thước các hàng đợi giữa các giai đoạn
+        dedup (bool): Xóa boilerplate và bỏ chunk gần trùng, mặc định theo DEDUP_ENABLED
+        extractor (str): Extractor nội dung trang (extractors.EXTRACTORS), mặc định HTML_EXTRACTOR
+        **crawler_kwargs: Tham số cho crawler.AsyncCrawler
+    Returns:
+        PipelineProgress: Thống kê cuối cùng
+    """
+    start = time.perf_counter()
+    stop = stop_event or threading.Event()
+    progress = PipelineProgress()
+    existing_ids = existing_ids or set()
+    embed_batch_size = embed_batch_size or getattr(embeddings, "preferred_batch_size", 64)
+    completed = checkpoint.load()
+    seen_ids = {chunk_id for ids in completed.values() for chunk_id in ids}
+    errors = []
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # Boilerplate: chạy tiếp/incremental dùng lại tập dòng đã học, seed mới học lại trên các trang có
+    # URL nhỏ nhất; chunk gần trùng bị bỏ ngay hoặc thay chunk đã giữ của URL lớn hơn
+    deduplicator = None
+    dropped_ids = set()
+    if DEDUP_ENABLED if dedup is None else dedup:
+        detector = BoilerplateDetector.load(checkpoint.boilerplate_path) if (existing_ids or completed) else None
+        deduplicator = IngestDeduplicator(boilerplate=detector)
+    # Chunk mới của các trang khi collection đã có dữ liệu: ghi tạm ra đĩa, gửi đi khi crawl xong
+    deferred = tempfile.TemporaryFile() if deduplicator is not None and existing_ids else None
+    deferred_pages = {}
+    documents_queue = queue.Queue(maxsize=queue_size)
+    chunks_queue = queue.Queue(maxsize=queue_size * embed_batch_size)
+    embedded_queue = queue.Queue(maxsize=queue_size)
+
+    def stage(target, output):
+        # Bọc mỗi giai đoạn: lỗi được chuyển về thread chính, luôn gửi _DONE cho giai đoạn sau
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                try:
+                    output.put(_DONE, timeout=1)
+                except queue.Full:
+                    pass
+        # Thread chạy trong bản sao ngữ cảnh để span của từng giai đoạn nằm trong span seed.live
+        return threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True, name=f"pipeline-{target.__name__}")
+
+    def extract():
+        # Giai đoạn 1 + 2: crawl (event loop riêng trong iter_crawl) và trích xuất nội dung
+        # (trên process pool của extractors.py, trong lúc crawler tải các trang tiếp theo)
+        pages = iter_crawl(url, **crawler_kwargs)
+
+        def new_pages():
+            for page in pages:
+                if stop.is_set():
+                    return
+                progress.pages_fetched += 1
+                if page.url in completed:
+                    progress.pages_skipped += 1
+                    continue
+                yield page
+
+        try:
+            documents = iter_documents(new_pages(), extractor)
+            if deduplicator is not None:
+                documents = deduplicator.clean_pages(documents, save_path=checkpoint.boilerplate_path, stop_event=stop)
+            for document in documents:
+                if stop.is_set():
+                    break
+                if not _put(documents_queue, document, stop):
+                    break
+        finally:
+            pages.close()
+
+    def split():
+        # Giai đoạn 3: chia chunk, gán ID/metadata, bỏ qua chunk đã có trong collection
+        while True:
+            document = _get(documents_queue, stop)
+            if document is _DONE:
+                if deferred is not None and not stop.is_set():
+                    send_deferred()
+                return
+            source = document.metadata.get("source")
+            page_ids, new_chunks = [], []
+            for chunk in text_splitter.split_documents([document]):
+                chunk.metadata = metadata_fn(chunk.metadata)
+                chunk_id = id_fn(chunk)
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                if deduplicator is not None and not deduplicator.keep_chunk(chunk, chunk_id):
+                    progress.chunks_duplicate += 1
+                    dropped_ids.add(chunk_id)
+                    continue
+                page_ids.append(chunk_id)
+                progress.chunks_split += 1
+                if chunk_id in existing_ids:
+                    progress.chunks_unchanged += 1
+                else:
+                    new_chunks.append((chunk_id, chunk))
+            if deferred is not None and new_chunks:
+                deferred_pages[source] = page_ids
+                for chunk_id, chunk in new_chunks:
+                    record = [source, chunk_id, chunk.page_content, chunk.metadata]
+                    deferred.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                continue
+            if not send_page(source, page_ids, new_chunks):
+                return
+
+    def send_page(source, page_ids, new_chunks) -> bool:
+        # Báo trước số chunk của trang để giai đoạn ghi biết khi nào trang đã xong
+        if not _put(chunks_queue, ("page", source, page_ids, len(new_chunks)), stop):
+            return False
+        for chunk_id, chunk in new_chunks:
+            if not _put(chunks_queue, ("chunk", source, chunk_id, chunk), stop):
+                return False
+        return True
+
+    def send_deferred():
+        # Crawl xong: mọi chunk gần trùng đã biết chunk nào được giữ, bỏ các chunk bị thay thế
+        deferred.seek(0)
+        records = (json.loads(line) for line in deferred)
+        for source, group in itertools.groupby(records, key=lambda record: record[0]):
+            new_chunks = [
+                (chunk_id, Document(page_content=text, metadata=metadata))
+                for _, chunk_id, text, metadata in group if chunk_id not in deduplicator.superseded_ids
+            ]
+            if not send_page(source, deferred_pages[source], new_chunks):
+                return
+
+    def embed():
+        # Giai đoạn 4: embed theo batch
+        batch = []
+
+        def flush():
+            if batch:
+                with tracing.span("pipeline.embed", chunks=len(batch)):
+                    vectors = embeddings.embed_documents([chunk.page_content for _, _, chunk in batch])
+                progress.chunks_embedded += len(batch)
+                _put(embedded_queue, ("batch", list(batch), vectors), stop)
+                batch.clear()
+
+        while True:
+            item = _get(chunks_queue, stop)
+            if item is _DONE:
+                flush()
+                return
+            if item[0] == "page":
+                _put(embedded_queue, item, stop)
+                continue
+            batch.append(item[1:])
+            if len(batch) >= embed_batch_size:
+                flush()
+
+    threads = [stage(extract, documents_queue), stage(split, chunks_queue), stage(embed, embedded_queue)]
+    for thread in threads:
+        thread.start()
+
+    # Giai đoạn 5 (thread hiện tại): ghi vào Milvus theo batch, cập nhật checkpoint và tiến độ
+    pending = {}
+    page_ids = {}
+    insert_buffer = []
+    last_report = 0.0
+
+    def report(force: bool = False):
+        nonlocal last_report
+        now = time.perf_counter()
+        progress.elapsed_s = now - start
+        if progress_callback and (force or now - last_report >= 0.5):
+            last_report = now
+            progress_callback(progress)
+
+    def mark_page(source):
+        checkpoint.mark_done(source, page_ids.pop(source))
+        del pending[source]
+
+    def insert():
+        if not insert_buffer:
+            return
+        with tracing.span("pipeline.write", chunks=len(insert_buffer)):
+            vectorstore.add_embeddings(
+                texts=[chunk.page_content for _, _, chunk, _ in insert_buffer],
+                embeddings=[vector for _, _, _, vector in insert_buffer],
+                metadatas=[chunk.metadata for _, _, chunk, _ in insert_buffer],
+                ids=[chunk_id for _, chunk_id, _, _ in insert_buffer]
+            )
+        if bm25_index is not None:
+            bm25_index.update((chunk_id, chunk) for _, chunk_id, chunk, _ in insert_buffer)
+        progress.chunks_inserted += len(insert_buffer)
+        for source, _, _, _ in insert_buffer:
+            pending[source] -= 1
+            if pending[source] == 0:
+                mark_page(source)
+        insert_buffer.clear()
+        report(force=True)
+
+    while True:
+        try:
+            item = embedded_queue.get(timeout=0.2)
+        except queue.Empty:
+            if stop.is_set() and not any(thread.is_alive() for thread in threads):
+                break
+            report()
+            continue
+        if item is _DONE:
+            break
+        if item[0] == "page":
+            _, source, ids, n_new = item
+            page_ids[source] = ids
+            pending[source] = n_new
+            if n_new == 0:
+                mark_page(source)
+            continue
+        _, batch, vectors = item
+        insert_buffer.extend((source, chunk_id, chunk, vector) for (source, chunk_id, chunk), vector in zip(batch, vectors))
+        if len(insert_buffer) >= insert_batch_size:
+            insert()
+
+    for thread in threads:
+        thread.join()
+    if deferred is not None:
+        deferred.close()
+    if errors:
+        raise errors[0]
+    insert()
+
+    stale_ids = []
+    if stop_event is not None and stop_event.is_set():
+        print("Pipeline bị dừng, giữ checkpoint để chạy tiếp")
+    else:
+        # Chunk gần trùng đã ghi nhưng bị chunk của URL nhỏ hơn thay thế, hoặc có sẵn trong collection
+        # nhưng lần này bị bỏ vì gần trùng
+        # (chunk mới bị thay thế khi đang chờ crawl xong thì chưa được ghi)
+        stale = set()
+        if deduplicator is not None:
+            superseded = deduplicator.superseded_ids & existing_ids if deferred is not None else deduplicator.superseded_ids
+            stale = superseded | (dropped_ids & existing_ids)
+        if delete_stale:
+            stale |= existing_ids - seen_ids
+        stale_ids = list(stale)
+        for i in range(0, len(stale_ids), 1000):
+            vectorstore.delete(ids=stale_ids[i:i + 1000])
+        progress.chunks_deleted = len(stale_ids)
+        progress.chunks_duplicate += len(deduplicator.superseded_ids) if deduplicator is not None else 0
+        checkpoint.clear()
+        progress.finished = True
+
+    if bm25_index is not None and stale_ids:
+        bm25_index.update(removed_ids=stale_ids)
+    report(force=True)
+    if deduplicator is not None:
+        deduplicator.report()
+    tracing.set_attributes(pages=progress.pages_fetched, chunks=progress.chunks_inserted)
+    print(f"Pipeline stats: {progress.to_dict()}")
+    return progress
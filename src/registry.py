@@ -0,0 +1,158 @@
+"""
+Registry dùng chung trong tiến trình cho các tài nguyên khởi tạo tốn kém
+Chức năng:
+- Giữ một bản duy nhất cho mỗi model embeddings, kết nối Milvus, vector store và retriever
+- Khởi tạo lười (lần đầu được yêu cầu), tái sử dụng qua các lần rerun và session của Streamlit
+- Xóa các tài nguyên gắn với một collection sau khi collection đó được seed lại
+"""
+
+import hashlib
+import threading
+from typing import Callable, Hashable, Optional
+
+# Model mặc định cho từng backend embeddings
+EMBEDDING_MODELS = {
+    "hf": "sentence-transformers/all-MiniLM-L6-v2",
+    "ollama": "llama2",
+    "openai": "text-embedding-3-large",
+}
+
+_lock = threading.Lock()
+_resources = {}
+_key_locks = {}
+
+
+def get_or_create(key: tuple, factory: Callable):
+    """
+    Trả về tài nguyên đã lưu theo key, hoặc gọi factory để tạo lần đầu
+    Args:
+        key (tuple): Khóa dạng (loại, backend, model, collection, ...)
+        factory (Callable): Hàm không tham số tạo tài nguyên; nếu nó raise lỗi thì không lưu gì
+    Returns:
+        Tài nguyên đã được khởi tạo
+    """
+    with _lock:
+        if key in _resources:
+            return _resources[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Khóa riêng cho từng key: hai session cùng yêu cầu chỉ khởi tạo một lần,
+    # trong khi các key khác vẫn khởi tạo song song được
+    with key_lock:
+        with _lock:
+            if key in _resources:
+                return _resources[key]
+        resource = factory()
+        with _lock:
+            _resources[key] = resource
+        return resource
+
+
+def invalidate(collection_name: Optional[str] = None) -> None:
+    """
+    Xóa các tài nguyên đã lưu
+    Args:
+        collection_name (str): Chỉ xóa vector store/retriever/agent của collection này;
+                               None để xóa toàn bộ registry
+    """
+    with _lock:
+        if collection_name is None:
+            _resources.clear()
+            return
+        for key in [key for key in _resources if collection_name in key]:
+            del _resources[key]
+
+
+def embedding_backend(use_ollama: bool = False, use_hf: bool = True) -> str:
+    """
+    Chuyển các cờ use_ollama/use_hf (như trong seed_data) thành tên backend
+    Returns:
+        str: 'hf', 'ollama' hoặc 'openai'
+    """
+    if use_hf:
+        return "hf"
+    if use_ollama:
+        return "ollama"
+    return "openai"
+
+
+def get_embeddings(backend: str = "hf", model: Optional[str] = None, cache: bool = True):
+    """
+    Lấy model embeddings dùng chung (chỉ load model một lần cho mỗi tiến trình)
+    Args:
+        backend (str): 'hf', 'ollama' hoặc 'openai'
+        model (str): Tên model, mặc định lấy theo EMBEDDING_MODELS
+        cache (bool): Bọc model bằng cache embeddings trên đĩa (xem embedding_cache.py)
+    Returns:
+        Embeddings: Đối tượng embeddings của LangChain
+    """
+    model = model or EMBEDDING_MODELS[backend]
+
+    def create():
+        if backend == "hf":
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            return HuggingFaceEmbeddings(model_name=model)
+        if backend == "ollama":
+            from langchain_ollama import OllamaEmbeddings
+            return OllamaEmbeddings(model=model)
+        if backend == "openai":
+            from langchain_openai import OpenAIEmbeddings
+            return OpenAIEmbeddings(model=model)
+        raise ValueError(f"Embeddings backend không hợp lệ: '{backend}'")
+
+    embeddings = get_or_create(("embeddings", backend, model), create)
+    if not cache:
+        return embeddings
+
+    def create_cached():
+        from embedding_cache import CachedEmbeddings
+        return CachedEmbeddings(embeddings)
+
+    return get_or_create(("cached_embeddings", backend, model), create_cached)
+
+
+def get_embedding_executor(backend: str = "hf", model: Optional[str] = None):
+    """
+    Lấy EmbeddingExecutor dùng chung (process/thread pool được giữ lại giữa các lần seed)
+    Args:
+        backend (str): 'hf', 'ollama' hoặc 'openai'
+        model (str): Tên model, mặc định lấy theo EMBEDDING_MODELS
+    Returns:
+        EmbeddingExecutor: Bộ thực thi embedding theo batch, song song
+    """
+    model = model or EMBEDDING_MODELS[backend]
+
+    def create():
+        from embedding_executor import EmbeddingExecutor
+        return EmbeddingExecutor(get_embeddings(backend, model), backend, model)
+
+    return get_or_create(("embedding_executor", backend, model), create)
+
+
+def get_connection(uri: str) -> str:
+    """
+    Mở (một lần) kết nối pymilvus tới uri và trả về alias của kết nối
+    Args:
+        uri (str): Đường dẫn Milvus, ví dụ 'http://localhost:19530'
+    Returns:
+        str: Alias dùng trong connection_args={"alias": ...}
+    """
+    def create():
+        from pymilvus import connections
+        alias = "rag_" + hashlib.sha1(uri.encode("utf-8")).hexdigest()[:12]
+        connections.connect(alias=alias, uri=uri)
+        return alias
+
+    return get_or_create(("connection", uri), create)
+
+
+def get_cached(kind: str, collection_name: str, factory: Callable, *key_parts: Hashable):
+    """
+    Lưu một tài nguyên gắn với collection (retriever, agent...) để invalidate() xóa được
+    Args:
+        kind (str): Loại tài nguyên, ví dụ 'retriever' hoặc 'agent'
+        collection_name (str): Tên collection mà tài nguyên phụ thuộc
+        factory (Callable): Hàm tạo tài nguyên
+        *key_parts: Các thành phần khóa bổ sung (backend, model...)
+    """
+    return get_or_create((kind, *key_parts, collection_name), factory)
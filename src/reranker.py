@@ -0,0 +1,118 @@
+"""
+Xếp hạng lại (rerank) kết quả tìm kiếm bằng cross-encoder chạy local trên CPU
+Chức năng:
+- Chấm điểm từng cặp (câu hỏi, chunk) bằng cross-encoder, chính xác hơn so sánh vector
+  của bi-encoder (all-MiniLM-L6-v2) nhưng chậm hơn: chỉ dùng cho vài chục ứng viên
+- Chấm điểm theo batch, chỉ gọi model cho các cặp chưa có trong cache điểm (LRU trong bộ nhớ)
+- HybridRetriever lấy dư ứng viên (mặc định 50) rồi chỉ giữ vài chunk tốt nhất cho agent
+
+Biến môi trường:
+- RERANKER_ENABLED=1 để bật mặc định cho retriever của giao diện/API
+- RERANKER_MODEL: model cross-encoder (mặc định model đa ngôn ngữ, hỗ trợ tiếng Việt)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+import registry
+import tracing
+from hybrid_retriever import chunk_key
+
+RERANKER_ENABLED = os.getenv("RERANKER_ENABLED", "0") == "1"
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANKER_CACHE_SIZE = int(os.getenv("RERANKER_CACHE_SIZE", "20000"))
+
+
+class CrossEncoderReranker:
+    """
+    Cross-encoder của sentence-transformers kèm cache điểm
+    Args:
+        model_name (str): Tên model cross-encoder trên HuggingFace
+        batch_size (int): Số cặp (câu hỏi, chunk) mỗi lần chạy model
+        max_length (int): Số token tối đa của một cặp, phần dư bị cắt
+        max_chars (int): Cắt trước nội dung chunk theo số ký tự (chunk 10000 ký tự vẫn bị
+                         model cắt còn max_length token, cắt sớm để tokenize nhanh hơn)
+        cache_size (int): Số điểm tối đa giữ trong cache
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL, batch_size: int = 16, max_length: int = 512,
+                 max_chars: int = 2000, cache_size: int = RERANKER_CACHE_SIZE):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.cache_size = cache_size
+        self.stats = {"hits": 0, "misses": 0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: str, doc: Document) -> str:
+        digest = hashlib.sha256(query.strip().encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(chunk_key(doc).encode("utf-8"))
+        return digest.hexdigest()
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """
+        Điểm liên quan của từng chunk với câu hỏi (càng cao càng liên quan)
+        """
+        keys = [self._key(query, doc) for doc in documents]
+        scores = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+        missing = {}
+        for key, doc in zip(keys, documents):
+            if key not in scores and key not in missing:
+                missing[key] = doc
+        self.stats["hits"] += len(keys) - len(missing)
+        self.stats["misses"] += len(missing)
+        tracing.add_count("rerank_cache_hits", len(keys) - len(missing))
+
+        if missing:
+            pairs = [(query, doc.page_content[:self.max_chars]) for doc in missing.values()]
+            predicted = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            computed = dict(zip(missing.keys(), (float(value) for value in predicted)))
+            scores.update(computed)
+            with self._lock:
+                self._cache.update(computed)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [scores[key] for key in keys]
+
+    def rerank(self, query: str, documents: List[Document], top_n: int = 4) -> List[Document]:
+        """
+        Sắp xếp lại documents theo điểm cross-encoder
+        Args:
+            query (str): Câu hỏi
+            documents (list): Các ứng viên từ bước tìm kiếm
+            top_n (int): Số chunk giữ lại
+        Returns:
+            list: top_n Document tốt nhất, metadata có thêm 'rerank_score'
+        """
+        if not documents:
+            return []
+        with tracing.span("retriever.rerank", candidates=len(documents), model=self.model_name):
+            scores = self.score(query, documents)
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)[:top_n]
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score})
+            for doc, score in ranked
+        ]
+
+
+def get_reranker(model_name: Optional[str] = None) -> CrossEncoderReranker:
+    """
+    Cross-encoder dùng chung trong tiến trình (chỉ load model một lần)
+    """
+    model_name = model_name or RERANKER_MODEL
+    return registry.get_or_create(("reranker", model_name), lambda: CrossEncoderReranker(model_name))
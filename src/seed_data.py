@@ -1,92 +1,411 @@
 import os
-import json
-from langchain_openai import OpenAIEmbeddings
+import hashlib
 from langchain_milvus import Milvus
 from langchain.schema import Document
-from pymilvus import connections
 from dotenv import load_dotenv
-from uuid import uuid4
-from crawl import crawl_web
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings  
+from corpus_io import iter_corpus
+from snapshot import CorpusSnapshot, is_snapshot
+from embedding_cache import embedding_model_name
+from answer_cache import get_answer_cache
+import registry
+import tracing
+from dedup import DEDUP_ENABLED, drop_near_duplicates
+from bm25_index import BM25Index, delete_bm25_index, load_bm25_index, save_bm25_index
+from local_vectorstore import LocalVectorStore, LOCAL_VECTOR_DIR
+from collection_profiles import (
+    create_scalar_indexes, get_profile, load_collection_profile, local_kwargs, milvus_kwargs,
+    resolve_profile, save_collection_profile
+)
 
 load_dotenv()
 
 def load_data_from_local(filename: str, directory: str) -> tuple:
     """
-    Hàm đọc dữ liệu từ file JSON local
+    Hàm đọc dữ liệu từ file corpus local (JSON array hoặc JSONL)
     Args:
-        filename (str): Tên file JSON cần đọc (ví dụ: 'data.json')
+        filename (str): Tên file cần đọc (ví dụ: 'data.json' hoặc 'data.jsonl')
         directory (str): Thư mục chứa file (ví dụ: 'data_v3')
     Returns:
         tuple: Trả về (data, doc_name) trong đó:
-            - data: Dữ liệu JSON đã được parse
-            - doc_name: Tên tài liệu đã được xử lý (bỏ đuôi .json và thay '_' bằng khoảng trắng)
+            - data: Iterator các bản ghi, đọc dần từ file (không load cả file vào bộ nhớ)
+            - doc_name: Tên tài liệu đã được xử lý (bỏ đuôi file và thay '_' bằng khoảng trắng)
     """
     file_path = os.path.join(directory, filename)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    data = iter_corpus(file_path)
     print(f'Data loaded from {file_path}')
-    # Chuyển tên file thành tên tài liệu (bỏ đuôi .json và thay '_' bằng khoảng trắng)
+    # Chuyển tên file thành tên tài liệu (bỏ đuôi file và thay '_' bằng khoảng trắng)
     return data, filename.rsplit('.', 1)[0].replace('_', ' ')
 
-def seed_milvus(URI_link: str, collection_name: str, filename: str, directory: str, use_ollama: bool = False, use_hf: bool = True) -> Milvus:
+def get_embeddings(use_ollama: bool = False, use_hf: bool = True, cache: bool = True):
+    """
+    Khởi tạo model embeddings tùy theo lựa chọn
+    Args:
+        use_ollama (bool): Sử dụng Ollama embeddings
+        use_hf (bool): Sử dụng HuggingFace embeddings (ưu tiên nếu cả hai cùng bật)
+        cache (bool): Bọc model bằng cache embeddings trên đĩa (xem embedding_cache.py)
+    Returns:
+        Embeddings: HuggingFace, Ollama hoặc OpenAI embeddings (dùng chung qua registry)
+    """
+    return registry.get_embeddings(registry.embedding_backend(use_ollama, use_hf), cache=cache)
+
+def get_embedding_executor(use_ollama: bool = False, use_hf: bool = True):
+    """
+    Lấy bộ thực thi embedding theo batch/song song cho model tương ứng (xem embedding_executor.py)
+    Args:
+        use_ollama (bool): Sử dụng Ollama embeddings
+        use_hf (bool): Sử dụng HuggingFace embeddings (ưu tiên nếu cả hai cùng bật)
+    """
+    return registry.get_embedding_executor(registry.embedding_backend(use_ollama, use_hf))
+
+def normalize_metadata(metadata: dict, doc_name: str) -> dict:
+    """
+    Chuẩn hóa metadata của một chunk với giá trị mặc định cho các trường
+    Args:
+        metadata (dict): Metadata gốc (từ file JSON hoặc từ crawler)
+        doc_name (str): Tên tài liệu gán cho chunk
+    Returns:
+        dict: Metadata với đầy đủ các trường mà collection Milvus yêu cầu
+    """
+    return {
+        'source': metadata.get('source') or '',
+        'content_type': metadata.get('content_type') or 'text/plain',
+        'title': metadata.get('title') or '',
+        'description': metadata.get('description') or '',
+        'language': metadata.get('language') or 'en',
+        'doc_name': doc_name,
+        'start_index': metadata.get('start_index') or 0
+    }
+
+def document_id(doc: Document) -> str:
+    """
+    Tạo ID xác định (deterministic) cho một chunk từ nội dung, source và start_index
+    Args:
+        doc (Document): Chunk cần tạo ID
+    Returns:
+        str: SHA-256 hex, không đổi giữa các lần seed nếu chunk không đổi
+    """
+    digest = hashlib.sha256()
+    for part in (doc.metadata.get('source') or '', str(doc.metadata.get('start_index') or 0), doc.page_content):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')  # Phân tách các trường để tránh va chạm khi ghép chuỗi
+    return digest.hexdigest()
+
+def resolve_uri(uri: str) -> str:
+    """
+    Trả về URI vector store thực sự dùng: biến môi trường VECTOR_STORE_URI (nếu có) ghi đè URI trong code
+    Ví dụ VECTOR_STORE_URI=local:// để chạy toàn bộ project không cần Milvus
+    """
+    return os.getenv("VECTOR_STORE_URI") or uri
+
+def create_vectorstore(uri: str, collection_name: str, embeddings, drop_old: bool = False, connection_args: dict = None, profile: dict = None):
+    """
+    Tạo vector store theo URI
+    Args:
+        uri (str): 'http://...' cho Milvus, 'local://' hoặc 'local://<thư mục>' cho vector store local
+        collection_name (str): Tên collection
+        embeddings: Model embeddings
+        drop_old (bool): Xóa dữ liệu cũ của collection
+        connection_args (dict): Tham số kết nối Milvus, mặc định {'uri': uri}
+        profile (dict): Profile index/tìm kiếm (xem collection_profiles.py), mặc định profile 'default'
+    Returns:
+        Milvus hoặc LocalVectorStore (cùng API add_embeddings/delete/similarity_search...)
+    """
+    uri = resolve_uri(uri)
+    profile = profile or get_profile("default")
+    if uri.startswith("local://"):
+        return LocalVectorStore(
+            embedding_function=embeddings,
+            collection_name=collection_name,
+            directory=uri[len("local://"):] or LOCAL_VECTOR_DIR,
+            drop_old=drop_old,
+            **local_kwargs(profile)
+        )
+    return Milvus(
+        embedding_function=embeddings,
+        connection_args=connection_args or {"uri": uri},
+        collection_name=collection_name,
+        drop_old=drop_old,
+        **milvus_kwargs(profile)
+    )
+
+def iter_collection(vectorstore: Milvus, output_fields: list = None, batch_size: int = 1000):
+    """
+    Duyệt toàn bộ bản ghi của collection theo từng trang bằng query iterator
+    Args:
+        vectorstore (Milvus): Vector store đã kết nối
+        output_fields (list): Các trường cần lấy, mặc định mọi trường trừ vector
+        batch_size (int): Số bản ghi mỗi trang
+    Yields:
+        list: Danh sách bản ghi (dict) của từng trang
+    """
+    if isinstance(vectorstore, LocalVectorStore):
+        yield from vectorstore.iter_batches(output_fields, batch_size)
+        return
+    if vectorstore.col is None:
+        return
+    if output_fields is None:
+        output_fields = [field.name for field in vectorstore.col.schema.fields if field.name != vectorstore._vector_field]
+    iterator = vectorstore.col.query_iterator(batch_size=batch_size, expr="", output_fields=output_fields)
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            yield batch
+    finally:
+        iterator.close()
+
+def get_existing_ids(vectorstore: Milvus, batch_size: int = 1000) -> set:
+    """
+    Lấy toàn bộ ID đang có trong collection bằng query iterator (phân trang)
+    Args:
+        vectorstore (Milvus): Vector store đã kết nối
+        batch_size (int): Số bản ghi mỗi trang
+    Returns:
+        set: Tập ID hiện có (rỗng nếu collection chưa tồn tại)
+    """
+    pk_field = vectorstore._primary_field
+    existing_ids = set()
+    for batch in iter_collection(vectorstore, [pk_field], batch_size):
+        existing_ids.update(row[pk_field] for row in batch)
+    return existing_ids
+
+def build_bm25_index(vectorstore: Milvus, batch_size: int = 1000) -> BM25Index:
+    """
+    Dựng chỉ mục BM25 từ toàn bộ chunk trong collection (đọc phân trang, không giới hạn số lượng)
+    Args:
+        vectorstore (Milvus): Vector store đã kết nối
+        batch_size (int): Số bản ghi mỗi trang
+    Returns:
+        BM25Index: Chỉ mục BM25 chứa mọi chunk của collection
+    """
+    pk_field, text_field = vectorstore._primary_field, vectorstore._text_field
+    # Mỗi trang được đưa vào chỉ mục rồi bỏ (văn bản ghi ra file tạm, CSR gộp một lần khi tìm/lưu):
+    # bộ nhớ không tăng theo kích thước collection
+    index = BM25Index()
+    for batch in iter_collection(vectorstore, batch_size=batch_size):
+        index.update(
+            (row[pk_field], Document(
+                page_content=row[text_field],
+                metadata={key: value for key, value in row.items() if key not in (pk_field, text_field)}
+            ))
+            for row in batch
+        )
+    return index
+
+def get_bm25_index(vectorstore: Milvus, collection_name: str) -> BM25Index:
+    """
+    Đọc chỉ mục BM25 của collection; nếu chưa có (collection seed từ phiên bản cũ) thì dựng từ Milvus và lưu lại
+    Args:
+        vectorstore (Milvus): Vector store của collection
+        collection_name (str): Tên collection
+    Returns:
+        BM25Index: Chỉ mục chứa toàn bộ chunk của collection
+    """
+    bm25_index = load_bm25_index(collection_name)
+    if bm25_index is None:
+        bm25_index = build_bm25_index(vectorstore)
+        save_bm25_index(bm25_index, collection_name)
+    return bm25_index
+
+def prepare_bm25_index(vectorstore: Milvus, collection_name: str, incremental: bool) -> BM25Index:
+    """
+    Lấy chỉ mục BM25 để cập nhật cùng lúc với lần seed
+    Args:
+        vectorstore (Milvus): Vector store của collection
+        collection_name (str): Tên collection
+        incremental (bool): False khi collection vừa được tạo lại (trả về chỉ mục rỗng)
+    Returns:
+        BM25Index: Chỉ mục đã lưu, hoặc dựng từ Milvus nếu chưa có trên đĩa
+    """
+    if not incremental:
+        return BM25Index()
+    bm25_index = load_bm25_index(collection_name)
+    return bm25_index if bm25_index is not None else build_bm25_index(vectorstore)
+
+def finish_seed(vectorstore: Milvus, collection_name: str, bm25_index: BM25Index = None) -> None:
+    """
+    Lưu chỉ mục BM25 và xóa retriever/agent, câu trả lời đã cache của collection sau một lần seed
+    Args:
+        vectorstore (Milvus): Vector store vừa seed
+        collection_name (str): Tên collection
+        bm25_index (BM25Index): Chỉ mục đã cập nhật cùng lần seed; None khi seed dừng giữa chừng
+                                (bị hủy hoặc lỗi) thì dựng lại từ Milvus
+    Chú ý:
+        - Gọi cả khi seed bị hủy/lỗi: chunk đã ghi vào Milvus nhưng thiếu trong BM25 sẽ bị lần seed
+          incremental sau coi là không đổi và không bao giờ được thêm vào chỉ mục
+        - Không dựng lại được (Milvus lỗi) thì xóa chỉ mục cũ, get_bm25_index dựng lại khi dùng
+    """
+    with tracing.span("seed.bm25_save"):
+        if bm25_index is not None:
+            save_bm25_index(bm25_index, collection_name)
+        else:
+            try:
+                save_bm25_index(build_bm25_index(vectorstore), collection_name)
+            except Exception as e:
+                print(f"Không dựng lại được chỉ mục BM25 của collection '{collection_name}': {str(e)}")
+                delete_bm25_index(collection_name)
+    # Retriever/agent đã lưu cho collection này không còn đúng với dữ liệu mới
+    registry.invalidate(collection_name)
+    get_answer_cache().invalidate_collection(collection_name)
+
+@tracing.traced("seed.upsert")
+def upsert_documents(vectorstore: Milvus, documents, incremental: bool = True, batch_size: int = 1000, bm25_index: BM25Index = None, vectors=None, embedder=None) -> dict:
+    """
+    Ghi documents vào Milvus với ID xác định, theo từng batch
+    Args:
+        vectorstore (Milvus): Vector store đích
+        documents (Iterable[Document]): Documents đã chuẩn hóa metadata, có thể là generator (đọc dần)
+        incremental (bool): Nếu True, chỉ embed/thêm chunk mới hoặc đã đổi và xóa chunk không còn;
+                            nếu False, thêm toàn bộ (dùng khi collection vừa được tạo lại)
+        batch_size (int): Số chunk mỗi lần embed + ghi, và mỗi lần xóa ID cũ
+        bm25_index (BM25Index): Nếu có, được cập nhật với đúng các chunk đã thêm/xóa
+        vectors (Iterable): Embeddings tính sẵn, cùng thứ tự với documents (bỏ qua bước embed)
+        embedder: Đối tượng có embed_documents() dùng để embed (thường là EmbeddingExecutor),
+                  mặc định dùng model embeddings của vectorstore
+    Returns:
+        dict: Thống kê {'added', 'deleted', 'unchanged'}
+    """
+    existing_ids = get_existing_ids(vectorstore) if incremental else set()
+    seen_ids = set()
+    batch = {}
+    batch_vectors = []
+    stats = {'added': 0, 'deleted': 0, 'unchanged': 0}
+
+    def flush():
+        if batch:
+            texts = [doc.page_content for doc in batch.values()]
+            with tracing.span("seed.embed", chunks=len(texts)):
+                batch_embeddings = batch_vectors if vectors is not None else (embedder or vectorstore.embeddings).embed_documents(texts)
+            with tracing.span("seed.write", chunks=len(texts)):
+                vectorstore.add_embeddings(
+                    texts=texts,
+                    embeddings=batch_embeddings,
+                    metadatas=[doc.metadata for doc in batch.values()],
+                    ids=list(batch.keys())
+                )
+            # Chỉ mục BM25 nhận từng batch rồi batch được bỏ: không giữ văn bản của cả corpus trong bộ nhớ
+            if bm25_index is not None:
+                with tracing.span("seed.bm25_update", chunks=len(batch)):
+                    bm25_index.update(batch.items())
+            stats['added'] += len(batch)
+            batch.clear()
+            batch_vectors.clear()
+
+    vector_iter = iter(vectors) if vectors is not None else None
+    for doc in documents:
+        doc_id = document_id(doc)
+        vector = next(vector_iter) if vector_iter is not None else None
+        # Loại bỏ chunk trùng lặp hoàn toàn (cùng ID) trong cùng một lần seed
+        if doc_id in seen_ids:
+            continue
+        seen_ids.add(doc_id)
+        if doc_id in existing_ids:
+            stats['unchanged'] += 1
+            continue
+        batch[doc_id] = doc
+        if vector_iter is not None:
+            batch_vectors.append(vector.tolist() if hasattr(vector, 'tolist') else list(vector))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    stale_ids = list(existing_ids - seen_ids)
+    for i in range(0, len(stale_ids), batch_size):
+        vectorstore.delete(ids=stale_ids[i:i + batch_size])
+    stats['deleted'] = len(stale_ids)
+    if bm25_index is not None and stale_ids:
+        bm25_index.update(removed_ids=stale_ids)
+
+    tracing.set_attributes(**{f'chunks_{key}': value for key, value in stats.items()})
+    print(f'Upsert stats: {stats}')
+    return stats
+
+def _stoppable(documents, stop_event):
+    """Dừng đọc documents khi stop_event được đặt (upsert_documents dừng trước bước xóa chunk cũ)"""
+    for doc in documents:
+        if stop_event.is_set():
+            raise InterruptedError("Seed bị dừng")
+        yield doc
+
+@tracing.traced("seed.file")
+def seed_milvus(URI_link: str, collection_name: str, filename: str, directory: str, use_ollama: bool = False, use_hf: bool = True, incremental: bool = False, profile: str = None, stop_event=None) -> Milvus:
     """
     Hàm tạo và lưu vector embeddings vào Milvus từ dữ liệu local
     Args:
         URI_link (str): Đường dẫn kết nối đến Milvus
         collection_name (str): Tên collection trong Milvus để lưu dữ liệu
-        filename (str): Tên file JSON chứa dữ liệu nguồn
+        filename (str): Tên file JSON/JSONL hoặc thư mục snapshot .snap chứa dữ liệu nguồn
         directory (str): Thư mục chứa file dữ liệu
         use_ollama (bool): Sử dụng Ollama embeddings thay vì 
         use_hf (bool): Sử dụng HuggingFace embeddings
+        incremental (bool): Giữ collection cũ, chỉ embed chunk mới/đã đổi và xóa chunk không còn
+        profile (str): Tên profile index/tìm kiếm (xem collection_profiles.PROFILES)
+        stop_event (threading.Event): Đặt để dừng giữa chừng (raise InterruptedError trước khi
+                                      xóa chunk cũ, dữ liệu đã ghi được giữ lại)
     """
     # Khởi tạo model embeddings tùy theo lựa chọn
-    if use_hf:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    elif use_ollama:
-        embeddings = OllamaEmbeddings(model="llama2")
-    else:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    tracing.set_attributes(collection=collection_name, incremental=incremental)
+    embeddings = get_embeddings(use_ollama, use_hf)
+    collection_profile = resolve_profile(collection_name, profile, keep_existing=incremental)
     
     # Đọc dữ liệu từ file local
     local_data, doc_name = load_data_from_local(filename, directory)
 
-    # Chuyển đổi dữ liệu thành danh sách các Document với giá trị mặc định cho các trường
-    documents = [
+    # Chuyển đổi dữ liệu thành các Document với giá trị mặc định cho các trường (đọc dần theo batch)
+    documents = (
         Document(
             page_content=doc.get('page_content') or '',
-            metadata={
-                'source': doc['metadata'].get('source') or '',
-                'content_type': doc['metadata'].get('content_type') or 'text/plain',
-                'title': doc['metadata'].get('title') or '',
-                'description': doc['metadata'].get('description') or '',
-                'language': doc['metadata'].get('language') or 'en',
-                'doc_name': doc_name,
-                'start_index': doc['metadata'].get('start_index') or 0
-            }
+            metadata=normalize_metadata(doc['metadata'], doc_name)
         )
         for doc in local_data
-    ]
-
-    print('documents: ', documents)
-
-    # Tạo ID duy nhất cho mỗi document
-    uuids = [str(uuid4()) for _ in range(len(documents))]
+    )
 
-    # Khởi tạo và cấu hình Milvus
-    vectorstore = Milvus(
-        embedding_function=embeddings,
-        connection_args={"uri": URI_link},
-        collection_name=collection_name,
-        drop_old=True  # Xóa data đã tồn tại trong collection
+    # Khởi tạo và cấu hình Milvus (hoặc vector store local nếu URI là 'local://...')
+    vectorstore = create_vectorstore(
+        URI_link,
+        collection_name,
+        embeddings,
+        drop_old=not incremental,  # Chế độ incremental giữ lại data đã tồn tại trong collection
+        profile=collection_profile
     )
-    # Thêm documents vào Milvus
-    vectorstore.add_documents(documents=documents, ids=uuids)
+    save_collection_profile(collection_name, collection_profile)
+    # Snapshot có embeddings tính sẵn bằng cùng model: ghi thẳng, không embed lại
+    vectors = None
+    file_path = os.path.join(directory, filename)
+    if is_snapshot(file_path):
+        snapshot = CorpusSnapshot(file_path)
+        if snapshot.embeddings is not None and snapshot.embedding_model == embedding_model_name(embeddings):
+            vectors = snapshot.embeddings
+    # Bỏ chunk gần trùng trước khi embed; embeddings tính sẵn phải khớp từng document nên snapshot
+    # có embeddings được ghi nguyên. Không xóa boilerplate: chunk trong file không phải trang web,
+    # dòng lặp lại giữa các chunk (cận tích phân, tiêu đề 'Định lý'...) là nội dung thật
+    if DEDUP_ENABLED and vectors is None:
+        documents = drop_near_duplicates(documents)
+    if stop_event is not None:
+        documents = _stoppable(documents, stop_event)
+
+    # Thêm documents vào Milvus với ID xác định theo nội dung, cập nhật chỉ mục BM25 cùng lúc
+    bm25_index = prepare_bm25_index(vectorstore, collection_name, incremental)
+    completed = False
+    try:
+        upsert_documents(
+            vectorstore,
+            documents,
+            incremental=incremental,
+            bm25_index=bm25_index,
+            vectors=vectors,
+            embedder=get_embedding_executor(use_ollama, use_hf)
+        )
+        create_scalar_indexes(vectorstore, collection_profile)
+        completed = True
+    finally:
+        finish_seed(vectorstore, collection_name, bm25_index if completed else None)
     print('vector: ', vectorstore)
     return vectorstore
 
-def seed_milvus_live(URL: str, URI_link: str, collection_name: str, doc_name: str, use_ollama: bool = False, use_hf: bool = True) -> Milvus:
+@tracing.traced("seed.live")
+def seed_milvus_live(URL: str, URI_link: str, collection_name: str, doc_name: str, use_ollama: bool = False, use_hf: bool = True, incremental: bool = False, progress_callback=None, stop_event=None, profile: str = None) -> Milvus:
     """
     Hàm crawl dữ liệu trực tiếp từ URL và tạo vector embeddings trong Milvus
     Args:
@@ -95,39 +414,61 @@ def seed_milvus_live(URL: str, URI_link: str, collection_name: str, doc_name: st
         collection_name (str): Tên collection trong Milvus
         doc_name (str): Tên định danh cho tài liệu được crawl
         use_ollama (bool): Sử dụng Ollama embeddings thay vì OpenAI
+        incremental (bool): Giữ collection cũ, chỉ embed chunk mới/đã đổi và xóa chunk không còn
+        progress_callback (Callable): Nhận pipeline.PipelineProgress trong lúc chạy
+        stop_event (threading.Event): Đặt để dừng giữa chừng, lần gọi sau sẽ chạy tiếp từ checkpoint
+        profile (str): Tên profile index/tìm kiếm (xem collection_profiles.PROFILES)
+    Chú ý:
+        - Crawl, chia chunk, embed và ghi Milvus chạy dạng streaming (xem pipeline.py),
+          dữ liệu có thể tìm kiếm được ngay khi từng batch được ghi
     """
     # Khởi tạo model embeddings tùy theo lựa chọn
-    if use_hf:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    elif use_ollama:
-        embeddings = OllamaEmbeddings(model="llama2")
-    else:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    
-    documents = crawl_web(URL)
+    tracing.set_attributes(collection=collection_name, incremental=incremental)
+    embeddings = get_embeddings(use_ollama, use_hf)
 
-    # Cập nhật metadata cho mỗi document với giá trị mặc định
-    for doc in documents:
-        metadata = {
-            'source': doc.metadata.get('source') or '',
-            'content_type': doc.metadata.get('content_type') or 'text/plain',
-            'title': doc.metadata.get('title') or '',
-            'description': doc.metadata.get('description') or '',
-            'language': doc.metadata.get('language') or 'en',
-            'doc_name': doc_name,
-            'start_index': doc.metadata.get('start_index') or 0
-        }
-        doc.metadata = metadata
-
-    uuids = [str(uuid4()) for _ in range(len(documents))]
-
-    vectorstore = Milvus(
-        embedding_function=embeddings,
-        connection_args={"uri": URI_link},
-        collection_name=collection_name,
-        drop_old=True
+    # Crawler (aiohttp, bs4) chỉ được import khi crawl, không làm chậm việc kết nối retriever
+    from pipeline import PipelineCheckpoint, run_live_pipeline
+
+    # Nếu lần chạy trước bị ngắt, giữ collection và chạy tiếp từ checkpoint
+    checkpoint = PipelineCheckpoint(collection_name, URL)
+    resuming = checkpoint.exists()
+    collection_profile = resolve_profile(collection_name, profile, keep_existing=incremental or resuming)
+
+    vectorstore = create_vectorstore(
+        URI_link,
+        collection_name,
+        embeddings,
+        drop_old=not (incremental or resuming),
+        profile=collection_profile
     )
-    vectorstore.add_documents(documents=documents, ids=uuids)
+    # Lưu ngay để lần chạy tiếp (sau khi bị ngắt) dùng lại đúng profile
+    save_collection_profile(collection_name, collection_profile)
+    # Khi chạy tiếp, chỉ mục BM25 trên đĩa chưa có các chunk đã ghi ở lần trước: dựng lại từ Milvus
+    if resuming:
+        bm25_index = build_bm25_index(vectorstore)
+    else:
+        bm25_index = prepare_bm25_index(vectorstore, collection_name, incremental)
+
+    # Pipeline dừng bằng stop_event vẫn trả về bình thường (chỉ mục có đủ các batch đã ghi)
+    completed = False
+    try:
+        run_live_pipeline(
+            URL,
+            vectorstore,
+            get_embedding_executor(use_ollama, use_hf),
+            checkpoint,
+            id_fn=document_id,
+            metadata_fn=lambda metadata: normalize_metadata(metadata, doc_name),
+            existing_ids=get_existing_ids(vectorstore) if (incremental or resuming) else set(),
+            delete_stale=incremental,
+            bm25_index=bm25_index,
+            progress_callback=progress_callback,
+            stop_event=stop_event
+        )
+        create_scalar_indexes(vectorstore, collection_profile)
+        completed = True
+    finally:
+        finish_seed(vectorstore, collection_name, bm25_index if completed else None)
     print('vector: ', vectorstore)
     return vectorstore
 
@@ -141,16 +482,28 @@ def connect_to_milvus(uri: str, collection_name: str) -> Milvus:
         Milvus: Đối tượng Milvus đã được kết nối, sẵn sàng để truy vấn
     Chú ý:
         - Không tạo collection mới hoặc xóa dữ liệu cũ
+        - URI 'local://...' (hoặc biến môi trường VECTOR_STORE_URI) dùng vector store local thay cho Milvus
+        - Kết quả được lưu trong registry, các lần gọi sau không kết nối lại
         - Sử dụng model 'text-embedding-3-large' cho việc tạo embeddings khi truy vấn
     """
-    connections.connect(alias="default", uri=uri)
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = Milvus(
-        embedding_function=embeddings,
-        collection_name=collection_name,
-        connection_args={"alias": "default"}
-    )
-    return vectorstore
+    uri = resolve_uri(uri)
+
+    def create():
+        embeddings = get_embeddings(use_ollama=False, use_hf=True)
+        # Dùng tham số tìm kiếm của profile đã chọn lúc seed
+        profile = load_collection_profile(collection_name)
+        if uri.startswith("local://"):
+            return create_vectorstore(uri, collection_name, embeddings, profile=profile)
+        return create_vectorstore(
+            uri,
+            collection_name,
+            embeddings,
+            connection_args={"alias": registry.get_connection(uri)},
+            profile=profile
+        )
+
+    # Dùng lại vector store (và model embeddings, kết nối) đã tạo trong tiến trình
+    return registry.get_cached("vectorstore", collection_name, create, uri)
 
 def main():
     """
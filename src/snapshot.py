@@ -0,0 +1,171 @@
+"""
+Snapshot nhị phân của corpus, đọc bằng memory-map
+Cấu trúc thư mục <tên>.snap/:
+- manifest.json: số bản ghi, danh sách khóa metadata, thông tin embeddings (nếu có)
+- texts.bin + offsets.npy: toàn bộ page_content nối liền (UTF-8), bản ghi i nằm trong [offsets[i], offsets[i+1])
+- meta_values.json + meta_<khóa>.npy: metadata mã hóa từ điển (mỗi giá trị khác nhau lưu một lần, -1 = không có)
+- embeddings.npy: ma trận float16/float32 (tùy chọn) embeddings tính sẵn
+"""
+
+import os
+import json
+import shutil
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+
+def is_snapshot(path: str) -> bool:
+    """Kiểm tra path có phải thư mục snapshot không"""
+    return os.path.isfile(os.path.join(path, "manifest.json"))
+
+
+class CorpusSnapshot:
+    """
+    Snapshot đã mở; văn bản, metadata và embeddings chỉ được đọc từ đĩa khi truy cập
+    Args:
+        path (str): Thư mục snapshot
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        with open(os.path.join(path, "meta_values.json"), "r", encoding="utf-8") as file:
+            self._meta_values = json.load(file)
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        count = self.manifest["count"]
+        # np.memmap không mở được file rỗng
+        self._texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r") if self._offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self._meta_codes = {
+            key: np.load(os.path.join(path, f"meta_{index}.npy"), mmap_mode="r")
+            for index, key in enumerate(self.manifest["metadata_keys"])
+        }
+        embedding_info = self.manifest.get("embeddings")
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r") if embedding_info else None
+        self.embedding_model = embedding_info["model"] if embedding_info else None
+        assert len(self._offsets) == count + 1
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def text(self, i: int) -> str:
+        """page_content của bản ghi thứ i"""
+        return bytes(self._texts[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def metadata(self, i: int) -> dict:
+        """metadata của bản ghi thứ i"""
+        metadata = {}
+        for key, codes in self._meta_codes.items():
+            code = int(codes[i])
+            if code >= 0:
+                metadata[key] = self._meta_values[key][code]
+        return metadata
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield {"page_content": self.text(i), "metadata": self.metadata(i)}
+
+
+def write_snapshot(records: Iterable[dict], path: str, embeddings=None, model_name: Optional[str] = None,
+                   dtype: str = "float16", batch_size: int = 256) -> int:
+    """
+    Ghi snapshot từ một iterator bản ghi (ghi dần, không giữ toàn bộ văn bản trong bộ nhớ)
+    Args:
+        records (Iterable[dict]): Các bản ghi {'page_content': ..., 'metadata': {...}}
+        path (str): Thư mục snapshot đích (thường có đuôi .snap)
+        embeddings: Model embeddings; nếu có, embeddings được tính theo batch và lưu kèm
+        model_name (str): Tên model lưu trong manifest (dùng khi seed để biết có dùng lại được không)
+        dtype (str): 'float16' hoặc 'float32' cho ma trận embeddings
+        batch_size (int): Số bản ghi mỗi lần gọi model embeddings
+    Returns:
+        int: Số bản ghi đã ghi
+    """
+    tmp_path = path.rstrip(os.sep) + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    offsets = [0]
+    meta_keys = {}      # khóa -> vị trí
+    meta_values = {}    # khóa -> danh sách giá trị
+    meta_lookup = {}    # khóa -> {giá trị (dạng JSON): mã}
+    meta_codes = []     # vị trí khóa -> danh sách mã theo bản ghi
+    vectors_file = None
+    dim = None
+    pending = []
+
+    def flush_vectors():
+        nonlocal vectors_file, dim
+        if not pending:
+            return
+        vectors = np.asarray(embeddings.embed_documents(pending), dtype=dtype)
+        if vectors_file is None:
+            dim = vectors.shape[1]
+            vectors_file = open(os.path.join(tmp_path, "vectors.raw"), "wb")
+        vectors_file.write(vectors.tobytes())
+        pending.clear()
+
+    with open(os.path.join(tmp_path, "texts.bin"), "wb") as texts_file:
+        for count, record in enumerate(records):
+            text = record.get("page_content") or ""
+            encoded = text.encode("utf-8")
+            texts_file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+            for key, value in (record.get("metadata") or {}).items():
+                if key not in meta_keys:
+                    meta_keys[key] = len(meta_keys)
+                    meta_values[key] = []
+                    meta_lookup[key] = {}
+                    meta_codes.append([-1] * count)
+                lookup_key = json.dumps(value, sort_keys=True)
+                code = meta_lookup[key].get(lookup_key)
+                if code is None:
+                    code = meta_lookup[key][lookup_key] = len(meta_values[key])
+                    meta_values[key].append(value)
+                codes = meta_codes[meta_keys[key]]
+                codes.extend([-1] * (count - len(codes)))
+                codes.append(code)
+
+            if embeddings is not None:
+                pending.append(text)
+                if len(pending) >= batch_size:
+                    flush_vectors()
+    total = len(offsets) - 1
+
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    for key, index in meta_keys.items():
+        codes = meta_codes[index]
+        codes.extend([-1] * (total - len(codes)))
+        np.save(os.path.join(tmp_path, f"meta_{index}.npy"), np.asarray(codes, dtype=np.int32))
+    with open(os.path.join(tmp_path, "meta_values.json"), "w", encoding="utf-8") as file:
+        json.dump(meta_values, file, ensure_ascii=False)
+
+    embedding_info = None
+    if embeddings is not None:
+        flush_vectors()
+        if vectors_file is not None:
+            vectors_file.close()
+            # Chuyển dữ liệu thô thành file .npy có header để đọc lại bằng mmap
+            raw = np.memmap(os.path.join(tmp_path, "vectors.raw"), dtype=dtype, mode="r", shape=(total, dim))
+            np.save(os.path.join(tmp_path, "embeddings.npy"), raw)
+            del raw
+            os.remove(os.path.join(tmp_path, "vectors.raw"))
+            embedding_info = {"model": model_name, "dtype": dtype, "dim": dim}
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "count": total,
+        "metadata_keys": sorted(meta_keys, key=meta_keys.get),
+        "embeddings": embedding_info,
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=4)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return total
@@ -0,0 +1,161 @@
+"""
+Stream câu trả lời của agent theo từng token
+Chức năng:
+- Đọc luồng sự kiện astream_events (version="v2") của AgentExecutor
+- Chuyển thành các sự kiện đơn giản: token, bắt đầu/kết thúc gọi tool, kết thúc
+- Đo thời gian tới token đầu tiên (time-to-first-token) và tổng thời gian
+- Ghi span cho cả lượt trả lời, từng lần gọi LLM và từng lần gọi tool (xem tracing.py)
+- Bản đồng bộ (event loop chạy trong thread riêng) cho Streamlit
+"""
+
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional
+
+import tracing
+
+
+@dataclass
+class StreamEvent:
+    """
+    Một sự kiện trong quá trình agent trả lời
+    Args:
+        kind (str): 'token', 'tool_start', 'tool_end' hoặc 'done'
+        text (str): Token (kind='token'), input/output của tool, hoặc câu trả lời đầy đủ (kind='done')
+        name (str): Tên tool (kind='tool_start'/'tool_end')
+        elapsed_s (float): Thời gian từ lúc bắt đầu (giây)
+        timings (dict): Chỉ có ở kind='done': ttft_s, total_s, tokens
+    """
+    kind: str
+    text: str = ""
+    name: str = ""
+    elapsed_s: float = 0.0
+    timings: dict = field(default_factory=dict)
+
+
+def _chunk_text(chunk) -> str:
+    """Lấy phần văn bản của một AIMessageChunk (content có thể là str hoặc list các phần)"""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
+    )
+
+
+async def astream_agent(agent_executor, inputs: dict, config: Optional[dict] = None) -> AsyncIterator[StreamEvent]:
+    """
+    Stream câu trả lời của agent
+    Args:
+        agent_executor: AgentExecutor từ get_llm_and_agent
+        inputs (dict): {'input': ..., 'chat_history': [...]}
+        config (dict): Config của LangChain (callbacks, tags...)
+    Yields:
+        StreamEvent: Các sự kiện theo thứ tự xảy ra
+    """
+    with tracing.span("agent.stream") as stream_span:
+        start = time.perf_counter()
+        ttft = None
+        tokens = 0
+        output = None
+        pieces = []
+        # run_id -> (thời điểm bắt đầu (ns), số token) của các lần gọi LLM/tool đang chạy
+        llm_runs = {}
+        tool_runs = {}
+
+        events = agent_executor.astream_events(inputs, config=config, version="v2")
+        try:
+            async for event in events:
+                kind = event["event"]
+                elapsed = time.perf_counter() - start
+                if kind == "on_chat_model_start":
+                    llm_runs[event["run_id"]] = [time.time_ns(), 0]
+                elif kind == "on_chat_model_stream":
+                    text = _chunk_text(event["data"].get("chunk"))
+                    # Chunk rỗng là phần function call của LLM, không hiển thị
+                    if not text:
+                        continue
+                    if ttft is None:
+                        ttft = elapsed
+                    tokens += 1
+                    if event["run_id"] in llm_runs:
+                        llm_runs[event["run_id"]][1] += 1
+                    pieces.append(text)
+                    yield StreamEvent("token", text=text, elapsed_s=elapsed)
+                elif kind == "on_chat_model_end":
+                    run = llm_runs.pop(event["run_id"], None)
+                    if run is not None:
+                        tracing.record_span("agent.llm", run[0], time.time_ns(), model=event.get("name", ""), tokens=run[1])
+                elif kind == "on_tool_start":
+                    # Token sinh ra trước khi gọi tool không thuộc câu trả lời cuối
+                    pieces = []
+                    tool_runs[event["run_id"]] = time.time_ns()
+                    tool_input = event["data"].get("input")
+                    yield StreamEvent("tool_start", text=str(tool_input or ""), name=event["name"], elapsed_s=elapsed)
+                elif kind == "on_tool_end":
+                    tool_output = event["data"].get("output")
+                    text = str(getattr(tool_output, "content", tool_output) or "")
+                    tool_start = tool_runs.pop(event["run_id"], None)
+                    if tool_start is not None:
+                        tracing.record_span("agent.tool", tool_start, time.time_ns(), tool=event["name"], output_chars=len(text))
+                    yield StreamEvent("tool_end", text=text, name=event["name"], elapsed_s=elapsed)
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # Sự kiện kết thúc của chain ngoài cùng chứa câu trả lời đầy đủ
+                    result = event["data"].get("output")
+                    if isinstance(result, dict) and "output" in result:
+                        output = result["output"]
+        finally:
+            # Đóng luồng sự kiện (hủy lần gọi LLM/tool đang chạy) khi bên nhận dừng giữa chừng
+            await events.aclose()
+
+        total = time.perf_counter() - start
+        timings = {"ttft_s": ttft if ttft is not None else total, "total_s": total, "tokens": tokens}
+        stream_span.set(ttft_s=timings["ttft_s"], tokens=tokens)
+    print(f"Agent stream: TTFT {timings['ttft_s']:.2f}s, tổng {total:.2f}s, {tokens} token")
+    yield StreamEvent("done", text=output if output is not None else "".join(pieces), elapsed_s=total, timings=timings)
+
+
+def stream_agent(agent_executor, inputs: dict, config: Optional[dict] = None) -> Iterator[StreamEvent]:
+    """
+    Bản đồng bộ của astream_agent cho code không dùng asyncio (Streamlit)
+    Event loop chạy trong thread riêng, sự kiện được chuyển về qua hàng đợi
+    """
+    events = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    async def produce():
+        stream = astream_agent(agent_executor, inputs, config)
+        try:
+            async for event in stream:
+                events.put(event)
+                if stop.is_set():
+                    break
+        finally:
+            await stream.aclose()
+
+    def run():
+        try:
+            asyncio.run(produce())
+            events.put(done)
+        except BaseException as e:
+            events.put(e)
+
+    # Chạy trong bản sao ngữ cảnh hiện tại để span của agent nằm trong span của lượt chat
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name="agent-stream", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = events.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,338 @@
+"""
+Đo thời gian (tracing) cho toàn bộ pipeline: seed, crawl, retriever, agent, giao diện
+Chức năng:
+- Span lồng nhau theo ngữ cảnh (contextvars): thời gian, số token, số chunk, cache hit...
+- Ghi span ra file JSONL theo định dạng OTLP/JSON của OpenTelemetry
+  (đọc được bằng receiver otlpjsonfile của OpenTelemetry Collector)
+- Tổng hợp metrics dạng Prometheus (histogram thời gian, số lỗi, tổng các thuộc tính số)
+  để phục vụ qua GET /metrics của api.py hoặc HTTP server riêng (TRACING_METRICS_PORT)
+- Thu thập các span của một lượt chat để hiển thị bảng thời gian trên sidebar
+
+Biến môi trường:
+- TRACING_ENABLED=0 để tắt
+- TRACE_EXPORT_PATH: file JSONL, để trống để không ghi file
+- TRACING_METRICS_PORT: cổng HTTP phục vụ metrics Prometheus (0 = không chạy)
+"""
+
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, List, Optional
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", os.path.join(".cache", "traces.jsonl"))
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(64 * 2 ** 20)))
+TRACING_METRICS_PORT = int(os.getenv("TRACING_METRICS_PORT", "0"))
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "rag-starter")
+
+# Ngưỡng (giây) của histogram thời gian span
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Thuộc tính dạng đếm (theo tiền tố tên) được cộng dồn vào metrics; các thuộc tính cấu hình như k thì không
+COUNTED_ATTRIBUTES = ("tokens", "chunks", "pages", "hit", "cached", "embedding_cache_", "rerank_cache_", "dedup_", "candidates", "output_chars")
+
+_current_span = contextvars.ContextVar("tracing_current_span", default=None)
+_collectors = contextvars.ContextVar("tracing_collectors", default=())
+_lock = threading.Lock()
+_export_file = None
+_metrics_server = None
+# span -> {'buckets': [...], 'count', 'sum', 'errors', 'attributes': {tên: tổng}}
+_metrics = {}
+
+
+@dataclass
+class Span:
+    """
+    Một bước được đo thời gian
+    Args:
+        name (str): Tên bước, ví dụ 'retriever.search'
+        trace_id (str): ID của cả lượt xử lý (32 ký tự hex)
+        span_id (str): ID của span (16 ký tự hex)
+        parent_id (str): span_id của span cha, None nếu là span gốc
+        attributes (dict): Thuộc tính: số token, số chunk, cache hit...
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+    start_ns: int = 0
+    end_ns: int = 0
+    status: str = "ok"
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1) -> None:
+        """Cộng dồn một thuộc tính số (ví dụ số cache hit trong span)"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_otel(self) -> dict:
+        """Span theo định dạng OTLP/JSON"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 1 if self.status == "ok" else 2},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otel_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def current_span() -> Optional[Span]:
+    """Span đang mở trong ngữ cảnh hiện tại"""
+    return _current_span.get()
+
+
+def set_attributes(**attributes) -> None:
+    """Gán thuộc tính cho span đang mở (không làm gì nếu không có span)"""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def add_count(key: str, value: float = 1) -> None:
+    """Cộng dồn thuộc tính số của span đang mở (không làm gì nếu không có span)"""
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, value)
+
+
+def _new_span(name: str, attributes: dict) -> Span:
+    parent = _current_span.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent is not None else None,
+        attributes=dict(attributes),
+    )
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Đo thời gian một đoạn code
+    Args:
+        name (str): Tên bước
+        **attributes: Thuộc tính ban đầu của span
+    Ví dụ:
+        with tracing.span("retriever.search", k=8) as s:
+            ...
+            s.set(chunks=len(documents))
+    """
+    current = _new_span(name, attributes)
+    token = _current_span.set(current)
+    current.start_ns = time.time_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        _finish(current)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes) -> Span:
+    """
+    Ghi một span đã đo sẵn thời gian bên ngoài (ví dụ từ sự kiện bắt đầu/kết thúc gọi tool)
+    Span được gắn làm con của span đang mở
+    """
+    current = _new_span(name, attributes)
+    current.start_ns, current.end_ns = start_ns, end_ns
+    _finish(current)
+    return current
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator đo thời gian cả hàm, tên mặc định là <module>.<tên hàm>"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect() -> Iterator[List[Span]]:
+    """
+    Thu thập các span kết thúc trong ngữ cảnh này (kể cả trong thread/event loop chạy bằng
+    ngữ cảnh được sao chép), ví dụ để hiển thị thời gian từng bước của một lượt chat
+    """
+    spans = []
+    token = _collectors.set(_collectors.get() + (spans,))
+    try:
+        yield spans
+    finally:
+        _collectors.reset(token)
+
+
+def summarize(spans: List[Span]) -> List[dict]:
+    """
+    Sắp xếp các span thành bảng theo thứ tự bắt đầu, kèm độ sâu lồng nhau
+    Returns:
+        list: [{'step', 'depth', 'ms', 'attributes'}, ...]
+    """
+    by_id = {s.span_id: s for s in spans}
+
+    def depth(s: Span) -> int:
+        level = 0
+        while s.parent_id in by_id:
+            s = by_id[s.parent_id]
+            level += 1
+        return level
+
+    return [
+        {"step": s.name, "depth": depth(s), "ms": round(s.duration_ms, 2), "attributes": dict(s.attributes)}
+        for s in sorted(spans, key=lambda s: (s.start_ns, -s.end_ns))
+    ]
+
+
+def _finish(current: Span) -> None:
+    if not TRACING_ENABLED:
+        return
+    for spans in _collectors.get():
+        spans.append(current)
+    seconds = current.duration_ms / 1000
+    with _lock:
+        metric = _metrics.get(current.name)
+        if metric is None:
+            metric = _metrics[current.name] = {"buckets": [0] * len(DURATION_BUCKETS), "count": 0, "sum": 0.0, "errors": 0, "attributes": {}}
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                metric["buckets"][i] += 1
+        metric["count"] += 1
+        metric["sum"] += seconds
+        metric["errors"] += current.status != "ok"
+        for key, value in current.attributes.items():
+            if isinstance(value, (int, float)) and key.startswith(COUNTED_ATTRIBUTES):
+                metric["attributes"][key] = metric["attributes"].get(key, 0) + value
+        _export(current)
+
+
+def _export(current: Span) -> None:
+    """Ghi span ra file JSONL (gọi khi đang giữ _lock), file cũ được đổi tên thành .1 khi vượt giới hạn"""
+    global _export_file
+    if not TRACE_EXPORT_PATH:
+        return
+    try:
+        if _export_file is None:
+            directory = os.path.dirname(TRACE_EXPORT_PATH)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            _export_file = open(TRACE_EXPORT_PATH, "a", encoding="utf-8")
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "rag-starter.tracing"}, "spans": [current.to_otel()]}],
+            }]
+        }
+        _export_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _export_file.flush()
+        if _export_file.tell() > TRACE_EXPORT_MAX_BYTES:
+            _export_file.close()
+            _export_file = None
+            os.replace(TRACE_EXPORT_PATH, TRACE_EXPORT_PATH + ".1")
+    except OSError as e:
+        print(f"Không ghi được trace: {str(e)}")
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    """
+    Metrics dạng text exposition format của Prometheus
+    - rag_span_duration_seconds: histogram thời gian theo tên span
+    - rag_span_errors_total: số span kết thúc do lỗi
+    - rag_span_attribute_total: tổng các thuộc tính đếm (token, chunk, cache hit...) theo span
+    """
+    lines = [
+        "# HELP rag_span_duration_seconds Thời gian của từng bước trong pipeline",
+        "# TYPE rag_span_duration_seconds histogram",
+    ]
+    with _lock:
+        metrics = {name: {**metric, "attributes": dict(metric["attributes"])} for name, metric in _metrics.items()}
+    for name, metric in sorted(metrics.items()):
+        label = _label(name)
+        for bound, count in zip(DURATION_BUCKETS, metric["buckets"]):
+            lines.append(f'rag_span_duration_seconds_bucket{{span="{label}",le="{bound}"}} {count}')
+        lines.append(f'rag_span_duration_seconds_bucket{{span="{label}",le="+Inf"}} {metric["count"]}')
+        lines.append(f'rag_span_duration_seconds_sum{{span="{label}"}} {metric["sum"]}')
+        lines.append(f'rag_span_duration_seconds_count{{span="{label}"}} {metric["count"]}')
+    lines += ["# HELP rag_span_errors_total Số bước kết thúc do lỗi", "# TYPE rag_span_errors_total counter"]
+    for name, metric in sorted(metrics.items()):
+        lines.append(f'rag_span_errors_total{{span="{_label(name)}"}} {metric["errors"]}')
+    lines += ["# HELP rag_span_attribute_total Tổng các thuộc tính số của span", "# TYPE rag_span_attribute_total counter"]
+    for name, metric in sorted(metrics.items()):
+        for key, value in sorted(metric["attributes"].items()):
+            lines.append(f'rag_span_attribute_total{{span="{_label(name)}",attribute="{_label(key)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = TRACING_METRICS_PORT) -> Optional[int]:
+    """
+    Chạy HTTP server phục vụ metrics Prometheus trong thread nền (một lần cho mỗi tiến trình),
+    dùng cho các tiến trình không có FastAPI như Streamlit
+    Returns:
+        int: Cổng đang phục vụ, None nếu không bật
+    """
+    global _metrics_server
+    if not port or not TRACING_ENABLED:
+        return None
+    with _lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"Không mở được cổng metrics {port}: {str(e)}")
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="tracing-metrics", daemon=True).start()
+            print(f"Metrics Prometheus tại http://0.0.0.0:{port}/metrics")
+        return _metrics_server.server_address[1]
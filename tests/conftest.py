@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module nằm phẳng trong src (chạy với cwd là src), thêm vào sys.path để test import được
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,167 @@
+"""
+Test api.py với LLM giả và vector store local (LocalVectorStore) thay cho Milvus
+"""
+
+import os
+import json
+import asyncio
+import tempfile
+import threading
+
+# Hàng đợi job, trace và cache câu trả lời ghi vào thư mục tạm (đặt trước khi import api)
+_TMP_DIR = tempfile.mkdtemp(prefix="rag-api-test-")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_TMP_DIR, "jobs.sqlite"))
+os.environ.setdefault("TRACE_EXPORT_PATH", os.path.join(_TMP_DIR, "traces.jsonl"))
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from answer_cache import AnswerCache
+from api import create_app
+from bm25_index import BM25Index, tokenize
+from hybrid_retriever import HybridRetriever
+from local_vectorstore import LocalVectorStore
+
+TEXTS = [
+    "Stack AI là nền tảng xây dựng ứng dụng AI không cần code",
+    "Tích phân suy rộng loại một có cận vô hạn",
+    "Địa lý quyết định chính sách của các quốc gia",
+]
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeddings giả theo từ khóa; đếm số lần gọi và số câu trong mỗi lần gọi embed_documents"""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def _embed(self, text: str):
+        vector = [0.0] * self.dim
+        for token in tokenize(text):
+            vector[hash(token) % self.dim] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.batches.append(len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def fake_agent_factory(retriever, model: str):
+    """Agent giả: tìm tài liệu bằng retriever rồi stream câu trả lời của LLM giả"""
+    async def run(inputs: dict) -> dict:
+        documents = await retriever.ainvoke(inputs["input"])
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content=f"Trả lời: {documents[0].page_content}")]))
+        answer = ""
+        async for chunk in llm.astream(inputs["input"]):
+            answer += chunk.content
+        return {"output": answer}
+
+    return RunnableLambda(run)
+
+
+@pytest.fixture
+def embeddings():
+    return KeywordEmbeddings()
+
+
+@pytest.fixture
+def app(embeddings, tmp_path):
+    ids = [f"doc{i}" for i in range(len(TEXTS))]
+    vectorstore = LocalVectorStore(embeddings, "api_test", str(tmp_path / "vectors"), drop_old=True)
+    vectorstore.add_texts(TEXTS, [{"source": "test"}] * len(TEXTS), ids=ids)
+    bm25_index = BM25Index()
+    bm25_index.update((doc_id, Document(page_content=text, metadata={"source": "test"})) for doc_id, text in zip(ids, TEXTS))
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25_index=bm25_index, k=2, fetch_k=2)
+    embeddings.batches.clear()
+
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), embeddings=KeywordEmbeddings())
+    return create_app(lambda collection_name: retriever, fake_agent_factory, lambda: cache, warmup_collections=[])
+
+
+def parse_sse(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_retrieve(app):
+    with TestClient(app) as client:
+        response = client.post("/retrieve", json={"query": "tích phân suy rộng", "collection": "api_test"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["documents"][0]["page_content"] == TEXTS[1]
+    assert "total_ms" in body["timings"]
+
+
+def test_answer_and_cache(app):
+    request = {"question": "Stack AI là gì?", "collection": "api_test"}
+    with TestClient(app) as client:
+        first = client.post("/answer", json=request).json()
+        second = client.post("/answer", json=request).json()
+        follow_up = client.post("/answer", json={**request, "chat_history": [{"role": "human", "content": "xin chào"}]}).json()
+        invalid = client.post("/answer", json={**request, "model": "không-có"})
+    assert first == {"answer": f"Trả lời: {TEXTS[0]}", "cached": False}
+    assert second == {"answer": first["answer"], "cached": True}
+    assert follow_up["cached"] is False
+    assert invalid.status_code == 400
+
+
+def test_agent_rebuilt_when_retriever_recovers(embeddings, tmp_path):
+    # Retriever dự phòng (Milvus lỗi) không được cache, lần gọi sau trả về retriever thật
+    fallback = RunnableLambda(lambda query: [Document(page_content="Có lỗi xảy ra khi kết nối database")])
+    vectorstore = LocalVectorStore(embeddings, "api_recover", str(tmp_path / "vectors"), drop_old=True)
+    vectorstore.add_texts(TEXTS, [{"source": "test"}] * len(TEXTS), ids=["a", "b", "c"])
+    bm25_index = BM25Index()
+    bm25_index.update((doc_id, Document(page_content=text)) for doc_id, text in zip("abc", TEXTS))
+    retrievers = iter([fallback, HybridRetriever(vectorstore=vectorstore, bm25_index=bm25_index, k=2, fetch_k=2)])
+    app = create_app(lambda collection_name: next(retrievers), fake_agent_factory, None, warmup_collections=[])
+    request = {"question": "Stack AI là gì?", "collection": "api_recover"}
+    with TestClient(app) as client:
+        failed = client.post("/answer", json=request).json()
+        recovered = client.post("/answer", json=request).json()
+    assert "kết nối database" in failed["answer"]
+    assert recovered["answer"] == f"Trả lời: {TEXTS[0]}"
+
+
+def test_answer_stream(app):
+    with TestClient(app) as client:
+        response = client.post("/answer/stream", json={"question": "địa lý quốc gia", "collection": "api_test"})
+        cached = client.post("/answer/stream", json={"question": "địa lý quốc gia", "collection": "api_test"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    tokens = [data["text"] for kind, data in events if kind == "token"]
+    kind, done = events[-1]
+    assert kind == "done" and done["cached"] is False
+    assert done["answer"] == f"Trả lời: {TEXTS[2]}"
+    assert len(tokens) > 1 and "".join(tokens) == done["answer"]
+    assert parse_sse(cached.text) == [("done", {"answer": done["answer"], "cached": True})]
+
+
+def test_concurrent_queries_are_batched(app, embeddings):
+    queries = [f"câu hỏi số {i} về tích phân" for i in range(16)]
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/retrieve", json={"query": query, "collection": "api_test"}) for query in queries
+            ])
+
+    responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert sum(embeddings.batches) == len(queries)
+    assert len(embeddings.batches) < len(queries)
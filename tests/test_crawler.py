@@ -0,0 +1,161 @@
+"""
+Test crawler.py với server HTTP local (http.server trên thread riêng)
+"""
+
+import glob
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler import iter_crawl
+
+PAGES = 12
+
+
+class Site:
+    """Trang / link tới /page/0../page/N; đếm số request đồng thời và số request mỗi trang"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+        self.not_modified = 0
+        self.on_conditional = None  # Gọi khi nhận request có If-None-Match (trước khi trả 304)
+        self.files = False  # Trang / link thêm tới file PDF (theo đuôi URL và theo Content-Type)
+
+    def body(self, path: str) -> bytes:
+        if path == "/":
+            links = "".join(f'<a href="/page/{i}">Trang {i}</a>' for i in range(PAGES))
+            if self.files:
+                links += '<a href="/files/report.PDF">Báo cáo</a><a href="/download?id=1">Tải về</a>'
+            return f"<html><body><h1>Mục lục</h1>{links}</body></html>".encode("utf-8")
+        if path.startswith(("/files/", "/download")):
+            return b"%PDF-1.4 \xff\xfe binary"
+        return f"<html><body><p>Nội dung {path}</p></body></html>".encode("utf-8")
+
+    def content_type(self, path: str) -> str:
+        if path.startswith(("/files/", "/download")):
+            return "application/pdf"
+        return "text/html; charset=utf-8"
+
+
+def make_handler(site: Site):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with site.lock:
+                site.in_flight += 1
+                site.max_in_flight = max(site.max_in_flight, site.in_flight)
+                site.requests.append(self.path)
+            try:
+                time.sleep(site.delay)
+                if self.path == "/robots.txt":
+                    # Sai charset: crawler phải bỏ qua robots.txt thay vì dừng
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; charset=utf-8")
+                    self.end_headers()
+                    self.wfile.write(b"User-agent: *\n\xff\xfe Disallow: /nothing\n")
+                    return
+                etag = f'"{self.path}-v1"'
+                if self.headers.get("If-None-Match") == etag:
+                    if site.on_conditional:
+                        site.on_conditional()
+                    with site.lock:
+                        site.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = site.body(self.path)
+                self.send_response(200)
+                self.send_header("Content-Type", site.content_type(self.path))
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with site.lock:
+                    site.in_flight -= 1
+
+    return Handler
+
+
+@pytest.fixture
+def site():
+    site = Site()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(start_url: str, timeout: float = 30, **kwargs) -> list:
+    """Chạy iter_crawl trên thread riêng để test báo lỗi thay vì treo nếu crawler không kết thúc"""
+    result = {}
+
+    def run():
+        result["pages"] = list(iter_crawl(start_url, **kwargs))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "crawler không kết thúc"
+    return result["pages"]
+
+
+def test_per_host_concurrency(site, tmp_path):
+    pages = crawl(site.url, max_depth=1, per_host_concurrency=2, total_concurrency=8, cache_dir=str(tmp_path))
+    assert {page.url for page in pages} == {site.url} | {f"{site.url}page/{i}" for i in range(PAGES)}
+    assert site.max_in_flight <= 2
+
+
+def test_page_budget(site, tmp_path):
+    pages = crawl(site.url, max_depth=1, max_pages=5, cache_dir=str(tmp_path))
+    assert len(pages) == 5
+    assert len([path for path in site.requests if path != "/robots.txt"]) == 5
+
+
+def test_etag_cache(site, tmp_path):
+    first = crawl(site.url, max_depth=1, cache_dir=str(tmp_path))
+    assert not any(page.from_cache for page in first)
+    second = crawl(site.url, max_depth=1, cache_dir=str(tmp_path))
+    assert all(page.from_cache and page.status == 304 for page in second)
+    assert site.not_modified == PAGES + 1
+    assert {page.url: page.html for page in second} == {page.url: page.html for page in first}
+
+
+def test_not_modified_without_cache_entry(site, tmp_path):
+    crawl(site.url, max_depth=0, cache_dir=str(tmp_path))
+    # Bản cache bị xóa trong lúc request có điều kiện đang chạy: crawler tải lại trang đầy đủ
+    site.on_conditional = lambda: [os.remove(path) for path in glob.glob(str(tmp_path / "*.body"))]
+    pages = crawl(site.url, max_depth=0, cache_dir=str(tmp_path))
+    assert len(pages) == 1
+    assert not pages[0].from_cache and pages[0].status == 200
+    assert "Mục lục" in pages[0].html
+
+
+def test_non_html_links_are_skipped(site, tmp_path):
+    site.files = True
+    pages = crawl(site.url, max_depth=1, cache_dir=str(tmp_path))
+    assert len(pages) == PAGES + 1 and all("html" in page.content_type for page in pages)
+    # Đuôi .pdf: không gửi request; Content-Type application/pdf: tải header rồi bỏ
+    assert "/files/report.PDF" not in site.requests
+    assert "/download?id=1" in site.requests
+
+
+def test_slow_consumer_does_not_time_out(site, tmp_path):
+    pages = []
+    for page in iter_crawl(site.url, max_depth=1, buffer_size=1, timeout=1.0, cache_dir=str(tmp_path)):
+        time.sleep(0.15)  # Bên tiêu thụ chậm hơn timeout của các request đang chạy
+        pages.append(page)
+    assert len(pages) == PAGES + 1
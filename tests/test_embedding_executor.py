@@ -0,0 +1,63 @@
+"""
+Test retry của EmbeddingExecutor với backend qua mạng: chỉ thử lại lỗi tạm thời
+"""
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_executor
+from embedding_executor import INLINE_THRESHOLD, EmbeddingExecutor
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyEmbeddings(Embeddings):
+    """Raise lần lượt các lỗi trong errors rồi trả vector"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(embedding_executor.time, "sleep", lambda _: None)
+
+
+@pytest.mark.parametrize("error", [StatusError(429), StatusError(503), ConnectionError("reset")])
+def test_transient_errors_are_retried(error):
+    embeddings = FlakyEmbeddings([error, error])
+    executor = EmbeddingExecutor(embeddings, backend="openai", model="fake", token_budget=10 ** 6)
+    executor._count_tokens = lambda text: 1
+    assert executor.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+    assert embeddings.calls == 3 and executor.stats["retries"] == 2
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("error", [StatusError(401), StatusError(400), ValueError("bad request")])
+def test_permanent_errors_raise_immediately(error):
+    embeddings = FlakyEmbeddings([error])
+    executor = EmbeddingExecutor(embeddings, backend="openai", model="fake", token_budget=10 ** 6)
+    executor._count_tokens = lambda text: 1
+    with pytest.raises(type(error)):
+        executor.embed_documents(["a"])
+    assert embeddings.calls == 1 and executor.stats["retries"] == 0
+    executor.shutdown()
+
+
+def test_preferred_batch_size_reaches_process_pool():
+    executor = EmbeddingExecutor(FlakyEmbeddings([]), backend="hf", model="fake")
+    assert executor.preferred_batch_size > INLINE_THRESHOLD
@@ -0,0 +1,36 @@
+"""
+Test extractors.py: trang XHTML có khai báo encoding và trích xuất lại bằng 'bs4' khi extractor lỗi
+"""
+
+import pytest
+
+import extractors
+from extractors import ExtractorPool
+
+XHTML = (
+    '<?xml version="1.0" encoding="iso-8859-1"?>\n'
+    '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" lang="vi"><head><title>Tích phân</title></head>'
+    '<body><nav>Trang chủ</nav><p>Tích phân suy rộng loại một có cận vô hạn</p></body></html>'
+)
+
+
+@pytest.mark.parametrize("name", ["lxml", "bs4-main", "bs4"])
+def test_xhtml_with_encoding_declaration(name):
+    if name == "lxml":
+        pytest.importorskip("lxml")
+    pool = ExtractorPool(name, workers=0)
+    [(page, text, metadata)] = list(pool.map([XHTML], html_of=lambda page: page))
+    assert "Tích phân suy rộng loại một có cận vô hạn" in text
+    assert metadata["title"] == "Tích phân"
+
+
+def test_inline_extraction_falls_back_to_bs4(monkeypatch):
+    def broken(html):
+        raise ValueError("Unicode strings with encoding declaration are not supported")
+
+    monkeypatch.setitem(extractors.EXTRACTORS, "broken", broken)
+    pool = ExtractorPool("broken", workers=0)
+    results = list(pool.map([XHTML, "<p>Trang thứ hai</p>"], html_of=lambda page: page))
+    assert [text for _, text, _ in results][1] == "Trang thứ hai"
+    assert "Tích phân suy rộng" in results[0][1]
@@ -0,0 +1,69 @@
+"""
+Test hàng đợi job trong jobs.py: nhận lại job của worker đã chết, giới hạn số lần chạy và lời nhắc khi hủy
+"""
+
+import time
+
+import pytest
+
+import jobs
+from jobs import Job, JobStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_S", 0.01)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_stale_job_requeued_until_max_attempts(store):
+    job_id = store.submit("file", "docs", filename="a.json", directory="data")
+    for attempt in (1, 2):
+        job = store.claim("w")
+        assert job.id == job_id and job.attempts == attempt
+        time.sleep(0.05)  # worker chết: không còn heartbeat
+    assert store.claim("w") is None
+    job = store.get(job_id)
+    assert job.status == "failed" and job.attempts == 2
+    assert "2 lần" in job.error and job.finished_at is not None
+
+
+def test_stale_cancel_requested_job_is_cancelled(store):
+    job_id = store.submit("live", "docs", URL="http://example.com")
+    store.claim("w")
+    store.cancel(job_id)
+    time.sleep(0.05)
+    assert store.claim("w") is None
+    assert store.get(job_id).status == "cancelled"
+
+
+def test_list_jobs_active_only(store):
+    done_id = store.submit("file", "a")
+    store.cancel(done_id)
+    queued_id = store.submit("file", "b")
+    assert [job.id for job in store.list_jobs(active_only=True)] == [queued_id]
+    assert {job.id for job in store.list_jobs()} == {done_id, queued_id}
+
+
+def test_cancel_note_only_for_non_incremental_jobs():
+    def job(kind, **params):
+        return Job(id="x", kind=kind, collection="docs", params=params, status="running")
+
+    assert jobs._cancel_note(job("file", incremental=True)) is None
+    assert "gửi lại job để seed đầy đủ" in jobs._cancel_note(job("file"))
+    assert "checkpoint" in jobs._cancel_note(job("live", incremental=False))
+
+
+def test_refresh_finished_includes_jobs_stopped_midway(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(jobs.registry, "invalidate", invalidated.append)
+
+    def job(job_id, status, started_at):
+        return Job(id=job_id, kind="file", collection=job_id, params={}, status=status, started_at=started_at)
+
+    refreshed = jobs.refresh_finished([
+        job("ok", "succeeded", 1.0), job("cancelled", "cancelled", 1.0), job("failed", "failed", 1.0),
+        job("never-ran", "cancelled", None), job("running", "running", 1.0),
+    ])
+    assert refreshed == invalidated == ["ok", "cancelled", "failed"]
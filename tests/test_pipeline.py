@@ -0,0 +1,117 @@
+"""
+Test pipeline.run_live_pipeline với crawler giả: kết quả dedup không phụ thuộc thứ tự crawler trả trang
+"""
+
+import hashlib
+import random
+
+import pytest
+from langchain_core.documents import Document
+
+import pipeline
+from dedup import IngestDeduplicator
+from pipeline import PipelineCheckpoint, run_live_pipeline
+
+NAV = "Trang chủ\nTài liệu\nBảng giá\n© 2024 Stack AI"
+
+
+class FakePage:
+    def __init__(self, url: str, text: str):
+        self.url = url
+        self.text = text
+
+
+class FakeVectorStore:
+    """Vector store giả: chỉ lưu ID và văn bản"""
+
+    def __init__(self):
+        self.texts = {}
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        self.texts.update(zip(ids, texts))
+
+    def delete(self, ids=None, **kwargs):
+        for doc_id in ids:
+            self.texts.pop(doc_id, None)
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+
+def site_pages() -> list:
+    pages = []
+    for i in range(20):
+        body = " ".join(f"chủ đề {i} đoạn {j} nội dung riêng của trang số {i}" for j in range(30))
+        pages.append(FakePage(f"https://example.com/docs/{i:02d}", f"{NAV}\n{body}"))
+    # Bản in của 5 trang đầu: gần trùng với trang gốc, URL lớn hơn
+    for page in pages[:5]:
+        pages.append(FakePage(page.url.replace("/docs/", "/print/"), page.text + "\nIn trang này"))
+    return pages
+
+
+def document_id(chunk: Document) -> str:
+    key = f"{chunk.metadata['source']}|{chunk.metadata.get('start_index', 0)}|{chunk.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+@pytest.fixture
+def fake_crawl(monkeypatch):
+    order = {}
+
+    def iter_crawl(url, **kwargs):
+        yield from order["pages"]
+
+    def iter_documents(pages, extractor=None):
+        for page in pages:
+            yield Document(page_content=page.text, metadata={"source": page.url})
+
+    monkeypatch.setattr(pipeline, "iter_crawl", iter_crawl)
+    monkeypatch.setattr(pipeline, "iter_documents", iter_documents)
+    return order
+
+
+def run(vectorstore, checkpoint, existing_ids=None):
+    return run_live_pipeline(
+        "https://example.com/", vectorstore, FakeEmbeddings(), checkpoint, id_fn=document_id,
+        metadata_fn=lambda metadata: metadata, existing_ids=existing_ids, delete_stale=existing_ids is not None,
+        dedup=True, chunk_size=400, chunk_overlap=0
+    )
+
+
+def test_recrawl_in_different_order_keeps_same_chunks(fake_crawl, tmp_path):
+    pages = site_pages()
+    results = []
+    for seed in (1, 2):
+        shuffled = pages[:]
+        random.Random(seed).shuffle(shuffled)
+        fake_crawl["pages"] = shuffled
+        vectorstore = FakeVectorStore()
+        run(vectorstore, PipelineCheckpoint(f"order{seed}", "https://example.com/", str(tmp_path)))
+        results.append(vectorstore.texts)
+    assert results[0] == results[1]
+    assert not any("/print/" in text for text in results[0].values())
+    assert not any("Bảng giá" in text for text in results[0].values())
+
+    # Crawl incremental theo thứ tự khác: không xóa, không thêm chunk nào
+    vectorstore = FakeVectorStore()
+    vectorstore.texts = dict(results[0])
+    fake_crawl["pages"] = list(reversed(pages))
+    checkpoint = PipelineCheckpoint("order1", "https://example.com/", str(tmp_path))
+    progress = run(vectorstore, checkpoint, existing_ids=set(results[0]))
+    assert vectorstore.texts == results[0]
+    assert progress.chunks_inserted == 0 and progress.chunks_deleted == 0
+
+
+def test_boilerplate_sample_uses_smallest_urls():
+    pages = [Document(page_content=f"{NAV}\nNội dung {i}", metadata={"source": f"https://example.com/{i:02d}"})
+             for i in range(10)]
+    for seed in (1, 2):
+        shuffled = pages[:]
+        random.Random(seed).shuffle(shuffled)
+        deduplicator = IngestDeduplicator(sample_pages=4)
+        cleaned = list(deduplicator.clean_pages(shuffled))
+        assert [doc.metadata["source"] for doc in cleaned] == [doc.metadata["source"] for doc in shuffled]
+        assert deduplicator.boilerplate.pages == 4
+        assert all(doc.page_content.startswith("Nội dung") for doc in cleaned)